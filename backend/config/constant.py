@@ -1,4 +1,5 @@
 from dotenv import load_dotenv
+import json
 import os
 
 load_dotenv()
@@ -14,6 +15,26 @@ ACCESS_URL = "https://nulab-exam.backlog.jp/api/v2/users/myself"
 
 # Database
 DATABASE_URL = os.environ.get('DATABASE_URL')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE_SECONDS = int(os.environ.get('DB_POOL_RECYCLE_SECONDS', 3600))
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get('DB_POOL_TIMEOUT_SECONDS', 30))
+# DATABASE_URLのドライバーに対応する、非同期のドライバーと同期のドライバー
+DATABASE_ASYNC_DRIVER_NAMES = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'mysql+mysqldb': 'mysql+aiomysql',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+DATABASE_SYNC_DRIVER_NAMES = {
+    'sqlite+aiosqlite': 'sqlite',
+    'mysql+aiomysql': 'mysql+pymysql',
+    'mysql+asyncmy': 'mysql+pymysql',
+    'postgresql+asyncpg': 'postgresql+psycopg2',
+}
 
 # Openai
 OPENAI_KEY = os.environ.get('OPENAI_KEY')
@@ -24,7 +45,45 @@ COMPLETION_MODEL_TOP_P = 0.95
 COMPLETION_MODEL_FREQUENCY_PENALTY = 0
 COMPLETION_MODEL_PRESENCE_PENALTY = 0
 COMPLETION_MODEL_N = 1
-TIKTOKEN_MODEL_NAME = 'gpt-3.5-turbo'
+COMPLETION_FALLBACK_MODEL_NAME = os.environ.get('COMPLETION_FALLBACK_MODEL_NAME', 'gpt-3.5-turbo-0125')
+# モデルのルーティングのルール（JSONのリスト）。上から順に、指定された条件をすべて満たす最初のルールのモデルを使用し、
+# 満たすルールがない場合はCOMPLETION_MODEL_NAMEを使用する。
+# 条件: max_prompt_tokens（見積もったプロンプトのトークン数の上限）、languages（検出した言語）、hints（リクエストのmodel_hint）、
+#       max_top_score（最も近いチャンクの距離の上限）、min_score_spread（検索結果の距離の最大と最小の差の下限）
+# 例: [{"model": "gpt-3.5-turbo-0125", "max_prompt_tokens": 2000, "max_top_score": 0.3}]
+COMPLETION_ROUTING_RULES = json.loads(os.environ.get('COMPLETION_ROUTING_RULES', '[]'))
+COMPLETION_STREAM_INCLUDE_USAGE = os.environ.get('COMPLETION_STREAM_INCLUDE_USAGE', 'true').lower() == 'true'
+TIKTOKEN_MODEL_NAME = os.environ.get('TIKTOKEN_MODEL_NAME', COMPLETION_MODEL_NAME)
+TIKTOKEN_DEFAULT_ENCODING_NAME = 'cl100k_base'
+# チャット形式のメッセージ1件ごと、nameフィールドごと、回答の開始ごとに加算されるトークン数
+TIKTOKEN_TOKENS_PER_MESSAGE = 3
+TIKTOKEN_TOKENS_PER_NAME = 1
+TIKTOKEN_TOKENS_PER_REPLY = 3
+HISTORY_SUMMARY_MODEL_NAME = os.environ.get('HISTORY_SUMMARY_MODEL_NAME', 'gpt-3.5-turbo-0125')
+
+# OpenAI HTTP client
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.environ.get('OPENAI_HTTP_MAX_CONNECTIONS', 100))
+OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS', 20))
+OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get('OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS', 30))
+OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS', 5))
+OPENAI_HTTP_TIMEOUT_SECONDS = float(os.environ.get('OPENAI_HTTP_TIMEOUT_SECONDS', 60))
+OPENAI_HTTP2 = os.environ.get('OPENAI_HTTP2', 'true').lower() == 'true'
+
+# OpenAI completion resilience
+COMPLETION_MAX_RETRIES = int(os.environ.get('COMPLETION_MAX_RETRIES', 3))
+COMPLETION_RETRY_BASE_SECONDS = float(os.environ.get('COMPLETION_RETRY_BASE_SECONDS', 0.5))
+COMPLETION_RETRY_MAX_SECONDS = float(os.environ.get('COMPLETION_RETRY_MAX_SECONDS', 8))
+COMPLETION_HEDGE_ENABLED = os.environ.get('COMPLETION_HEDGE_ENABLED', 'false').lower() == 'true'
+COMPLETION_HEDGE_PERCENTILE = float(os.environ.get('COMPLETION_HEDGE_PERCENTILE', 95))
+COMPLETION_HEDGE_MIN_SAMPLES = int(os.environ.get('COMPLETION_HEDGE_MIN_SAMPLES', 20))
+COMPLETION_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get('COMPLETION_HEDGE_MIN_DELAY_SECONDS', 1))
+COMPLETION_LATENCY_SAMPLES = int(os.environ.get('COMPLETION_LATENCY_SAMPLES', 200))
+COMPLETION_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('COMPLETION_CIRCUIT_FAILURE_THRESHOLD', 5))
+COMPLETION_CIRCUIT_RESET_SECONDS = float(os.environ.get('COMPLETION_CIRCUIT_RESET_SECONDS', 30))
+COMPLETION_REQUESTS_PER_MINUTE = int(os.environ.get('COMPLETION_REQUESTS_PER_MINUTE', 500))
+COMPLETION_TOKENS_PER_MINUTE = int(os.environ.get('COMPLETION_TOKENS_PER_MINUTE', 300000))
+# レートリミッターで使用する、プロンプトのトークン数を文字数から見積もるための1トークンあたりの文字数
+COMPLETION_ESTIMATED_CHARS_PER_TOKEN = float(os.environ.get('COMPLETION_ESTIMATED_CHARS_PER_TOKEN', 2))
 
 # Openai messages
 ERR_MSG_OPEN_AI_API_ERROR = 'APIError: Issue on OpenAI side.'
@@ -32,6 +91,7 @@ ERR_MSG_OPEN_AI_TIMEOUT = 'Timeout: Request timed out.'
 ERR_MSG_OPEN_AI_RATE_LIMIT_ERROR = 'RateLimitError: You have hit your assigned rate limit.'
 ERR_MSG_OPEN_AI_API_CONNECTION_ERROR = 'APIConnectionError: Issue connecting to OpenAI services.'
 ERR_MSG_OPEN_AI_OTHERS_ERROR = 'Open AI Error: Issue on OpenAI servers.'
+ERR_MSG_OPEN_AI_CIRCUIT_OPEN = 'CircuitOpen: Requests to OpenAI are paused after repeated failures.'
 ERR_MSG_CONTENT_FILTER = 'FINISH REASON: content_filter:: The content filtering detects specific categories of potentially harmful.'
 ERR_MSG_TOKEN_LENGTH = 'FINISH REASON:: length: Incomplete model output due to limit of chat\'s length.'
 ERR_MSG_CONTENT_NULL = 'FINISH REASON: null: Response of N-CHAT still in progress or incomplete.'
@@ -48,6 +108,10 @@ DISP_MSG_OVER_CHAT_LIMIT = 'This chat is too long history. Plese create a new ch
 # Openai Model Unit Cost
 INPUT_UNIT_COST = 0.00001
 OUTPUT_UNIT_COST = 0.00003
+# モデルごとの1トークンあたりの入力・出力のコスト（記載のないモデルはINPUT_UNIT_COST / OUTPUT_UNIT_COST）
+MODEL_UNIT_COSTS = {
+    'gpt-3.5-turbo-0125': (0.0000005, 0.0000015),
+}
 
 # logger
 LOGGER_NAME = 'BacklogGenAIChat'
@@ -61,15 +125,142 @@ LOGGER_3_MONTHS = 90
 
 # embedding
 EMBEDDING_FOLDER_NAME = 'embeddings'
+EMBEDDING_INDEX_FILE_EXTENSIONS = ('.faiss', '.pkl')
+EMBEDDING_VERSION_FILE_NAME = '.version'
+EMBEDDING_VERSION_CHECK_SECONDS = 5
+EMBEDDING_DELETED_IDS_FILE_NAME = '.deleted_ids.json'
+# 削除済みのベクトルのIDの一覧を、ワーカープロセス間で排他して更新するためのロックファイル
+EMBEDDING_DELETED_IDS_LOCK_FILE_NAME = '.deleted_ids.lock'
+
+# embedding store format ('faiss' or 'mmap')
+# mmap（既定）はベクトルとドキュメントを読み取り専用でメモリマップし、同じファイルを開いたワーカープロセス間で物理ページを共有する。
+# faissはインデックスファイルをワーカープロセスごとにデシリアライズするため、ワーカープロセスの数だけメモリを使用する。
+# 近似最近傍（IVF / HNSW）のインデックスは、どちらの形式でもワーカープロセスごとにメモリに読み込む（FAISSがメモリマップに対応していないため）
+EMBEDDING_STORE_FORMAT = os.environ.get('EMBEDDING_STORE_FORMAT', 'mmap')
+EMBEDDING_STORE_FORMAT_FAISS = 'faiss'
+EMBEDDING_STORE_FORMAT_MMAP = 'mmap'
+MMAP_STORE_EXTENSION = '.mmap'
+MMAP_VECTORS_FILE_NAME = 'vectors.npy'
+MMAP_DOCUMENTS_FILE_NAME = 'documents.bin'
+MMAP_OFFSETS_FILE_NAME = 'offsets.npy'
+MMAP_META_FILE_NAME = 'meta.json'
+MMAP_INDEX_FILE_NAME = 'index.faiss'
+
+# embedding index type ('flat', 'ivf' or 'hnsw')
+EMBEDDING_INDEX_TYPE = os.environ.get('EMBEDDING_INDEX_TYPE', 'flat')
+EMBEDDING_INDEX_TYPE_FLAT = 'flat'
+EMBEDDING_INDEX_TYPE_IVF = 'ivf'
+EMBEDDING_INDEX_TYPE_HNSW = 'hnsw'
+EMBEDDING_ANN_MIN_VECTORS = int(os.environ.get('EMBEDDING_ANN_MIN_VECTORS', 10000))
+EMBEDDING_IVF_NLIST = int(os.environ.get('EMBEDDING_IVF_NLIST', 0))
+EMBEDDING_IVF_MIN_POINTS_PER_CENTROID = 39
+EMBEDDING_IVF_NPROBE = int(os.environ.get('EMBEDDING_IVF_NPROBE', 16))
+EMBEDDING_HNSW_M = int(os.environ.get('EMBEDDING_HNSW_M', 32))
+EMBEDDING_HNSW_EF_CONSTRUCTION = int(os.environ.get('EMBEDDING_HNSW_EF_CONSTRUCTION', 200))
+EMBEDDING_HNSW_EF_SEARCH = int(os.environ.get('EMBEDDING_HNSW_EF_SEARCH', 128))
+
+# embedding search
+EMBEDDING_SEARCH_MODE = os.environ.get('EMBEDDING_SEARCH_MODE', 'merged')
+EMBEDDING_SEARCH_MODE_SHARDED = 'sharded'
+EMBEDDING_SEARCH_THREADS = int(os.environ.get('EMBEDDING_SEARCH_THREADS', 0))
+
+# embedding cache
+EMBEDDING_CACHE_QUERY_BATCH_SIZE = 500
+
+# embedding vector (Datastore.Id mapping)
+EMBEDDING_VECTOR_QUERY_BATCH_SIZE = 500
+
+# embedding pipeline
+EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get('EMBEDDING_BATCH_MAX_TOKENS', 100000))
+EMBEDDING_BATCH_MAX_TEXTS = int(os.environ.get('EMBEDDING_BATCH_MAX_TEXTS', 1000))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get('EMBEDDING_MAX_CONCURRENCY', 4))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.environ.get('EMBEDDING_REQUESTS_PER_MINUTE', 3000))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.environ.get('EMBEDDING_TOKENS_PER_MINUTE', 1000000))
+
+# query embedding cache
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_EMBEDDING_CACHE_MAX_ENTRIES', 10000))
+
+# conversation history
+HISTORY_MAX_TOKENS = int(os.environ.get('HISTORY_MAX_TOKENS', 2000))
+HISTORY_RECENT_TURNS = int(os.environ.get('HISTORY_RECENT_TURNS', 3))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.environ.get('HISTORY_SUMMARY_MAX_TOKENS', 500))
+
+# database connection pool metrics
+DB_POOL_CHECKOUT_SAMPLES = int(os.environ.get('DB_POOL_CHECKOUT_SAMPLES', 1000))
+DB_POOL_CHECKOUT_WARNING_SECONDS = float(os.environ.get('DB_POOL_CHECKOUT_WARNING_SECONDS', 5))
+
+# context packing
+CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', 3000))
+CONTEXT_MIN_OVERLAP_CHARS = int(os.environ.get('CONTEXT_MIN_OVERLAP_CHARS', 20))
+
+# answer cache
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 1000))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', 3600))
+# 意味的一致のコサイン距離のしきい値（0の場合は完全一致のみ）。否定や固有名詞だけが異なる短い質問も
+# コサイン類似度が0.95を超えることがあり、別の質問の回答を返してしまうため、既定では無効にする
+ANSWER_CACHE_SEMANTIC_DISTANCE = float(os.environ.get('ANSWER_CACHE_SEMANTIC_DISTANCE', 0))
+
+# embedding compaction
+EMBEDDING_COMPACTION_FOLDER_NAME = '.compaction'
+EMBEDDING_COMPACTION_SHARD_THRESHOLD = int(os.environ.get('EMBEDDING_COMPACTION_SHARD_THRESHOLD', 64))
+EMBEDDING_COMPACTION_DELETED_IDS_THRESHOLD = int(os.environ.get('EMBEDDING_COMPACTION_DELETED_IDS_THRESHOLD', 1000))
+EMBEDDING_COMPACTION_MAX_SHARD_BYTES = int(os.environ.get('EMBEDDING_COMPACTION_MAX_SHARD_BYTES', 512 * 1024 * 1024))
+
+# document chunking
+# チャンクの分割方法: 'recursive'（区切り文字で再帰的に分割、長さはトークン数）、'token'（トークン数で分割）、'character'（区切り文字で再帰的に分割、長さは文字数）
+DOCUMENT_CHUNK_SPLITTER = os.environ.get('DOCUMENT_CHUNK_SPLITTER', 'recursive')
+DOCUMENT_CHUNK_SPLITTER_RECURSIVE = 'recursive'
+DOCUMENT_CHUNK_SPLITTER_TOKEN = 'token'
+DOCUMENT_CHUNK_SPLITTER_CHARACTER = 'character'
+DOCUMENT_CHUNK_SIZE = int(os.environ.get('DOCUMENT_CHUNK_SIZE', 256))
+DOCUMENT_CHUNK_OVERLAP = int(os.environ.get('DOCUMENT_CHUNK_OVERLAP', 32))
+# トークン数の計算に使用するエンコーディング（既定値は既存のチャンクの区切りを変えないよう、from_tiktoken_encoderの既定値と同じ）
+DOCUMENT_CHUNK_ENCODING_NAME = os.environ.get('DOCUMENT_CHUNK_ENCODING_NAME', 'gpt2')
+# Categoryごとの分割の設定（JSONのオブジェクト）。指定されていない項目は上記の既定値を使用する。
+# 項目: splitter、chunk_size、chunk_overlap、encoding_name
+# 例: {"FAQ": {"chunk_size": 128, "chunk_overlap": 16}, "Manual": {"splitter": "token", "chunk_size": 512}}
+DOCUMENT_CHUNK_CATEGORY_SETTINGS = json.loads(os.environ.get('DOCUMENT_CHUNK_CATEGORY_SETTINGS', '{}'))
+# 分割を実行するプロセス数（0の場合はCPUコア数、1の場合はプロセスプールを使用しない）と、1つのタスクで分割するドキュメント数
+DOCUMENT_CHUNK_WORKERS = int(os.environ.get('DOCUMENT_CHUNK_WORKERS', 0))
+DOCUMENT_CHUNK_TASK_DOCUMENTS = int(os.environ.get('DOCUMENT_CHUNK_TASK_DOCUMENTS', 32))
+
+# embedding job
+EMBEDDING_JOB_BATCH_ROWS = int(os.environ.get('EMBEDDING_JOB_BATCH_ROWS', 200))
+# 常駐しているベクトルストアにジョブの結果を反映する間隔（バッチ数）。反映のたびにコンパクションの要否も確認する
+EMBEDDING_JOB_REFRESH_BATCHES = int(os.environ.get('EMBEDDING_JOB_REFRESH_BATCHES', 10))
+# 実行中（待機中を含む）のジョブのみに設定する値。一意制約で、実行中のジョブを同時に1つだけに制限する
+EMBEDDING_JOB_ACTIVE_KEY = 1
+# ジョブを実行しているワーカープロセスの占有期間。バッチごとに延長し、期限が切れたジョブは他のワーカープロセスが引き継ぐ
+# （1バッチの処理時間より長くすること）
+EMBEDDING_JOB_LEASE_SECONDS = int(os.environ.get('EMBEDDING_JOB_LEASE_SECONDS', 300))
+# 占有期間が切れたジョブを確認する間隔
+EMBEDDING_JOB_WATCH_SECONDS = int(os.environ.get('EMBEDDING_JOB_WATCH_SECONDS', 60))
+EMBEDDING_JOB_STATUS_QUEUED = 'queued'
+EMBEDDING_JOB_STATUS_RUNNING = 'running'
+EMBEDDING_JOB_STATUS_COMPLETED = 'completed'
+EMBEDDING_JOB_STATUS_CANCELLED = 'cancelled'
+EMBEDDING_JOB_STATUS_FAILED = 'failed'
+
+# data store upload
+DATA_STORE_UPLOAD_CHUNK_ROWS = int(os.environ.get('DATA_STORE_UPLOAD_CHUNK_ROWS', 1000))
 
 # return messages
-ERROR_MESSAGE_NOT_EXCEL_FILE = "Only Excel files are allowed."
+ERROR_MESSAGE_UNSUPPORTED_FILE_FORMAT = "Only Excel, CSV, JSON Lines and Parquet files are allowed."
 ERROR_MESSAGE_GENERAL = "An error occurred. {reason}"
-ERROR_MESSAGE_PANDAS_PARSER_FAIL = "Pandas parser error. {reason}"
+ERROR_MESSAGE_FILE_PARSER_FAIL = "File parser error. {reason}"
+ERROR_MESSAGE_UPLOAD_MISSING_COLUMNS = "Missing columns: {columns}."
+ERROR_MESSAGE_UPLOAD_EMPTY_VALUE = "Column {column} at row {row} can not be empty."
+ERROR_MESSAGE_UPLOAD_VALUE_TOO_LONG = "Column {column} at row {row} exceeds {max_length} characters."
 ERROR_MESSAGE_ZERO_CHUNKS = "Chunk size can not be zero."
+ERROR_MESSAGE_UNSUPPORTED_CHUNK_SPLITTER = "Unsupported chunk splitter: {splitter}"
 ERROR_MESSAGE_DATABASE_EXCEPTION = "Database exception occurred. {reason}"
 ERROR_MESSAGE_FAISS_EMBEDDING_SAVE_EXCEPTION = "Error on saving embedding file using FAISS. {reason}"
 ERROR_MESSAGE_FAISS_VECTORSTORE_LOAD_EXCEPTION = "Error on loading vectorstore using FAISS. {reason}"
+ERROR_MESSAGE_NO_EMBEDDING_FILES = "No embedding files found."
+ERROR_MESSAGE_FAISS_EMBEDDING_COMPACTION_EXCEPTION = "Error on compacting embedding files using FAISS. {reason}"
+ERROR_MESSAGE_EMBEDDING_COMPACTION_RUNNING = "Embedding compaction is already running."
+ERROR_MESSAGE_EMBEDDING_JOB_RUNNING = "Embedding job is already running."
+ERROR_MESSAGE_EMBEDDING_JOB_NOT_FOUND = "Embedding job with id {id} not found."
 ERROR_MESSAGE_EMPTY_QUERY = "Query can not be empty."
 ERROR_MESSAGE_EMPTY_CHATID = "Chat ID can not be empty."
 ERROR_MESSAGE_CHAT_NOT_FOUND = "Chat with id {id} not found."
@@ -80,11 +271,32 @@ ERROR_INVALID_ACCESS_TOKEN = "The access token is invalid"
 ERROR_EXPIRED_ACCESS_TOKEN = "The access token expired"
 SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDING = "No new data for embedding."
 SUCCESS_MESSAGE_FILE_UPLOAD = "File uploaded successfully."
+SUCCESS_MESSAGE_FILE_UPLOAD_CHUNK = "Processed {rows} rows."
 SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION = "Embedding files are successfully created."
+SUCCESS_MESSAGE_EMBEDDING_JOB_SUBMITTED = "Embedding job is submitted."
+SUCCESS_MESSAGE_EMBEDDING_JOB_CANCEL_REQUESTED = "Embedding job cancellation is requested."
+SUCCESS_MESSAGE_EMBEDDING_FILES_COMPACTION = "Embedding files are successfully compacted."
+SUCCESS_MESSAGE_NO_EMBEDDING_FILES_FOR_COMPACTION = "No embedding files to compact."
+SUCCESS_MESSAGE_EMBEDDING_INDEX_BUILD = "Embedding index is successfully built."
 
 # log messages
 LOG_MESSAGE_EMBEDDING_FOLDER_EXIST = "Embedding folder path exists."
 LOG_MESSAGE_EMBEDDING_FOLDER_CREATED = "Embedding folder created."
+LOG_MESSAGE_FILE_UPLOAD_CHUNK_SAVED = "Upload chunk saved. rows: {rows}, inserted: {inserted}, updated: {updated}, unchanged: {unchanged}, total_rows: {total_rows}"
+LOG_MESSAGE_EMBEDDING_JOB_BATCH = "Embedding job batch processed. job_id: {job_id}, rows: {rows}, chunks: {chunks}, tokens: {tokens}, processed_rows: {processed_rows}, total_rows: {total_rows}"
+LOG_MESSAGE_EMBEDDING_JOB_FINISHED = "Embedding job finished. job_id: {job_id}, status: {status}"
+LOG_MESSAGE_VECTOR_STORE_LOADED = "Vector store loaded. version: {version}"
+LOG_MESSAGE_VECTOR_STORE_UPDATED = "Vector store updated. version: {version}, stores added: {added}, vectors filtered: {filtered}"
+LOG_MESSAGE_EMBEDDING_PIPELINE = "Embedding pipeline finished. texts: {texts}, tokens: {tokens}, batches: {batches}, seconds: {seconds}"
+LOG_MESSAGE_HISTORY_SUMMARY_UPDATED = "Chat summary updated. chat id: {chat_id}, summarized messages: {summarized_messages}"
+LOG_MESSAGE_DB_CONNECTION_HELD = "Database connection was held for {seconds} seconds."
+LOG_MESSAGE_CONTEXT_PACKED = "Context packed. chunks: {chunks}, passages: {passages}, tokens: {tokens}"
+LOG_MESSAGE_COMPLETION_RETRY = "Completion retry. attempt: {attempt}, wait seconds: {wait_seconds}, reason: {reason}"
+LOG_MESSAGE_COMPLETION_FALLBACK = "Completion fallback. model: {model} -> {fallback_model}, reason: {reason}"
+LOG_MESSAGE_COMPLETION_HEDGED = "Completion hedged. delay seconds: {delay_seconds}"
+LOG_MESSAGE_ANSWER_CACHE_HIT = "Answer cache hit. match: {match}"
+LOG_MESSAGE_EMBEDDING_CACHE = "Embedding cache: hits: {hits}, misses: {misses}, hit rate: {hit_rate}"
+LOG_MESSAGE_EMBEDDING_COMPACTION = "Embedding compaction finished. shards: {shards_before} -> {shards_after}, bytes reclaimed: {bytes_reclaimed}, vectors purged: {vectors_purged}, load seconds: {load_seconds}"
 
 # message type
 USER_MESSAGE_TYPE = 'user'
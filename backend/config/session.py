@@ -1,16 +1,31 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from config import constant
-from typing import Iterator
+from typing import Iterator, AsyncIterator
 from sqlalchemy.orm import Session
 import sqlalchemy
+from utils.database import get_async_database_url, get_sync_database_url, get_engine_options
+from utils.db_pool_metrics import instrument_pool
 
-SQLALCHEMY_DATABASE_URL = constant.DATABASE_URL
+# DATABASE_URLから、同期のドライバーのURLと非同期のドライバーのURLを作成する
+SQLALCHEMY_DATABASE_URL = get_sync_database_url(constant.DATABASE_URL)
+ASYNC_SQLALCHEMY_DATABASE_URL = get_async_database_url(constant.DATABASE_URL)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+# エンベディングの作成など、スレッドで実行するバッチ処理で使用する同期のエンジン
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# APIのリクエストの処理で使用する非同期のエンジン（コミット後に属性を読み直さないよう、expire_on_commitは無効にする）
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **get_engine_options(ASYNC_SQLALCHEMY_DATABASE_URL))
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# 接続の貸し出し時間を/metricsで確認できるよう、接続プールを計測する
+instrument_pool(engine)
+instrument_pool(async_engine.sync_engine)
+
 def get_db() -> Iterator[Session]:
     """
     データベースセッションを取得する
@@ -30,6 +45,21 @@ def get_db() -> Iterator[Session]:
         db.close()
         db.close()
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    非同期のデータベースセッションを取得する
+
+    この機能はパラメータを受け取りません
+
+    Yields:
+        db (sqlalchemy.ext.asyncio.AsyncSession): 非同期のデータベースセッション
+
+    Returns:
+        なし
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def get_engine() -> sqlalchemy.engine.Engine:
     """
     データベース接続に使用するエンジンオブジェクトを返す機能
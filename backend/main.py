@@ -7,15 +7,41 @@ from routers.chat_router import router as chat_router
 from routers.message_router import router as message_router
 from routers.feedback_router import router as feedback_router
 from routers.login_router import router as login_router
-from config.session import get_engine
+from routers.metrics_router import router as metrics_router
+from config.session import get_engine, SessionLocal
 from sqlalchemy.ext.declarative import declarative_base
 from config.logger import init_logger
+from models import embedding_cache, embedding_vector, embedding_job
+from services.vector_store_service import init_vector_store
+from services.embedding_job_service import resume_embedding_jobs, shutdown_embedding_jobs
+from services.document_chunking_service import shutdown_chunking_executor
+from utils.http_clients import get_http_client, get_async_http_client, close_http_clients
+from contextlib import asynccontextmanager
 
 # ログの設定
 init_logger()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    アプリケーションの起動時と終了時の処理を行う
+
+    起動時にベクトルストアをメモリに読み込み、以降のクエリはメモリ上のベクトルストアを使用する。
+    OpenAI API用のHTTPクライアントは起動時に作成してすべてのリクエストで共有し、終了時に閉じる。
+    中断された埋め込みの作成ジョブは起動時に再開し、終了時は実行中のバッチの完了後に中断する。
+    ドキュメントの分割に使用するプロセスプールは、終了時に停止する。
+    """
+    get_http_client()
+    get_async_http_client()
+    init_vector_store()
+    resume_embedding_jobs(SessionLocal)
+    yield
+    shutdown_embedding_jobs()
+    shutdown_chunking_executor()
+    await close_http_clients()
+
 # FastAPI インスタンスの作成
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORSの設定
 app.add_middleware(
@@ -34,7 +60,11 @@ app.include_router(chat_router)
 app.include_router(message_router)
 app.include_router(feedback_router)
 app.include_router(login_router)
+app.include_router(metrics_router)
 
 # データベーステーブルの作成
 Base = declarative_base()
-Base.metadata.create_all(bind=get_engine())
\ No newline at end of file
+Base.metadata.create_all(bind=get_engine())
+embedding_cache.Base.metadata.create_all(bind=get_engine())
+embedding_vector.Base.metadata.create_all(bind=get_engine())
+embedding_job.Base.metadata.create_all(bind=get_engine())
\ No newline at end of file
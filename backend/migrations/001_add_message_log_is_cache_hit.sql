@@ -0,0 +1,4 @@
+-- 既存のデータベースに、回答キャッシュのヒットを記録する列を追加します（MySQL）。
+-- Base.metadata.create_allは既存のテーブルを変更しないため、アップデート前に一度だけ実行します。
+ALTER TABLE MessageLog ADD COLUMN IsCacheHit TINYINT(1) DEFAULT 0 AFTER HasError;
+UPDATE MessageLog SET IsCacheHit = 0 WHERE IsCacheHit IS NULL;
@@ -0,0 +1,5 @@
+-- 既存のデータベースに、会話履歴の要約と、要約済みの最後のメッセージのIDを記録する列を追加します（MySQL）。
+-- 既存のチャットは要約なし（SummarizedMessageId = 0）として扱います。
+ALTER TABLE Chat ADD COLUMN Summary TEXT AFTER User;
+ALTER TABLE Chat ADD COLUMN SummarizedMessageId INT DEFAULT 0 AFTER Summary;
+UPDATE Chat SET SummarizedMessageId = 0 WHERE SummarizedMessageId IS NULL;
@@ -0,0 +1,3 @@
+-- 既存のデータベースに、同じクエリの同時実行をまとめた回答を記録する列を追加します（MySQL）。
+ALTER TABLE MessageLog ADD COLUMN IsCoalesced TINYINT(1) DEFAULT 0 AFTER IsCacheHit;
+UPDATE MessageLog SET IsCoalesced = 0 WHERE IsCoalesced IS NULL;
@@ -0,0 +1,6 @@
+-- 既存のデータベースに、アップロード時のアップサートで使用する列を追加します（MySQL）。
+-- 実行後、一意インデックスを作成する前に、既存の行のRowKeyとContentHashを設定します:
+--   python -m scripts.backfill_datastore_row_keys
+-- ハッシュ値はアップロード時と同じ計算（JSON配列のSHA-256）にする必要があるため、SQLではなくスクリプトで設定します。
+ALTER TABLE Datastore ADD COLUMN RowKey VARCHAR(64);
+ALTER TABLE Datastore ADD COLUMN ContentHash VARCHAR(64);
@@ -0,0 +1,2 @@
+-- scripts.backfill_datastore_row_keys で既存の行のRowKeyを設定した後に、RowKeyの一意インデックスを作成します（MySQL）。
+CREATE UNIQUE INDEX UX_Datastore_RowKey ON Datastore (RowKey);
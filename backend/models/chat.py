@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -9,4 +9,6 @@ class Chat(Base):
 
     Id = Column(Integer, primary_key=True, autoincrement=True)
     User = Column(String(255))
+    Summary = Column(Text)
+    SummarizedMessageId = Column(Integer, default=0)
     CreateDate = Column(DateTime, default=datetime.now)
\ No newline at end of file
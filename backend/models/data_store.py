@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean
+from sqlalchemy import Column, Integer, String, Text, Boolean, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 class Datastore(Base):
     __tablename__ = "Datastore"
+    __table_args__ = (UniqueConstraint("RowKey", name="UX_Datastore_RowKey"),)
 
     Id = Column(Integer, primary_key=True, autoincrement=True)
     Keywords = Column(String(255))
@@ -13,3 +14,5 @@ class Datastore(Base):
     Content = Column(Text)
     Category = Column(String(255))
     IsUserForEmbedding = Column(Boolean, default=False)
+    RowKey = Column(String(64))
+    ContentHash = Column(String(64))
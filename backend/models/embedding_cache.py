@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+class EmbeddingCache(Base):
+    __tablename__ = "EmbeddingCache"
+    __table_args__ = (UniqueConstraint("ModelName", "TextHash", name="UX_EmbeddingCache_ModelName_TextHash"),)
+
+    Id = Column(Integer, primary_key=True, autoincrement=True)
+    ModelName = Column(String(255))
+    TextHash = Column(String(64))
+    Vector = Column(LargeBinary)
+    CreateDate = Column(DateTime, default=datetime.now)
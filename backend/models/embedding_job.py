@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Text, Boolean, Float, DateTime, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+class EmbeddingJob(Base):
+    __tablename__ = "EmbeddingJob"
+    __table_args__ = (UniqueConstraint("ActiveKey", name="UX_EmbeddingJob_ActiveKey"),)
+
+    Id = Column(String(36), primary_key=True)
+    Status = Column(String(20), index=True)
+    CancelRequested = Column(Boolean, default=False)
+    ActiveKey = Column(Integer)
+    Owner = Column(String(128))
+    HeartbeatAt = Column(DateTime)
+    TotalRows = Column(Integer, default=0)
+    ProcessedRows = Column(Integer, default=0)
+    ProcessedChunks = Column(Integer, default=0)
+    ProcessedTokens = Column(Integer, default=0)
+    CacheHits = Column(Integer, default=0)
+    CacheMisses = Column(Integer, default=0)
+    DeletedRows = Column(Integer, default=0)
+    RemovedVectors = Column(Integer, default=0)
+    ElapsedSeconds = Column(Float, default=0)
+    LastDatastoreId = Column(Integer, default=0)
+    PendingIndexName = Column(String(64))
+    Error = Column(Text)
+    CreateDate = Column(DateTime, default=datetime.now)
+    UpdateDate = Column(DateTime, default=datetime.now)
+    EndDate = Column(DateTime)
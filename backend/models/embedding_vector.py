@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+class EmbeddingVector(Base):
+    __tablename__ = "EmbeddingVector"
+
+    Id = Column(Integer, primary_key=True, autoincrement=True)
+    DatastoreId = Column(Integer, index=True)
+    EmbeddingId = Column(String(36), unique=True)
+    CreateDate = Column(DateTime, default=datetime.now)
@@ -16,4 +16,6 @@ class MessageLog(Base):
     TotalCost = Column(DECIMAL(10, 5))
     ResponseTime = Column(DECIMAL(10, 5))
     HasError = Column(Boolean)
+    IsCacheHit = Column(Boolean, default=False)
+    IsCoalesced = Column(Boolean, default=False)
     CreateDate = Column(DateTime, default=datetime.now)
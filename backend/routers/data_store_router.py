@@ -1,22 +1,35 @@
-from fastapi import APIRouter, UploadFile, File, Depends
-from sqlalchemy.orm import Session
-from config.session import get_db
+from fastapi import APIRouter, UploadFile, File, Depends, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.session import get_async_db
 from services import data_store_service
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
 
 @router.post("/upload")
-async def upload_file(file: UploadFile, db: Session = Depends(get_db)) -> JSONResponse:
+async def upload_file(file: UploadFile, response: Response, db: AsyncSession = Depends(get_async_db)) -> JSONResponse:
     """
-    Excelファイルをアップロードし、データベースに保存する
+    Excel / CSV / JSON Lines / Parquetファイルをアップロードし、データベースに保存する
+
+    大きなファイルでも進捗がわかるよう、チャンクを保存するたびに保存した行数をストリームで返します。
 
     パラメータ:
-    - file (UploadFile): アップロードされたExcelファイル
-    - db (sqlalchemy.orm.session.Session): データベースセッション
+    - file (UploadFile): アップロードされたファイル
+    - response (fastapi.Response): HTTPレスポンスオブジェクト
+    - db (sqlalchemy.ext.asyncio.AsyncSession): 非同期のデータベースセッション
 
     戻り値:
-    - JSONResponse: アップロードの成否を示すメッセージ
+    - JSONResponse: 保存した行数の途中経過と、アップロードの成否を示すメッセージのストリーム
     """
+    async def generate():
+        """データストアサービスからJSONレスポンスのストリームを生成する
+
+        Yields:
+            str: データストアサービスからのJSONレスポンス
+        """
+        async for json_response in data_store_service.upload_file(file, db):
+            yield json_response.body.decode("utf-8")
 
-    return data_store_service.upload_file(file, db)
+    response.headers['content-type'] = 'text/event-stream'
+    return StreamingResponse(generate())
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends
-from services import embedding_service
-from config.session import get_db
+from fastapi.concurrency import run_in_threadpool
+from services import compaction_service, embedding_job_service
+from config.session import get_db, SessionLocal
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from config.session import get_db
 
 router = APIRouter()
 
@@ -11,12 +11,81 @@ router = APIRouter()
 async def create_embedding(db: Session = Depends(get_db)) -> JSONResponse:
     """データベースに新しいデータがある場合、埋め込みファイルを生成してファイルシステムに保存する
 
-    この関数は、データベースに新しいデータがある場合、埋め込みファイルを生成してファイルシステムに保存します。
+    この関数は、埋め込みの作成ジョブを登録し、完了するまで待ってから結果を返します。
+    ジョブとして実行するため、/create_embedding_jobで登録したジョブと同時には実行されず、実行中のジョブがある場合は409を返します。
+    インデックスファイル数がしきい値を超えた場合は、ジョブの終了時にコンパクションを実行します。
 
     パラメータ:
         db (sqlalchemy.orm.session.Session): データベースセッション
 
     戻り値:
-        fastapi.responses.JSONResponse: 埋め込みファイルの生成に成功したかどうかを示すメッセージ
+        fastapi.responses.JSONResponse: 埋め込みファイルの生成に成功したかどうかを示すメッセージとジョブの進捗
     """
-    return embedding_service.create_embedding(db)
+    return await run_in_threadpool(embedding_job_service.run_embedding_job_now, db, SessionLocal)
+
+@router.get("/compact_embedding")
+async def compact_embedding() -> JSONResponse:
+    """エンベディングフォルダ内の小さなインデックスファイルを、少数の大きなインデックスファイルにまとめる
+
+    この関数は、インデックスファイルをマージして書き込み、置き換えられた古いファイルを削除します。
+    マージとディスクへの書き込みは、イベントループを止めないようスレッドプールで実行します。
+
+    戻り値:
+        fastapi.responses.JSONResponse: シャード数と削減されたバイト数を含むコンパクションの結果
+    """
+    return await run_in_threadpool(compaction_service.compact_embedding)
+
+@router.get("/build_embedding_index")
+async def build_embedding_index() -> JSONResponse:
+    """コーパス全体のベクトルから、設定された種類（flat / ivf / hnsw）のインデックスを作り直す
+
+    この関数は、すべてのインデックスファイルのベクトルでIVFの学習やHNSWのグラフ構築を行い、1つのインデックスとして書き込みます。
+    IVFの学習やHNSWのグラフ構築はイベントループを止めないよう、スレッドプールで実行します。
+
+    戻り値:
+        fastapi.responses.JSONResponse: シャード数と読み込み時間を含む作成結果
+    """
+    return await run_in_threadpool(compaction_service.compact_embedding, full_rebuild=True)
+
+@router.post("/create_embedding_job")
+async def create_embedding_job(db: Session = Depends(get_db)) -> JSONResponse:
+    """埋め込みの作成ジョブを登録し、ジョブのIDを返す
+
+    この関数は、埋め込みの作成ジョブを登録し、レスポンスの返却後にワーカースレッドで実行します。
+    ジョブはバッチごとにコミットするため、中断されても処理済みのバッチの結果は残り、再起動後に続きから再開します。
+
+    パラメータ:
+        db (sqlalchemy.orm.session.Session): データベースセッション
+
+    戻り値:
+        fastapi.responses.JSONResponse: ジョブのIDと状態を含むメッセージ
+    """
+    return await run_in_threadpool(embedding_job_service.submit_embedding_job, db, SessionLocal)
+
+@router.get("/embedding_job/{job_id}")
+async def get_embedding_job(job_id: str, db: Session = Depends(get_db)) -> JSONResponse:
+    """埋め込みの作成ジョブの進捗を返す
+
+    パラメータ:
+        job_id (str): ジョブのID
+        db (sqlalchemy.orm.session.Session): データベースセッション
+
+    戻り値:
+        fastapi.responses.JSONResponse: 行数、チャンク数、トークン数、経過時間、残り時間の見込みを含むジョブの進捗
+    """
+    return await run_in_threadpool(embedding_job_service.get_embedding_job, job_id, db)
+
+@router.post("/cancel_embedding_job/{job_id}")
+async def cancel_embedding_job(job_id: str, db: Session = Depends(get_db)) -> JSONResponse:
+    """埋め込みの作成ジョブのキャンセルを要求する
+
+    ジョブは実行中のバッチを完了してから終了します。
+
+    パラメータ:
+        job_id (str): ジョブのID
+        db (sqlalchemy.orm.session.Session): データベースセッション
+
+    戻り値:
+        fastapi.responses.JSONResponse: キャンセルを要求したジョブの進捗
+    """
+    return await run_in_threadpool(embedding_job_service.cancel_embedding_job, job_id, db)
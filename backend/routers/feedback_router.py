@@ -1,21 +1,21 @@
 from fastapi import APIRouter, Depends, Request
 from services import feedback_service
-from config.session import get_db
+from config.session import get_async_db
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from config.session import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.session import get_async_db
 
 router = APIRouter()
 
 @router.post("/create_feedback")
-async def create_feedback(request: Request, db: Session = Depends(get_db)) -> JSONResponse:
+async def create_feedback(request: Request, db: AsyncSession = Depends(get_async_db)) -> JSONResponse:
     """チャットのフィードバックを作成する
 
     この関数は、チャットのフィードバックを作成します。
 
     パラメータ:
         request (fastapi.Request): HTTPリクエストオブジェクト
-        db (sqlalchemy.orm.session.Session): データベースセッション
+        db (sqlalchemy.ext.asyncio.AsyncSession): 非同期のデータベースセッション
 
     戻り値:
         fastapi.responses.JSONResponse: フィードバック作成に成功したかどうかを示すメッセージ
@@ -24,6 +24,6 @@ async def create_feedback(request: Request, db: Session = Depends(get_db)) -> JS
     chat_id = data.get('chat_id')
     rating = data.get('rating')
     content = data.get('content')
-    return feedback_service.create_feedback(chat_id, content, rating, db)
+    return await feedback_service.create_feedback(chat_id, content, rating, db)
 
 
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from services import metrics_service
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics() -> JSONResponse:
+    """このプロセスの統計情報を取得する
+
+    この関数は、クエリのベクトルのキャッシュのヒット数・ミス数と、OpenAI API用のHTTP接続プールの統計情報を返します。
+
+    戻り値:
+        fastapi.responses.JSONResponse: 統計情報
+    """
+    return metrics_service.get_metrics()
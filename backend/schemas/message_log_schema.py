@@ -10,6 +10,8 @@ class MessageLogBase(BaseModel):
     TotalCost: float
     ResponseTime: float
     HasError: bool
+    IsCacheHit: bool = False
+    IsCoalesced: bool = False
     CreateDate: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MessageLogCreate(MessageLogBase):
@@ -0,0 +1,80 @@
+"""
+既存のDatastoreの行に、アップロード時のアップサートで使用するキー（RowKey）と内容のハッシュ値（ContentHash）を設定するCLI
+
+migrations/004_add_datastore_row_key.sql で列を追加した後、migrations/005_add_datastore_row_key_index.sql で
+一意インデックスを作成する前に一度だけ実行します。値はアップロード時と同じ get_row_key / get_content_hash で計算します。
+
+SourceとTitleが同じ行が複数ある場合は、アップロード時と同じく最後の（Idが最も大きい）行をキーの行とし、
+それ以外の重複した行のRowKeyはNULLのままにします（一意インデックスはNULLの重複を許可します）。
+--delete-duplicates を指定した場合は、重複した行を削除します。削除した行のベクトルは、次回のエンベディングの作成時に除外されます。
+
+使い方（backendディレクトリで実行）:
+    python -m scripts.backfill_datastore_row_keys
+    python -m scripts.backfill_datastore_row_keys --delete-duplicates
+"""
+import argparse
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.orm import Session
+from models.data_store import Datastore
+from services.data_store_service import ROW_KEY_COLUMN_NAMES, CONTENT_COLUMN_NAMES, get_row_key, get_content_hash
+
+def backfill_row_keys(db: Session, batch_size=1000, delete_duplicates=False):
+    """
+    RowKeyが設定されていない行に、RowKeyとContentHashを設定します。
+
+    Idの降順にバッチごとに処理し、バッチごとにコミットします。途中で中断しても、再実行すると残りの行から処理します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        batch_size {int} -- 1回のクエリで処理する行数
+        delete_duplicates {bool} -- 重複した行を削除するかどうか
+
+    Returns:
+        dict -- キーを設定した行数（updated）と、重複した行数（duplicates）
+    """
+    table = Datastore.__table__
+    seen_row_keys = set(db.scalars(select(table.c.RowKey).where(table.c.RowKey.is_not(None))))
+    counts = {'updated': 0, 'duplicates': 0}
+    last_id = None
+    while True:
+        query = select(table.c.Id, *[table.c[column_name] for column_name in ROW_KEY_COLUMN_NAMES + CONTENT_COLUMN_NAMES]).where(table.c.RowKey.is_(None))
+        if last_id is not None:
+            query = query.where(table.c.Id < last_id)
+        rows = db.execute(query.order_by(table.c.Id.desc()).limit(batch_size)).mappings().all()
+        if not rows:
+            break
+        last_id = rows[-1]['Id']
+
+        updated_items = []
+        duplicate_ids = []
+        for row in rows:
+            row_key = get_row_key(row)
+            if row_key in seen_row_keys:
+                duplicate_ids.append(row['Id'])
+                continue
+            seen_row_keys.add(row_key)
+            updated_items.append({'b_Id': row['Id'], 'RowKey': row_key, 'ContentHash': get_content_hash(row)})
+
+        if updated_items:
+            db.execute(update(table).where(table.c.Id == bindparam('b_Id')).values(RowKey=bindparam('RowKey'), ContentHash=bindparam('ContentHash')), updated_items)
+        if duplicate_ids and delete_duplicates:
+            db.execute(delete(table).where(table.c.Id.in_(duplicate_ids)))
+        db.commit()
+        counts['updated'] += len(updated_items)
+        counts['duplicates'] += len(duplicate_ids)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Set RowKey and ContentHash on existing Datastore rows before creating the UX_Datastore_RowKey index.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--delete-duplicates', action='store_true', help='delete rows whose Source/Title duplicates a newer row')
+    args = parser.parse_args(argv)
+
+    from config.session import SessionLocal
+    with SessionLocal() as db:
+        counts = backfill_row_keys(db, args.batch_size, args.delete_duplicates)
+    action = 'deleted' if args.delete_duplicates else 'left with RowKey NULL'
+    print(f'rows updated: {counts["updated"]}, duplicate rows {action}: {counts["duplicates"]}')
+
+if __name__ == '__main__':
+    main()
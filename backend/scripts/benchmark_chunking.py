@@ -0,0 +1,102 @@
+"""
+ドキュメントの分割（チャンク化）のスループットを、プロセスプールのワーカー数ごとに測定するCLI
+
+合成したドキュメント、またはデータストアのデータを、ワーカー数（DOCUMENT_CHUNK_WORKERS）を変えて iter_document_chunks で分割し、
+経過時間、1秒あたりのドキュメント数、1ワーカーに対する速度向上率を表示します。
+結果を見て、実際のマシンで DOCUMENT_CHUNK_WORKERS / DOCUMENT_CHUNK_TASK_DOCUMENTS を決めます。
+
+使い方（backendディレクトリで実行）:
+    python -m scripts.benchmark_chunking --documents 20000 --workers 1 2 4 8 16
+    python -m scripts.benchmark_chunking --splitter character --workers 1 2
+    python -m scripts.benchmark_chunking --datastore --workers 1 4
+"""
+import argparse
+import os
+import time
+import numpy as np
+from langchain.docstore.document import Document
+from services import document_chunking_service
+
+def create_synthetic_documents(count, words, seed):
+    """
+    ランダムな単語からなる合成ドキュメントを作成します。
+
+    Arguments:
+        count {int} -- ドキュメント数
+        words {int} -- 1ドキュメントあたりの単語数
+        seed {int} -- 乱数のシード
+
+    Returns:
+        List[Document] -- ドキュメントのリスト
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [''.join(chr(ord('a') + letter) for letter in rng.integers(0, 26, size=rng.integers(2, 10))) for _ in range(5000)]
+    return [
+        Document(page_content=' '.join(vocabulary[position] for position in rng.integers(0, len(vocabulary), size=words)), metadata={'Category': None, 'DatastoreId': index})
+        for index in range(count)
+    ]
+
+def load_datastore_documents():
+    """
+    データストアのすべてのデータからドキュメントを作成します。
+
+    Returns:
+        List[Document] -- ドキュメントのリスト
+    """
+    from config.session import SessionLocal
+    from models.data_store import Datastore
+    from services.embedding_service import create_documents
+    with SessionLocal() as db:
+        return create_documents(db.query(Datastore).order_by(Datastore.Id).all())
+
+def measure_chunking(documents, workers):
+    """
+    指定されたワーカー数で、すべてのドキュメントを分割する時間を測定します。
+
+    プロセスプールの起動（ワーカーでのエンコーダーの読み込み）は測定に含めません。
+
+    Arguments:
+        documents {List[Document]} -- ドキュメントのリスト
+        workers {int} -- ワーカー数（1の場合はこのプロセスで分割する）
+
+    Returns:
+        Tuple[int, float] -- チャンク数と経過時間（秒）
+    """
+    document_chunking_service.shutdown_chunking_executor()
+    document_chunking_service.DOCUMENT_CHUNK_WORKERS = workers
+    if workers != 1:
+        # ワーカーを起動し、エンコーダーを読み込ませておく
+        list(document_chunking_service.get_chunking_executor().map(document_chunking_service.split_documents, [[]] * workers))
+    start_time = time.perf_counter()
+    chunk_count = sum(len(chunks) for chunks in document_chunking_service.iter_document_chunks(documents))
+    elapsed_seconds = time.perf_counter() - start_time
+    document_chunking_service.shutdown_chunking_executor()
+    return chunk_count, elapsed_seconds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure document chunking throughput for each number of process pool workers.')
+    parser.add_argument('--documents', type=int, default=5000, help='number of synthetic documents')
+    parser.add_argument('--words', type=int, default=400, help='number of words per synthetic document')
+    parser.add_argument('--datastore', action='store_true', help='chunk the Datastore rows instead of synthetic documents')
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4, 8])
+    parser.add_argument('--splitter', help='override DOCUMENT_CHUNK_SPLITTER (e.g. character, which needs no tiktoken encoding)')
+    parser.add_argument('--task-documents', type=int, help='override DOCUMENT_CHUNK_TASK_DOCUMENTS')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.splitter:
+        document_chunking_service.DOCUMENT_CHUNK_SPLITTER = args.splitter
+    if args.task_documents:
+        document_chunking_service.DOCUMENT_CHUNK_TASK_DOCUMENTS = args.task_documents
+    documents = load_datastore_documents() if args.datastore else create_synthetic_documents(args.documents, args.words, args.seed)
+
+    print(f'documents: {len(documents)}, cpu cores: {os.cpu_count()}, splitter: {document_chunking_service.DOCUMENT_CHUNK_SPLITTER}, task documents: {document_chunking_service.DOCUMENT_CHUNK_TASK_DOCUMENTS}')
+    print(f'{"workers":<10}{"chunks":>10}{"seconds":>10}{"docs/s":>12}{"speedup":>10}')
+    base_seconds = None
+    for workers in args.workers:
+        chunk_count, elapsed_seconds = measure_chunking(documents, workers)
+        base_seconds = base_seconds or elapsed_seconds
+        print(f'{workers:<10}{chunk_count:>10}{elapsed_seconds:>10.3f}{len(documents) / elapsed_seconds:>12.1f}{base_seconds / elapsed_seconds:>10.2f}')
+
+if __name__ == '__main__':
+    main()
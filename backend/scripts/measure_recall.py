@@ -0,0 +1,114 @@
+"""
+埋め込みインデックスの再現率（recall@k）と検索時間を測定するCLI
+
+エンベディングフォルダ内の実際のコーパスのベクトルを使い、全件検索（IndexFlatL2）の結果を正解として、
+IVF（nprobe）とHNSW（efSearch）の各パラメータでの recall@k と1クエリあたりの検索時間を表示します。
+結果を見て、EMBEDDING_INDEX_TYPE / EMBEDDING_IVF_NPROBE / EMBEDDING_HNSW_EF_SEARCH を決めます。
+
+クエリには、記録した実際のクエリのベクトル（--query-file、(クエリ数, 次元数)の.npyファイル）を使用します。
+指定しない場合は、コーパスから抽出したベクトルをインデックスに含めずにクエリとして使用します（ホールドアウト）。
+インデックスに含まれるベクトルをクエリにすると、自分自身が距離0で必ずヒットして recall@k が実際より高くなるためです。
+
+使い方（backendディレクトリで実行）:
+    python -m scripts.measure_recall --k 32 --queries 200 --nprobe 1 4 16 64 --ef-search 32 64 128 256
+    python -m scripts.measure_recall --k 32 --query-file query_vectors.npy
+"""
+import argparse
+import time
+import faiss
+import numpy as np
+from config.constant import (
+    NO_OF_SIMILAR_DOCUMENTS,
+    EMBEDDING_INDEX_TYPE_IVF,
+    EMBEDDING_INDEX_TYPE_HNSW)
+from utils.utils import get_embeddings_folder_path, get_embedding_model, get_embedding_index_names, get_mmap_store_names
+from utils.vector_stores import load_vectors_and_records, build_faiss_index, set_faiss_search_parameters
+
+def load_corpus_vectors():
+    """
+    エンベディングフォルダ内のすべてのインデックスから、コーパスのベクトルを読み込みます。
+
+    Returns:
+        numpy.ndarray -- ベクトルの配列 (ベクトル数, 次元数)
+    """
+    embeddings_folder_path = get_embeddings_folder_path()
+    embedding_model = get_embedding_model()
+    index_names = get_embedding_index_names(embeddings_folder_path) + get_mmap_store_names(embeddings_folder_path)
+    return np.concatenate([load_vectors_and_records(embeddings_folder_path, index_name, embedding_model)[0] for index_name in index_names])
+
+def split_queries(vectors, query_count, seed):
+    """
+    コーパスのベクトルから、クエリとして使用するベクトルを抽出し、残りをインデックスに含めるベクトルとします。
+
+    Arguments:
+        vectors {numpy.ndarray} -- コーパスのベクトル
+        query_count {int} -- クエリ数
+        seed {int} -- 乱数のシード
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray] -- インデックスに含めるベクトルと、クエリのベクトル
+    """
+    is_query = np.zeros(len(vectors), dtype=bool)
+    # インデックスに含めるベクトルが残るよう、クエリはコーパスの半分までとする
+    is_query[np.random.default_rng(seed).choice(len(vectors), size=min(query_count, len(vectors) // 2), replace=False)] = True
+    return vectors[~is_query], vectors[is_query]
+
+def measure_recall(index, queries, ground_truth, k):
+    """
+    インデックスの recall@k と1クエリあたりの検索時間を測定します。
+
+    Arguments:
+        index {faiss.Index} -- 測定するインデックス
+        queries {numpy.ndarray} -- クエリのベクトル
+        ground_truth {numpy.ndarray} -- 全件検索による各クエリの上位k件の位置
+        k {int} -- 取得件数
+
+    Returns:
+        Tuple[float, float] -- recall@k と1クエリあたりの検索時間（ミリ秒）
+    """
+    start_time = time.perf_counter()
+    _, positions = index.search(queries, k)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(positions, ground_truth))
+    return hits / ground_truth.size, elapsed_ms
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure recall@k of IVF / HNSW indexes against the exact index on the live corpus.')
+    parser.add_argument('--k', type=int, default=NO_OF_SIMILAR_DOCUMENTS)
+    parser.add_argument('--queries', type=int, default=200, help='number of corpus vectors held out of the index and used as queries')
+    parser.add_argument('--query-file', help='.npy file of logged query embeddings to use instead of held-out corpus vectors')
+    parser.add_argument('--nprobe', type=int, nargs='*', default=[1, 4, 16, 64])
+    parser.add_argument('--ef-search', type=int, nargs='*', default=[32, 64, 128, 256])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    vectors = load_corpus_vectors()
+    if args.query_file:
+        queries = np.ascontiguousarray(np.load(args.query_file), dtype=np.float32)
+    else:
+        vectors, queries = split_queries(vectors, args.queries, args.seed)
+    k = min(args.k, len(vectors))
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    ground_truth = exact_index.search(queries, k)[1]
+    exact_recall, exact_ms = measure_recall(exact_index, queries, ground_truth, k)
+
+    print(f'vectors: {len(vectors)}, queries: {len(queries)}, k: {k}')
+    print(f'{"index":<8}{"param":<16}{"recall@k":>10}{"ms/query":>12}')
+    print(f'{"flat":<8}{"-":<16}{exact_recall:>10.4f}{exact_ms:>12.3f}')
+
+    ivf_index = build_faiss_index(vectors, EMBEDDING_INDEX_TYPE_IVF, min_vectors=0)
+    for nprobe in args.nprobe:
+        set_faiss_search_parameters(ivf_index, nprobe=nprobe)
+        recall, elapsed_ms = measure_recall(ivf_index, queries, ground_truth, k)
+        print(f'{"ivf":<8}{"nprobe=" + str(nprobe):<16}{recall:>10.4f}{elapsed_ms:>12.3f}')
+
+    hnsw_index = build_faiss_index(vectors, EMBEDDING_INDEX_TYPE_HNSW, min_vectors=0)
+    for ef_search in args.ef_search:
+        set_faiss_search_parameters(hnsw_index, ef_search=ef_search)
+        recall, elapsed_ms = measure_recall(hnsw_index, queries, ground_truth, k)
+        print(f'{"hnsw":<8}{"efSearch=" + str(ef_search):<16}{recall:>10.4f}{elapsed_ms:>12.3f}')
+
+if __name__ == '__main__':
+    main()
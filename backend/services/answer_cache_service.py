@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from config.constant import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_SEMANTIC_DISTANCE,
+    LOG_MESSAGE_ANSWER_CACHE_HIT)
+from config import logger
+import numpy as np
+import re
+import threading
+import time
+import unicodedata
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+# 正規化したクエリと言語をキーとする、LRU順のキャッシュ（値は回答、回答を作成したモデル名、正規化したクエリのベクトル、登録時刻）
+_answer_cache = OrderedDict()
+# キャッシュの回答を作成したベクトルストアのバージョン
+_answer_cache_index_version = None
+_answer_cache_lock = threading.Lock()
+
+def normalize_query(query: str) -> str:
+    """
+    キャッシュのキーにするため、クエリを正規化します（Unicode正規化、大文字・小文字の統一、空白の統一）。
+
+    Arguments:
+        query {str} -- クエリ
+
+    Returns:
+        str -- 正規化したクエリ
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', query)).strip().casefold()
+
+def get_cached_answer(query: str, language: str, index_version: int, query_embedding=None):
+    """
+    キャッシュから回答を取得します。
+
+    正規化したクエリと言語が一致する回答を返します。ANSWER_CACHE_SEMANTIC_DISTANCEが0より大きい場合は、一致しないときに
+    同じ言語の回答の中からクエリのベクトルとのコサイン距離がしきい値以下で最も近いものを返します。
+    ベクトルストアのバージョンが変わっている場合は、キャッシュをすべて破棄します。
+
+    Arguments:
+        query {str} -- クエリ
+        language {str} -- 検出した言語
+        index_version {int} -- 現在のベクトルストアのバージョン
+        query_embedding {List[float]} -- クエリのベクトル（省略時は完全一致のみ）
+
+    Returns:
+        dict -- キャッシュの回答（answer）と回答を作成したモデル名（model）。ない場合はNone
+    """
+    if ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return None
+    key = (normalize_query(query), language)
+    with _answer_cache_lock:
+        _expire_answer_cache(index_version)
+        entry = _answer_cache.get(key)
+        match = 'exact'
+        if entry is None and query_embedding is not None and ANSWER_CACHE_SEMANTIC_DISTANCE > 0:
+            key, entry = _get_nearest_entry(language, _normalize_vector(query_embedding))
+            match = 'semantic'
+        if entry is None:
+            return None
+        _answer_cache.move_to_end(key)
+    backlog_gen_ai_chat_logger.info(LOG_MESSAGE_ANSWER_CACHE_HIT.format(match=match))
+    return {'answer': entry['answer'], 'model': entry['model']}
+
+def set_cached_answer(query: str, language: str, index_version: int, answer: str, model: str, query_embedding=None):
+    """
+    回答をキャッシュに登録します。上限を超えた場合は、最も長く使われていない回答を削除します。
+
+    Arguments:
+        query {str} -- クエリ
+        language {str} -- 検出した言語
+        index_version {int} -- 回答の作成に使用したベクトルストアのバージョン
+        answer {str} -- 回答
+        model {str} -- 回答を作成したモデル名（フォールバックした場合は、実際に使用したモデル名）
+        query_embedding {List[float]} -- クエリのベクトル
+    """
+    if ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return
+    key = (normalize_query(query), language)
+    with _answer_cache_lock:
+        _expire_answer_cache(index_version)
+        _answer_cache[key] = {
+            'answer': answer,
+            'model': model,
+            'embedding': None if query_embedding is None else _normalize_vector(query_embedding),
+            'created_at': time.monotonic(),
+        }
+        _answer_cache.move_to_end(key)
+        while len(_answer_cache) > ANSWER_CACHE_MAX_ENTRIES:
+            _answer_cache.popitem(last=False)
+
+def clear_answer_cache():
+    """
+    キャッシュをすべて破棄します。
+    """
+    global _answer_cache_index_version
+    with _answer_cache_lock:
+        _answer_cache.clear()
+        _answer_cache_index_version = None
+
+def _expire_answer_cache(index_version: int):
+    """
+    ベクトルストアのバージョンが変わっている場合はキャッシュをすべて破棄し、有効期限を過ぎた回答を削除します。呼び出し元でロックを取得していること。
+
+    Arguments:
+        index_version {int} -- 現在のベクトルストアのバージョン
+    """
+    global _answer_cache_index_version
+    if _answer_cache_index_version != index_version:
+        _answer_cache.clear()
+        _answer_cache_index_version = index_version
+    expired_at = time.monotonic() - ANSWER_CACHE_TTL_SECONDS
+    # LRU順のため有効期限の判定は全件行う
+    for key in [key for key, entry in _answer_cache.items() if entry['created_at'] < expired_at]:
+        del _answer_cache[key]
+
+def _get_nearest_entry(language: str, query_embedding):
+    """
+    同じ言語の回答の中から、クエリのベクトルとのコサイン距離が最も近い回答を取得します。呼び出し元でロックを取得していること。
+
+    Arguments:
+        language {str} -- 検出した言語
+        query_embedding {numpy.ndarray} -- 正規化したクエリのベクトル
+
+    Returns:
+        Tuple[tuple, dict] -- キャッシュのキーと回答（距離がANSWER_CACHE_SEMANTIC_DISTANCEを超える場合は(None, None)）
+    """
+    candidates = [(key, entry) for key, entry in _answer_cache.items() if key[1] == language and entry['embedding'] is not None]
+    if not candidates:
+        return None, None
+    similarities = np.stack([entry['embedding'] for _, entry in candidates]) @ query_embedding
+    nearest = int(np.argmax(similarities))
+    if 1 - similarities[nearest] > ANSWER_CACHE_SEMANTIC_DISTANCE:
+        return None, None
+    return candidates[nearest]
+
+def _normalize_vector(vector):
+    """
+    コサイン類似度を内積で計算できるよう、ベクトルをfloat32の単位ベクトルに変換します。
+
+    Arguments:
+        vector {List[float]} -- ベクトル
+
+    Returns:
+        numpy.ndarray -- 単位ベクトル
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -1,5 +1,6 @@
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.constant import (
     ERROR_MESSAGE_EMPTY_EMAIL,
     ERROR_MESSAGE_CHAT_CREATE,
@@ -11,13 +12,13 @@ from models.chat import Chat
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def create_chat(email: str, db: Session) -> JSONResponse:
+async def create_chat(email: str, db: AsyncSession) -> JSONResponse:
     """
     チャットセッションを作成する
 
     パラメータ:
     - email: ユーザーのメールアドレス (str)
-    - db: データベースセッション (sqlalchemy.orm.Session)
+    - db: 非同期のデータベースセッション (sqlalchemy.ext.asyncio.AsyncSession)
 
     戻り値:
     - JSONResponse: 作成されたチャットセッションのID (int) 
@@ -28,26 +29,25 @@ def create_chat(email: str, db: Session) -> JSONResponse:
             return JSONResponse(status_code=400, content={"error": ERROR_MESSAGE_EMPTY_EMAIL})
 
         chat = Chat(**ChatCreate(User=email).model_dump())
-        with db.begin():
+        async with db.begin():
             db.add(chat)
-            db.commit()
         backlog_gen_ai_chat_logger.info(f"Chat created successfully with id {chat.Id}, User: {chat.User}")
 
         return JSONResponse(status_code=200, content={"chat_id": chat.Id})
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         e_error_msg = ERROR_MESSAGE_CHAT_CREATE.format(reason=str(e))
         backlog_gen_ai_chat_logger.info(e_error_msg)
         return JSONResponse(status_code=500, content={"error": e_error_msg})
     
-def get_chat(chat_id: int, db: Session) -> Chat:
+async def get_chat(chat_id: int, db: AsyncSession) -> Chat:
     """
     指定されたIDのチャットをデータベースから取得します。
 
     引数:
         chat_id (int): チャットID
-        db (Session): SQLAlchemyデータベースセッション
+        db (AsyncSession): SQLAlchemyの非同期のデータベースセッション
 
     戻り値:
         Chat: チャット
@@ -57,7 +57,7 @@ def get_chat(chat_id: int, db: Session) -> Chat:
     """
     backlog_gen_ai_chat_logger.info('#### Action: get_chat ####')
     try:
-        chat = db.query(Chat).filter(Chat.Id == chat_id).first()
+        chat = (await db.execute(select(Chat).where(Chat.Id == chat_id))).scalars().first()
         if chat is None:
             error_msg = ERROR_MESSAGE_CHAT_NOT_FOUND.format(id=chat_id)
             backlog_gen_ai_chat_logger.info(error_msg)
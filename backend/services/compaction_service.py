@@ -0,0 +1,261 @@
+from fastapi.responses import JSONResponse
+from config.constant import (
+    ERROR_MESSAGE_GENERAL,
+    ERROR_MESSAGE_FAISS_EMBEDDING_COMPACTION_EXCEPTION,
+    ERROR_MESSAGE_EMBEDDING_COMPACTION_RUNNING,
+    SUCCESS_MESSAGE_EMBEDDING_FILES_COMPACTION,
+    SUCCESS_MESSAGE_NO_EMBEDDING_FILES_FOR_COMPACTION,
+    SUCCESS_MESSAGE_EMBEDDING_INDEX_BUILD,
+    EMBEDDING_COMPACTION_FOLDER_NAME,
+    EMBEDDING_COMPACTION_SHARD_THRESHOLD,
+    EMBEDDING_COMPACTION_MAX_SHARD_BYTES,
+    EMBEDDING_COMPACTION_DELETED_IDS_THRESHOLD,
+    EMBEDDING_INDEX_FILE_EXTENSIONS,
+    EMBEDDING_STORE_FORMAT,
+    EMBEDDING_STORE_FORMAT_MMAP,
+    MMAP_STORE_EXTENSION,
+    LOG_MESSAGE_EMBEDDING_COMPACTION)
+from config import logger
+import numpy as np
+import os
+import shutil
+import threading
+import time
+from exceptions.general_exception import CustomGeneralException
+from services.vector_store_service import reload_vector_store
+from utils.utils import (
+    get_embeddings_folder_path,
+    get_embedding_model,
+    get_embedding_index_names,
+    get_embedding_index_size,
+    get_mmap_store_names,
+    get_random_uuid_name,
+    publish_embedding_version,
+    get_deleted_embedding_ids,
+    update_deleted_embedding_ids)
+from utils.vector_stores import (
+    build_faiss_index,
+    load_vectors_and_records,
+    save_faiss_vector_store,
+    save_mmap_vector_store)
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+# コンパクションを同時に1つだけ実行するためのロック
+_compaction_lock = threading.Lock()
+
+def compact_embedding(full_rebuild=False) -> JSONResponse:
+    """
+    エンベディングフォルダ内の小さなインデックスファイルを、少数の大きなインデックスファイルにまとめます。
+
+    引数:
+        full_rebuild {bool} -- Trueの場合、コーパス全体のベクトルで設定された種類のインデックスを1つ作り直します
+
+    戻り値:
+        JSONResponse -- コンパクションの結果（シャード数、削減されたバイト数など）を含むJSONレスポンス
+    """
+    backlog_gen_ai_chat_logger.info('#### Action: compact_embedding ####')
+    if not _compaction_lock.acquire(blocking=False):
+        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_EMBEDDING_COMPACTION_RUNNING)
+        return JSONResponse(status_code=409, content={"error": ERROR_MESSAGE_EMBEDDING_COMPACTION_RUNNING})
+
+    try:
+        report = run_compaction(full_rebuild)
+        if report is None:
+            backlog_gen_ai_chat_logger.info(SUCCESS_MESSAGE_NO_EMBEDDING_FILES_FOR_COMPACTION)
+            return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_NO_EMBEDDING_FILES_FOR_COMPACTION})
+        success_message = SUCCESS_MESSAGE_EMBEDDING_INDEX_BUILD if full_rebuild else SUCCESS_MESSAGE_EMBEDDING_FILES_COMPACTION
+        return JSONResponse(status_code=200, content={"message": success_message, "report": report})
+
+    except CustomGeneralException as cge:
+        backlog_gen_ai_chat_logger.info(cge.message)
+        return JSONResponse(status_code=500, content={"error": cge.message})
+
+    except Exception as e:
+        e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
+        backlog_gen_ai_chat_logger.info(e_error_msg)
+        return JSONResponse(status_code=500, content={"error": e_error_msg})
+
+    finally:
+        _compaction_lock.release()
+
+def compact_embedding_if_needed():
+    """
+    インデックスファイル数、または削除済みのベクトル数がしきい値を超えている場合のみ、コンパクションを実行します。
+
+    削除済みのベクトル数がしきい値を超えている場合は、すべてのインデックスを作り直して削除済みのベクトルを取り除きます。
+    埋め込み作成後にバックグラウンドタスクとして呼び出されることを想定しています。
+    """
+    embeddings_folder_path = get_embeddings_folder_path()
+    if len(get_deleted_embedding_ids(embeddings_folder_path)) > EMBEDDING_COMPACTION_DELETED_IDS_THRESHOLD:
+        compact_embedding(full_rebuild=True)
+    elif len(get_embedding_index_names(embeddings_folder_path)) + len(get_mmap_store_names(embeddings_folder_path)) > EMBEDDING_COMPACTION_SHARD_THRESHOLD:
+        compact_embedding()
+
+def run_compaction(full_rebuild=False):
+    """
+    インデックスファイルをまとめ、常駐しているベクトルストアを差し替えます。
+
+    最大サイズ（EMBEDDING_COMPACTION_MAX_SHARD_BYTES）に達していないインデックスを順にグループ化し、
+    グループごとに設定された種類（EMBEDDING_INDEX_TYPE）の1つのインデックスにまとめます。EMBEDDING_STORE_FORMATがmmapの場合は、
+    既存のメモリマップ形式のベクトルストアも対象とし、メモリマップ形式で書き込みます。
+    マージ結果は一時フォルダに書き込んだ後にリネームで公開し、置き換えられた古いインデックスファイルを削除します。
+    削除済みのベクトルはマージ時に取り除き、取り除いたIDを削除済みのベクトルの一覧から削除します。
+
+    Arguments:
+        full_rebuild {bool} -- Trueの場合、サイズに関係なくすべてのインデックスを1つのインデックスに作り直します
+
+    Returns:
+        dict -- コンパクションの結果。まとめる対象がない場合はNone
+
+    Raises:
+        CustomGeneralException: FAISSに関する例外が発生した場合に発生します
+    """
+    embeddings_folder_path = get_embeddings_folder_path()
+    is_mmap_format = EMBEDDING_STORE_FORMAT == EMBEDDING_STORE_FORMAT_MMAP
+    index_names = get_embedding_index_names(embeddings_folder_path)
+    if is_mmap_format or full_rebuild:
+        index_names += get_mmap_store_names(embeddings_folder_path)
+    index_sizes = {index_name: get_embedding_index_size(embeddings_folder_path, index_name) for index_name in index_names}
+
+    if full_rebuild:
+        groups = [index_names] if index_names else []
+    else:
+        groups = get_compaction_groups(index_names, index_sizes)
+    if not groups:
+        return None
+
+    temp_folder_path = os.path.join(embeddings_folder_path, EMBEDDING_COMPACTION_FOLDER_NAME)
+    os.makedirs(temp_folder_path, exist_ok=True)
+
+    try:
+        # 各グループをマージして一時フォルダに書き込む
+        embedding_model = get_embedding_model()
+        deleted_ids = get_deleted_embedding_ids(embeddings_folder_path)
+        compacted_index_names = []
+        purged_ids = set()
+        for group in groups:
+            compacted_index_name, group_purged_ids = write_compacted_index(embeddings_folder_path, group, embedding_model, temp_folder_path, is_mmap_format, deleted_ids)
+            compacted_index_names.append(compacted_index_name)
+            purged_ids |= group_purged_ids
+
+        superseded_index_names = [index_name for group in groups for index_name in group]
+
+        def publish_compacted_index_files():
+            """
+            マージしたインデックスを公開し、置き換えられた古いインデックスファイルを削除します。
+            .faissファイルを最後にリネームするため、読み込み側から書き込み途中のインデックスは見えません。
+            """
+            for compacted_index_name in compacted_index_names:
+                if compacted_index_name.endswith(MMAP_STORE_EXTENSION):
+                    os.replace(os.path.join(temp_folder_path, compacted_index_name), os.path.join(embeddings_folder_path, compacted_index_name))
+                    continue
+                for extension in reversed(EMBEDDING_INDEX_FILE_EXTENSIONS):
+                    os.replace(
+                        os.path.join(temp_folder_path, compacted_index_name + extension),
+                        os.path.join(embeddings_folder_path, compacted_index_name + extension))
+            for index_name in superseded_index_names:
+                if index_name.endswith(MMAP_STORE_EXTENSION):
+                    shutil.rmtree(os.path.join(embeddings_folder_path, index_name))
+                    continue
+                for extension in EMBEDDING_INDEX_FILE_EXTENSIONS:
+                    os.remove(os.path.join(embeddings_folder_path, index_name + extension))
+            if purged_ids:
+                # コンパクション中に追加された削除済みのベクトルを残すため、最新の一覧から取り除いたIDのみ削除する
+                update_deleted_embedding_ids(embeddings_folder_path, removed_ids=purged_ids)
+            publish_embedding_version(embeddings_folder_path)
+
+        # ファイルの差し替えと常駐ベクトルストアの読み直しを、他の読み込みと排他で行う
+        load_start_time = time.time()
+        reload_vector_store(update_index_files=publish_compacted_index_files)
+        load_seconds = time.time() - load_start_time
+
+    except Exception as e:
+        raise CustomGeneralException(ERROR_MESSAGE_FAISS_EMBEDDING_COMPACTION_EXCEPTION.format(reason=str(e)))
+
+    finally:
+        shutil.rmtree(temp_folder_path, ignore_errors=True)
+
+    bytes_before = sum(index_sizes.values())
+    superseded_bytes = sum(index_sizes[index_name] for index_name in superseded_index_names)
+    compacted_bytes = sum(get_embedding_index_size(embeddings_folder_path, index_name) for index_name in compacted_index_names)
+    report = {
+        "shards_before": len(index_names),
+        "shards_after": len(index_names) - len(superseded_index_names) + len(compacted_index_names),
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_before - superseded_bytes + compacted_bytes,
+        "bytes_reclaimed": superseded_bytes - compacted_bytes,
+        "vectors_purged": len(purged_ids),
+        "load_seconds": round(load_seconds, 3),
+    }
+    backlog_gen_ai_chat_logger.info(LOG_MESSAGE_EMBEDDING_COMPACTION.format(**report))
+    return report
+
+def write_compacted_index(embeddings_folder_path, group, embedding_model, temp_folder_path, is_mmap_format, deleted_ids=frozenset()):
+    """
+    グループ内のインデックスのベクトルとドキュメントをまとめ、設定された種類（EMBEDDING_INDEX_TYPE）のインデックスを作成して一時フォルダに書き込みます。
+
+    削除済みのベクトルは書き込みません。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        group {List[str]} -- まとめるインデックス名のリスト
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+        temp_folder_path {str} -- 書き込み先の一時フォルダのパス
+        is_mmap_format {bool} -- メモリマップ形式で書き込むかどうか
+        deleted_ids {set} -- 削除済みのベクトルのID
+
+    Returns:
+        Tuple[str, set] -- 書き込んだインデックス名と、取り除いた削除済みのベクトルのID
+    """
+    vectors_list = []
+    records = []
+    for index_name in group:
+        vectors, index_records = load_vectors_and_records(embeddings_folder_path, index_name, embedding_model)
+        vectors_list.append(vectors)
+        records.extend(index_records)
+    vectors = np.concatenate(vectors_list)
+
+    purged_ids = {record['id'] for record in records if record['id'] in deleted_ids}
+    if purged_ids:
+        keep = np.array([record['id'] not in purged_ids for record in records], dtype=bool)
+        vectors = vectors[keep]
+        records = [record for record in records if record['id'] not in purged_ids]
+    index = build_faiss_index(vectors)
+
+    if is_mmap_format:
+        compacted_index_name = get_random_uuid_name() + MMAP_STORE_EXTENSION
+        save_mmap_vector_store(os.path.join(temp_folder_path, compacted_index_name), vectors, records, index)
+    else:
+        compacted_index_name = get_random_uuid_name()
+        save_faiss_vector_store(temp_folder_path, compacted_index_name, index, records, embedding_model)
+    return compacted_index_name, purged_ids
+
+def get_compaction_groups(index_names, index_sizes):
+    """
+    まとめる対象のインデックスを、最大サイズを超えないようにグループ化します。
+
+    すでに最大サイズに達しているインデックスと、1つだけのグループは対象外とします。
+
+    Arguments:
+        index_names {List[str]} -- インデックス名の一覧
+        index_sizes {Dict[str, int]} -- インデックス名ごとのファイルサイズ
+
+    Returns:
+        List[List[str]] -- マージするインデックス名のグループの一覧
+    """
+    groups = []
+    group = []
+    group_size = 0
+    for index_name in index_names:
+        index_size = index_sizes[index_name]
+        if index_size >= EMBEDDING_COMPACTION_MAX_SHARD_BYTES:
+            continue
+        if group and group_size + index_size > EMBEDDING_COMPACTION_MAX_SHARD_BYTES:
+            groups.append(group)
+            group = []
+            group_size = 0
+        group.append(index_name)
+        group_size += index_size
+    groups.append(group)
+    return [group for group in groups if len(group) > 1]
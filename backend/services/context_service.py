@@ -0,0 +1,123 @@
+from config.constant import (
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MIN_OVERLAP_CHARS,
+    LOG_MESSAGE_CONTEXT_PACKED)
+from config import logger
+from services.openai_service import get_token_count
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+def pack_context(documents_with_scores, max_tokens: int = None) -> str:
+    """
+    類似度検索の結果から、プロンプトに埋め込むコンテキストを作成します。
+
+    この関数は以下の処理を行います。
+    1. チャンクをスコア（距離）の小さい順に並べる
+    2. 同じソースのチャンクのうち、重複しているものを取り除き、前後につながるもの（チャンクのオーバーラップが一致するもの）を1つのパッセージにマージする
+    3. パッセージを最も良いチャンクのスコア順に並べ、トークン数の上限に収まる分だけ、タイトルとソースのみを付けた簡潔な形式で出力する
+       上限に収まらないパッセージは飛ばし、次のパッセージを試します。
+
+    Arguments:
+        documents_with_scores {List[Tuple[Document, float]]} -- 類似度検索の結果（ドキュメントとスコアのタプルのリスト）
+        max_tokens {int} -- コンテキストのトークン数の上限（省略時はCONTEXT_MAX_TOKENS）
+
+    Returns:
+        str -- プロンプトに埋め込むコンテキスト
+    """
+    if max_tokens is None:
+        max_tokens = CONTEXT_MAX_TOKENS
+
+    passages = []
+    for document, score in sorted(documents_with_scores, key=lambda document_with_score: document_with_score[1]):
+        metadata = document.metadata
+        _add_passage(passages, {
+            'key': (metadata.get('Source'), metadata.get('DatastoreId')),
+            'title': metadata.get('Title'),
+            'source': metadata.get('Source'),
+            'content': document.page_content,
+            'score': score})
+    passages.sort(key=lambda passage: passage['score'])
+
+    sections = []
+    total_tokens = 0
+    for passage in passages:
+        section = f"[{len(sections) + 1}] {passage['title']}\nSource: {passage['source']}\n{passage['content']}"
+        tokens = get_token_count(section)
+        if total_tokens + tokens > max_tokens:
+            continue
+        sections.append(section)
+        total_tokens += tokens
+
+    backlog_gen_ai_chat_logger.info(LOG_MESSAGE_CONTEXT_PACKED.format(chunks=len(documents_with_scores), passages=len(sections), tokens=total_tokens))
+    return '\n\n'.join(sections)
+
+def merge_contents(first: str, second: str):
+    """
+    同じソースの2つのチャンクを、重複部分を取り除いて1つにつなげます。
+
+    一方がもう一方に含まれている場合は長い方を返し、一方の末尾ともう一方の先頭が
+    CONTEXT_MIN_OVERLAP_CHARS文字以上一致する場合は、一致する部分を1つにしてつなげます。
+
+    Arguments:
+        first {str} -- チャンクの文字列
+        second {str} -- チャンクの文字列
+
+    Returns:
+        str -- つなげた文字列（つながらない場合はNone）
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap_length = _get_overlap_length(first, second)
+    if overlap_length:
+        return first + second[overlap_length:]
+    overlap_length = _get_overlap_length(second, first)
+    if overlap_length:
+        return second + first[overlap_length:]
+    return None
+
+def _add_passage(passages: list, passage: dict):
+    """
+    パッセージを、つながる同じソースのパッセージとマージしてリストに追加します。
+
+    マージしたパッセージが別のパッセージともつながる場合は、続けてマージします。
+
+    Arguments:
+        passages {list} -- パッセージのリスト
+        passage {dict} -- 追加するパッセージ
+    """
+    while True:
+        for other in passages:
+            if other['key'] != passage['key']:
+                continue
+            content = merge_contents(other['content'], passage['content'])
+            if content is not None:
+                passages.remove(other)
+                passage = {**other, 'content': content, 'score': min(other['score'], passage['score'])}
+                break
+        else:
+            passages.append(passage)
+            return
+
+def _get_overlap_length(first: str, second: str) -> int:
+    """
+    firstの末尾とsecondの先頭が一致する最長の文字数を取得します。
+
+    Arguments:
+        first {str} -- 前のチャンクの文字列
+        second {str} -- 後ろのチャンクの文字列
+
+    Returns:
+        int -- 一致する文字数（CONTEXT_MIN_OVERLAP_CHARS文字未満の場合は0）
+    """
+    if len(first) < CONTEXT_MIN_OVERLAP_CHARS or len(second) < CONTEXT_MIN_OVERLAP_CHARS:
+        return 0
+    prefix = second[:CONTEXT_MIN_OVERLAP_CHARS]
+    # secondの先頭が現れるfirstの位置のうち、最も前にあるもの（最長の一致）から確認する
+    position = first.find(prefix, max(len(first) - len(second), 0))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(prefix, position + 1)
+    return 0
@@ -2,70 +2,224 @@ from fastapi import UploadFile
 from fastapi.responses import JSONResponse
 from models.data_store import Datastore
 from schemas.data_store_schema import DatastoreCreate
-from sqlalchemy.orm import Session
-import pandas as pd
-from pandas.errors import ParserError
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
 from config.constant import (
-    ERROR_MESSAGE_NOT_EXCEL_FILE, 
-    SUCCESS_MESSAGE_FILE_UPLOAD, 
-    ERROR_MESSAGE_GENERAL, 
-    ERROR_MESSAGE_PANDAS_PARSER_FAIL)
+    DATA_STORE_UPLOAD_CHUNK_ROWS,
+    ERROR_MESSAGE_UNSUPPORTED_FILE_FORMAT,
+    SUCCESS_MESSAGE_FILE_UPLOAD,
+    SUCCESS_MESSAGE_FILE_UPLOAD_CHUNK,
+    ERROR_MESSAGE_GENERAL,
+    ERROR_MESSAGE_FILE_PARSER_FAIL,
+    ERROR_MESSAGE_UPLOAD_MISSING_COLUMNS,
+    ERROR_MESSAGE_UPLOAD_EMPTY_VALUE,
+    ERROR_MESSAGE_UPLOAD_VALUE_TOO_LONG,
+    LOG_MESSAGE_FILE_UPLOAD_CHUNK_SAVED)
 from config import logger
+from utils.data_store_readers import detect_file_format, iter_file_chunks, DataStoreFileParseError
+import hashlib
+import json
 
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def upload_file(file: UploadFile, db: Session) -> JSONResponse:
+# アップロードするファイルから読み込む列（IsUserForEmbeddingはアップロード時は常にFalse）
+UPLOAD_COLUMN_NAMES = [name for name in DatastoreCreate.model_fields if name != 'IsUserForEmbedding']
+
+# 行を識別するキーの列と、内容が変更されたかどうかを判定する列
+ROW_KEY_COLUMN_NAMES = ['Source', 'Title']
+CONTENT_COLUMN_NAMES = [name for name in UPLOAD_COLUMN_NAMES if name not in ROW_KEY_COLUMN_NAMES]
+
+class UploadValidationError(ValueError):
+    """
+    アップロードされたファイルの値が不正であることを表す例外です。
     """
-    Excelファイルをデータベースに保存する
+
+async def upload_file(file: UploadFile, db: AsyncSession):
+    """
+    Excel / CSV / JSON Lines / Parquetファイルをデータベースに保存する
+
+    ファイル形式はファイルの先頭から判定します。
+    ファイル全体をメモリに読み込まないよう、1行ずつ（Parquetはレコードバッチごとに）読み込んでDATA_STORE_UPLOAD_CHUNK_ROWS行ごとに検証し、
+    チャンクごとにアップサートしてコミットします。チャンクを保存するたびに、処理した行数と、
+    追加・更新・変更なしの行数を返します。途中でエラーが発生した場合、それまでにコミットしたチャンクはデータベースに残ります。
+    同じファイルを再度アップロードしても、データは重複しません。
 
     Parameters:
-    - file: アップロードされたExcelファイル (fastapi.UploadFile)
-    - db: データベースセッション (sqlalchemy.orm.Session)
+    - file: アップロードされたファイル (fastapi.UploadFile)
+    - db: 非同期のデータベースセッション (sqlalchemy.ext.asyncio.AsyncSession)
 
-    Returns:
-    - JSONResponse: 合格または不合格のメッセージ (fastapi.responses.JSONResponse)
+    Yields:
+    - JSONResponse: 処理した行数の途中経過と、合格または不合格のメッセージ (fastapi.responses.JSONResponse)
     """
 
     backlog_gen_ai_chat_logger.info('#### Action: upload_file ####')
 
-    if not file.filename.endswith(".xlsx"):
-        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_NOT_EXCEL_FILE)
-        return JSONResponse(status_code=400, content={"error": ERROR_MESSAGE_NOT_EXCEL_FILE})
+    file_format = await run_in_threadpool(detect_file_format, file.file, file.filename)
+    if file_format is None:
+        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_UNSUPPORTED_FILE_FORMAT)
+        yield JSONResponse(status_code=400, content={'status': 'done', 'error': ERROR_MESSAGE_UNSUPPORTED_FILE_FORMAT})
+        return
 
+    total_rows = 0
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
     try:
-        # Excelファイルを読み込み、DataFrameに変換
-        data_frame = pd.read_excel(file.file)
-
-        # 保存用のオブジェクトリストを生成
-        items = [
-            Datastore(**DatastoreCreate(
-                Keywords=row["Keywords"],
-                Title=row["Title"],
-                Source=row["Source"],
-                Content=row["Content"],
-                Category=row["Category"],
-                IsUserForEmbedding=False
-            ).model_dump()) for index, row in data_frame.iterrows()
-        ]
-
-        with db.begin():
-            # データベースに保存
-            db.bulk_save_objects(items)
-            db.commit()
+        # 読み込みはイベントループをブロックしないよう、チャンクごとにスレッドプールで実行する
+        chunks = iter_file_chunks(file.file, file_format, DATA_STORE_UPLOAD_CHUNK_ROWS)
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            row_numbers, columns = chunk
+            items = get_datastore_items(row_numbers, columns)
+
+            # チャンクごとに短いトランザクションでコミットする
+            async with db.begin():
+                chunk_counts = await upsert_datastore_items(db, items)
+
+            total_rows += len(items)
+            for key, count in chunk_counts.items():
+                counts[key] += count
+            backlog_gen_ai_chat_logger.info(LOG_MESSAGE_FILE_UPLOAD_CHUNK_SAVED.format(rows=len(items), total_rows=total_rows, **chunk_counts))
+            yield JSONResponse(status_code=200, content={'status': 'processing', 'message': SUCCESS_MESSAGE_FILE_UPLOAD_CHUNK.format(rows=total_rows), 'rows': total_rows, **counts})
 
         backlog_gen_ai_chat_logger.info(SUCCESS_MESSAGE_FILE_UPLOAD)
-        return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_FILE_UPLOAD})
-    except ParserError as pe:
+        yield JSONResponse(status_code=200, content={'status': 'done', 'message': SUCCESS_MESSAGE_FILE_UPLOAD, 'rows': total_rows, **counts})
+    except UploadValidationError as ve:
+        # 値の検証エラー
+        await db.rollback()
+        backlog_gen_ai_chat_logger.info(str(ve))
+        yield JSONResponse(status_code=400, content={'status': 'done', 'error': str(ve), 'rows': total_rows, **counts})
+    except DataStoreFileParseError as pe:
         # パーサーエラー
-        db.rollback()
-        pe_error_msg = ERROR_MESSAGE_PANDAS_PARSER_FAIL.format(reason=str(pe))
+        await db.rollback()
+        pe_error_msg = ERROR_MESSAGE_FILE_PARSER_FAIL.format(reason=str(pe))
         backlog_gen_ai_chat_logger.info(pe_error_msg)
-        return JSONResponse(status_code=400, content={"error": pe_error_msg})
+        yield JSONResponse(status_code=400, content={'status': 'done', 'error': pe_error_msg, 'rows': total_rows, **counts})
     except Exception as e:
         # 一般エラー
-        db.rollback()
+        await db.rollback()
         e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
         backlog_gen_ai_chat_logger.info(e_error_msg)
-        return JSONResponse(status_code=500, content={"error": e_error_msg})
+        yield JSONResponse(status_code=500, content={'status': 'done', 'error': e_error_msg, 'rows': total_rows, **counts})
+
+async def upsert_datastore_items(db: AsyncSession, items: list) -> dict:
+    """
+    SourceとTitleから作成したキーで、Datastoreテーブルに行をアップサートします。
+
+    チャンクのキーに一致する既存の行を1回のクエリでまとめて取得し、新しい行は複数行のINSERTで追加します。
+    内容のハッシュ値が変わった行は更新し、再度エンベディングを作成するようEmbedding済みフラグをFalseに戻します。
+    内容が変わっていない行は更新しません。同じキーの行がチャンク内に複数ある場合は、最後の行を使用します。
+
+    Parameters:
+    - db: 非同期のデータベースセッション (sqlalchemy.ext.asyncio.AsyncSession)
+    - items: 列名をキーとする行の辞書のリスト (list)
+
+    Returns:
+    - dict: 追加（inserted）、更新（updated）、変更なし（unchanged）の行数
+    """
+    items_by_row_key = {}
+    for item in items:
+        row_key = get_row_key(item)
+        items_by_row_key[row_key] = {**item, 'RowKey': row_key, 'ContentHash': get_content_hash(item)}
+
+    table = Datastore.__table__
+    rows = (await db.execute(select(table.c.RowKey, table.c.Id, table.c.ContentHash).where(table.c.RowKey.in_(list(items_by_row_key))))).all()
+    existing_rows = {row.RowKey: row for row in rows}
+
+    new_items = []
+    changed_items = []
+    for row_key, item in items_by_row_key.items():
+        existing_row = existing_rows.get(row_key)
+        if existing_row is None:
+            new_items.append(item)
+        elif existing_row.ContentHash != item['ContentHash']:
+            changed_items.append({**{column_name: item[column_name] for column_name in CONTENT_COLUMN_NAMES}, 'ContentHash': item['ContentHash'], 'b_Id': existing_row.Id})
+
+    if new_items:
+        await db.execute(table.insert(), new_items)
+    if changed_items:
+        update_values = {column_name: bindparam(column_name) for column_name in CONTENT_COLUMN_NAMES + ['ContentHash']}
+        await db.execute(table.update().where(table.c.Id == bindparam('b_Id')).values(IsUserForEmbedding=False, **update_values), changed_items)
+
+    return {'inserted': len(new_items), 'updated': len(changed_items), 'unchanged': len(items) - len(new_items) - len(changed_items)}
+
+def get_row_key(item: dict) -> str:
+    """
+    行を識別するキー（SourceとTitleのハッシュ値）を取得します。
+
+    Parameters:
+    - item: 列名をキーとする行の辞書 (dict)
+
+    Returns:
+    - str: 16進数のハッシュ値（SHA-256）
+    """
+    return _get_hash([item[column_name] for column_name in ROW_KEY_COLUMN_NAMES])
+
+def get_content_hash(item: dict) -> str:
+    """
+    行の内容（キー以外の列）のハッシュ値を取得します。
+
+    Parameters:
+    - item: 列名をキーとする行の辞書 (dict)
+
+    Returns:
+    - str: 16進数のハッシュ値（SHA-256）
+    """
+    return _get_hash([item[column_name] for column_name in CONTENT_COLUMN_NAMES])
+
+def _get_hash(values: list) -> str:
+    """
+    値のリストのハッシュ値を取得します。値の区切りが曖昧にならないよう、JSON配列にしてからハッシュ化します。
+    """
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def get_datastore_items(row_numbers: list, columns: dict) -> list:
+    """
+    チャンクの値を列ごとに検証し、Datastoreテーブルに挿入する行のリストを作成します。
+
+    値は文字列に変換し、空の値と、列の最大文字数を超える値はエラーとします。
+
+    Parameters:
+    - row_numbers: チャンクの各行の行番号のリスト (list)
+    - columns: 列名をキーとする値のリストの辞書 (dict)
+
+    Returns:
+    - list: 列名をキーとする行の辞書のリスト
+
+    Raises:
+    - UploadValidationError: 列が足りない場合、または値が不正な場合に発生
+    """
+    missing_column_names = [column_name for column_name in UPLOAD_COLUMN_NAMES if column_name not in columns]
+    if missing_column_names:
+        raise UploadValidationError(ERROR_MESSAGE_UPLOAD_MISSING_COLUMNS.format(columns=', '.join(missing_column_names)))
+
+    validated_columns = [_validate_column(column_name, columns[column_name], row_numbers) for column_name in UPLOAD_COLUMN_NAMES]
+    return [dict(zip(UPLOAD_COLUMN_NAMES, values), IsUserForEmbedding=False) for values in zip(*validated_columns)]
+
+def _validate_column(column_name: str, values: list, row_numbers: list) -> list:
+    """
+    1つの列の値を文字列に変換し、空の値と最大文字数を超える値がないことを確認します。
+
+    Parameters:
+    - column_name: 列名 (str)
+    - values: 列の値のリスト (list)
+    - row_numbers: 各値の行番号のリスト (list)
+
+    Returns:
+    - list: 文字列に変換した値のリスト
+
+    Raises:
+    - UploadValidationError: 値が不正な場合に発生
+    """
+    values = [None if value is None else str(value) for value in values]
+    if None in values:
+        raise UploadValidationError(ERROR_MESSAGE_UPLOAD_EMPTY_VALUE.format(column=column_name, row=row_numbers[values.index(None)]))
 
+    max_length = getattr(Datastore.__table__.columns[column_name].type, 'length', None)
+    if max_length is not None:
+        for row_number, value in zip(row_numbers, values):
+            if len(value) > max_length:
+                raise UploadValidationError(ERROR_MESSAGE_UPLOAD_VALUE_TOO_LONG.format(column=column_name, row=row_number, max_length=max_length))
+    return values
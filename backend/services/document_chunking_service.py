@@ -0,0 +1,155 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config.constant import (
+    DOCUMENT_CHUNK_SPLITTER,
+    DOCUMENT_CHUNK_SPLITTER_RECURSIVE,
+    DOCUMENT_CHUNK_SPLITTER_TOKEN,
+    DOCUMENT_CHUNK_SPLITTER_CHARACTER,
+    DOCUMENT_CHUNK_SIZE,
+    DOCUMENT_CHUNK_OVERLAP,
+    DOCUMENT_CHUNK_ENCODING_NAME,
+    DOCUMENT_CHUNK_CATEGORY_SETTINGS,
+    DOCUMENT_CHUNK_WORKERS,
+    DOCUMENT_CHUNK_TASK_DOCUMENTS,
+    ERROR_MESSAGE_UNSUPPORTED_CHUNK_SPLITTER)
+from functools import lru_cache
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TokenTextSplitter
+import multiprocessing
+import os
+import threading
+
+# ドキュメントの分割を並行して実行するための、プロセス全体で共有するプロセスプール
+_chunking_executor = None
+_chunking_executor_lock = threading.Lock()
+
+def get_chunking_settings(category) -> tuple:
+    """
+    Categoryの分割の設定を取得します。DOCUMENT_CHUNK_CATEGORY_SETTINGSに指定されていない項目は既定値を使用します。
+
+    Arguments:
+        category {str} -- データのCategory
+
+    Returns:
+        tuple -- 分割方法、チャンクのサイズ、チャンクの重複、エンコーディング名
+    """
+    settings = DOCUMENT_CHUNK_CATEGORY_SETTINGS.get(category, {})
+    return (
+        settings.get('splitter', DOCUMENT_CHUNK_SPLITTER),
+        int(settings.get('chunk_size', DOCUMENT_CHUNK_SIZE)),
+        int(settings.get('chunk_overlap', DOCUMENT_CHUNK_OVERLAP)),
+        settings.get('encoding_name', DOCUMENT_CHUNK_ENCODING_NAME))
+
+def get_configured_chunking_settings() -> list:
+    """
+    既定値と、DOCUMENT_CHUNK_CATEGORY_SETTINGSのすべてのCategoryの分割の設定を取得します。
+
+    Returns:
+        List[tuple] -- 重複を除いた分割の設定のリスト
+    """
+    return list(dict.fromkeys([get_chunking_settings(None)] + [get_chunking_settings(category) for category in DOCUMENT_CHUNK_CATEGORY_SETTINGS]))
+
+@lru_cache(maxsize=None)
+def get_text_splitter(splitter: str, chunk_size: int, chunk_overlap: int, encoding_name: str):
+    """
+    分割の設定に対応するテキストスプリッターを取得します。設定ごとに初回のみ作成し、以降は同じインスタンスを返します。
+
+    Arguments:
+        splitter {str} -- 分割方法（DOCUMENT_CHUNK_SPLITTER_*）
+        chunk_size {int} -- チャンクのサイズ
+        chunk_overlap {int} -- チャンクの重複
+        encoding_name {str} -- トークン数の計算に使用するエンコーディング名
+
+    Returns:
+        TextSplitter -- テキストスプリッター
+
+    Raises:
+        ValueError: 分割方法が不正な場合に発生
+    """
+    if splitter == DOCUMENT_CHUNK_SPLITTER_RECURSIVE:
+        return RecursiveCharacterTextSplitter.from_tiktoken_encoder(encoding_name=encoding_name, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if splitter == DOCUMENT_CHUNK_SPLITTER_TOKEN:
+        return TokenTextSplitter(encoding_name=encoding_name, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if splitter == DOCUMENT_CHUNK_SPLITTER_CHARACTER:
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raise ValueError(ERROR_MESSAGE_UNSUPPORTED_CHUNK_SPLITTER.format(splitter=splitter))
+
+def split_documents(tasks) -> list:
+    """
+    ドキュメントを、それぞれの分割の設定でチャンクに分割します。プロセスプールのワーカーで実行されます。
+
+    Arguments:
+        tasks {List[Tuple[Document, tuple]]} -- ドキュメントと分割の設定のリスト
+
+    Returns:
+        List[Document] -- ドキュメントの順序どおりのチャンクのリスト
+    """
+    chunks = []
+    for document, settings in tasks:
+        chunks.extend(get_text_splitter(*settings).split_documents([document]))
+    return chunks
+
+def iter_document_chunks(documents):
+    """
+    ドキュメントをCategoryごとの設定でチャンクに分割し、DOCUMENT_CHUNK_TASK_DOCUMENTS件のドキュメントごとにチャンクのリストを返します。
+
+    タスクが複数ある場合はプロセスプールで並行して分割し、完了したタスクから順に（ドキュメントの順序どおりに）返すため、
+    すべてのチャンクの分割を待たずに次の処理を開始できます。DOCUMENT_CHUNK_WORKERSが1の場合は、このプロセスで分割します。
+
+    Arguments:
+        documents {List[Document]} -- メタデータにCategoryを含むドキュメントのリスト
+
+    Yields:
+        List[Document] -- タスクごとのチャンクのリスト
+    """
+    tasks = [(document, get_chunking_settings(document.metadata.get('Category'))) for document in documents]
+    task_batches = [tasks[index:index + DOCUMENT_CHUNK_TASK_DOCUMENTS] for index in range(0, len(tasks), DOCUMENT_CHUNK_TASK_DOCUMENTS)]
+    if DOCUMENT_CHUNK_WORKERS == 1 or len(task_batches) <= 1:
+        for task_batch in task_batches:
+            yield split_documents(task_batch)
+        return
+
+    try:
+        yield from get_chunking_executor().map(split_documents, task_batches)
+    except BrokenProcessPool:
+        # ワーカーが異常終了したプロセスプールは再利用できないため、次回は新しく作成する
+        shutdown_chunking_executor()
+        raise
+
+def get_chunking_executor() -> ProcessPoolExecutor:
+    """
+    ドキュメントの分割に使用するプロセスプールを取得します。初回のみ作成します。
+
+    プロセス数はDOCUMENT_CHUNK_WORKERS（0の場合はCPUコア数）です。tiktokenによる分割はCPUを多く使用するため、
+    GILの影響を受けないプロセスで実行します。各ワーカーは起動時に、設定されているすべてのテキストスプリッター（エンコーダー）を読み込みます。
+    スレッドを使用しているプロセスからforkしないよう、spawnでワーカーを起動します。
+
+    Returns:
+        ProcessPoolExecutor -- プロセスプール
+    """
+    global _chunking_executor
+    if _chunking_executor is None:
+        with _chunking_executor_lock:
+            if _chunking_executor is None:
+                _chunking_executor = ProcessPoolExecutor(
+                    max_workers=DOCUMENT_CHUNK_WORKERS or os.cpu_count(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_chunking_worker,
+                    initargs=(get_configured_chunking_settings(),))
+    return _chunking_executor
+
+def shutdown_chunking_executor():
+    """
+    ドキュメントの分割に使用するプロセスプールを終了します。アプリケーションの終了時に呼び出されることを想定しています。
+    """
+    global _chunking_executor
+    with _chunking_executor_lock:
+        executor, _chunking_executor = _chunking_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _init_chunking_worker(settings_list):
+    """
+    プロセスプールのワーカーの起動時に、テキストスプリッターとエンコーダーを読み込みます。
+    """
+    for settings in settings_list:
+        get_text_splitter(*settings)
@@ -0,0 +1,114 @@
+from sqlalchemy.orm import Session
+from models.embedding_cache import EmbeddingCache
+from config.constant import (
+    EMBEDDING_CACHE_QUERY_BATCH_SIZE,
+    LOG_MESSAGE_EMBEDDING_CACHE)
+from config import logger
+import hashlib
+import numpy as np
+from utils.database import get_insert_ignore_statement
+from services.embedding_pipeline_service import embed_texts_concurrently
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+def get_text_hash(text: str) -> str:
+    """
+    チャンクのテキストのハッシュ値（SHA-256）を取得します。
+
+    Arguments:
+        text {str} -- チャンクのテキスト
+
+    Returns:
+        str -- 16進数のハッシュ値
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get_cached_embeddings(db: Session, model_name: str, text_hashes) -> dict:
+    """
+    キャッシュからテキストのハッシュ値に対応するベクトルを取得します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        model_name {str} -- 埋め込みモデル名
+        text_hashes {List[str]} -- テキストのハッシュ値のリスト
+
+    Returns:
+        dict -- ハッシュ値をキー、ベクトル（List[float]）を値とする辞書（キャッシュにないハッシュ値は含まない）
+    """
+    cached_embeddings = {}
+    unique_text_hashes = list(set(text_hashes))
+    for start in range(0, len(unique_text_hashes), EMBEDDING_CACHE_QUERY_BATCH_SIZE):
+        rows = db.query(EmbeddingCache.TextHash, EmbeddingCache.Vector).filter(
+            EmbeddingCache.ModelName == model_name,
+            EmbeddingCache.TextHash.in_(unique_text_hashes[start:start + EMBEDDING_CACHE_QUERY_BATCH_SIZE])).all()
+        for text_hash, vector in rows:
+            cached_embeddings[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+    return cached_embeddings
+
+def save_cached_embeddings(db: Session, model_name: str, embeddings: dict):
+    """
+    ベクトルをfloat32のバイト列としてキャッシュに保存します。
+
+    埋め込みの作成ジョブと他の処理が同じテキストを同時にベクトル化した場合も失敗しないよう、保存済みのハッシュ値は無視します。
+    呼び出し元のトランザクションが後で失敗しても作成したベクトルが失われないよう、別の短いトランザクションでコミットします。
+    SQLiteは同時に1つの接続しか書き込めず、書き込み中の呼び出し元のトランザクションを待ち続けてしまうため、呼び出し元のトランザクションで保存します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        model_name {str} -- 埋め込みモデル名
+        embeddings {dict} -- ハッシュ値をキー、ベクトル（List[float]）を値とする辞書
+    """
+    if not embeddings:
+        return
+    bind = db.get_bind()
+    statement = get_insert_ignore_statement(bind.dialect.name, EmbeddingCache.__table__)
+    rows = [
+        {"ModelName": model_name, "TextHash": text_hash, "Vector": np.asarray(vector, dtype=np.float32).tobytes()}
+        for text_hash, vector in embeddings.items()
+    ]
+    if bind.dialect.name == 'sqlite':
+        db.execute(statement, rows)
+        return
+    with Session(bind=bind) as cache_db, cache_db.begin():
+        cache_db.execute(statement, rows)
+
+def embed_documents_with_cache(db: Session, embedding_model, texts):
+    """
+    キャッシュを確認し、キャッシュにないテキストのみ埋め込みモデルでベクトル化します。
+
+    キャッシュにないテキストは、トークン数で分けたバッチごとに並行してベクトル化し、キャッシュに保存します。
+    同じテキストが複数ある場合は1回だけベクトル化します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+        texts {List[str]} -- チャンクのテキストのリスト
+
+    Returns:
+        Tuple[List[List[float]], dict] -- テキストと同じ順序のベクトルのリストと、キャッシュのヒット数・ミス数・ヒット率、Embedding APIでベクトル化したトークン数
+    """
+    model_name = embedding_model.model
+    text_hashes = [get_text_hash(text) for text in texts]
+    embeddings = get_cached_embeddings(db, model_name, text_hashes)
+    hits = sum(1 for text_hash in text_hashes if text_hash in embeddings)
+
+    # キャッシュにないテキストのみEmbedding APIを呼び出す
+    missed_texts = {}
+    tokens = 0
+    for text_hash, text in zip(text_hashes, texts):
+        if text_hash not in embeddings:
+            missed_texts[text_hash] = text
+    if missed_texts:
+        missed_vectors, tokens = embed_texts_concurrently(embedding_model, list(missed_texts.values()))
+        new_embeddings = dict(zip(missed_texts.keys(), missed_vectors))
+        save_cached_embeddings(db, model_name, new_embeddings)
+        embeddings.update(new_embeddings)
+
+    cache_stats = {
+        "hits": hits,
+        "misses": len(texts) - hits,
+        "hit_rate": round(hits / len(texts), 4) if texts else 0,
+        "tokens": tokens,
+    }
+    backlog_gen_ai_chat_logger.info(LOG_MESSAGE_EMBEDDING_CACHE.format(**cache_stats))
+    return [embeddings[text_hash] for text_hash in text_hashes], cache_stats
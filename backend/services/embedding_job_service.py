@@ -0,0 +1,642 @@
+from fastapi.responses import JSONResponse
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models.data_store import Datastore
+from models.embedding_job import EmbeddingJob
+from config.constant import (
+    EMBEDDING_JOB_BATCH_ROWS,
+    EMBEDDING_JOB_REFRESH_BATCHES,
+    EMBEDDING_JOB_ACTIVE_KEY,
+    EMBEDDING_JOB_LEASE_SECONDS,
+    EMBEDDING_JOB_WATCH_SECONDS,
+    EMBEDDING_JOB_STATUS_QUEUED,
+    EMBEDDING_JOB_STATUS_RUNNING,
+    EMBEDDING_JOB_STATUS_COMPLETED,
+    EMBEDDING_JOB_STATUS_CANCELLED,
+    EMBEDDING_JOB_STATUS_FAILED,
+    ERROR_MESSAGE_GENERAL,
+    ERROR_MESSAGE_EMBEDDING_JOB_RUNNING,
+    ERROR_MESSAGE_EMBEDDING_JOB_NOT_FOUND,
+    SUCCESS_MESSAGE_EMBEDDING_JOB_SUBMITTED,
+    SUCCESS_MESSAGE_EMBEDDING_JOB_CANCEL_REQUESTED,
+    SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION,
+    LOG_MESSAGE_EMBEDDING_JOB_BATCH,
+    LOG_MESSAGE_EMBEDDING_JOB_FINISHED)
+from config import logger
+import os
+import socket
+import threading
+import time
+import uuid
+from utils.utils import (
+    get_embeddings_folder_path,
+    get_embedding_model,
+    get_random_uuid_name,
+    remove_embedding_index_files,
+    publish_embedding_version,
+    update_deleted_embedding_ids)
+from services.vector_store_service import refresh_vector_store
+from services.embedding_vector_service import get_deleted_datastore_ids, get_embedding_ids, replace_embedding_vectors
+from services.embedding_service import create_documents, embed_document_chunks, create_embeddings
+from services.document_chunking_service import iter_document_chunks
+from services.compaction_service import compact_embedding_if_needed
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+# 実行中のジョブの状態
+ACTIVE_EMBEDDING_JOB_STATUSES = (EMBEDDING_JOB_STATUS_QUEUED, EMBEDDING_JOB_STATUS_RUNNING)
+
+# ジョブを1つずつ順番に実行するワーカースレッド
+_embedding_job_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding-job')
+
+# アプリケーションの終了時に、実行中のジョブをバッチの区切りで中断するためのイベント
+_embedding_job_shutdown_event = threading.Event()
+
+# このワーカープロセスを表すジョブの所有者名。複数のワーカープロセスが同じジョブを実行しないよう、ジョブを占有する際に記録する
+_embedding_job_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class EmbeddingJobLeaseLostError(Exception):
+    """
+    占有期間が切れ、ジョブが他のワーカープロセスに引き継がれたことを表す例外です。
+    """
+
+def submit_embedding_job(db: Session, session_factory: sessionmaker) -> JSONResponse:
+    """
+    埋め込みの作成ジョブを登録し、ワーカースレッドで実行します。
+
+    実行中（待機中を含む）のジョブがある場合は、新しいジョブを登録せずにそのジョブのIDを返します。
+    実行中のジョブは、すべてのワーカープロセスを通して1つだけです。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        session_factory {sessionmaker} -- ワーカースレッドで使用するデータベースのセッションを作成するファクトリ
+
+    Returns:
+        JSONResponse -- ジョブのIDと状態を含むJSONレスポンス
+    """
+    backlog_gen_ai_chat_logger.info('#### Action: submit_embedding_job ####')
+    try:
+        progress, active_progress = create_embedding_job(db)
+        if progress is None:
+            backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_EMBEDDING_JOB_RUNNING)
+            return JSONResponse(status_code=409, content={"error": ERROR_MESSAGE_EMBEDDING_JOB_RUNNING, "job": active_progress})
+
+        _embedding_job_executor.submit(run_embedding_job, progress['job_id'], session_factory)
+        return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_EMBEDDING_JOB_SUBMITTED, "job": progress})
+
+    except Exception as e:
+        db.rollback()
+        e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
+        backlog_gen_ai_chat_logger.info(e_error_msg)
+        return JSONResponse(status_code=500, content={"error": e_error_msg})
+
+def run_embedding_job_now(db: Session, session_factory: sessionmaker) -> JSONResponse:
+    """
+    埋め込みの作成ジョブを登録し、完了するまで呼び出し元のスレッドで実行します。
+
+    ジョブとして実行するため、ワーカースレッドで実行中のジョブや他のワーカープロセスのジョブと同時には実行されません。
+    実行中のジョブがある場合は、実行せずにそのジョブのIDを返します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        session_factory {sessionmaker} -- ジョブの実行に使用するデータベースのセッションを作成するファクトリ
+
+    Returns:
+        JSONResponse -- 成功または失敗を示すメッセージと、ベクトルの変更とキャッシュの統計情報、ジョブの進捗を含むJSONレスポンス
+    """
+    backlog_gen_ai_chat_logger.info('#### Action: run_embedding_job_now ####')
+    try:
+        progress, active_progress = create_embedding_job(db)
+        if progress is None:
+            backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_EMBEDDING_JOB_RUNNING)
+            return JSONResponse(status_code=409, content={"error": ERROR_MESSAGE_EMBEDDING_JOB_RUNNING, "job": active_progress})
+
+        run_embedding_job(progress['job_id'], session_factory)
+        with db.begin():
+            progress = get_embedding_job_progress(db.get(EmbeddingJob, progress['job_id']))
+        if progress['status'] == EMBEDDING_JOB_STATUS_FAILED:
+            return JSONResponse(status_code=500, content={"error": progress['error'], "job": progress})
+        return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION, "sync": progress['sync'], "cache": progress['cache'], "job": progress})
+
+    except Exception as e:
+        db.rollback()
+        e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
+        backlog_gen_ai_chat_logger.info(e_error_msg)
+        return JSONResponse(status_code=500, content={"error": e_error_msg})
+
+def create_embedding_job(db: Session):
+    """
+    このワーカープロセスが占有した状態で、待機中のジョブを登録します。
+
+    実行中のジョブにのみ設定するActiveKeyの一意制約により、複数のワーカープロセスから同時に登録されても、登録できるジョブは1つだけです。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+
+    Returns:
+        Tuple[dict, dict] -- 登録したジョブの進捗（登録できなかった場合はNone）と、実行中のジョブの進捗（登録できた場合はNone）
+    """
+    active_progress = None
+    # 実行中のジョブを確認する間にジョブが終了した場合は、もう一度登録する
+    for _ in range(2):
+        try:
+            with db.begin():
+                now = datetime.now()
+                job = EmbeddingJob(Id=str(uuid.uuid4()), Status=EMBEDDING_JOB_STATUS_QUEUED, CancelRequested=False, ActiveKey=EMBEDDING_JOB_ACTIVE_KEY, Owner=_embedding_job_owner, HeartbeatAt=now)
+                db.add(job)
+                db.flush()
+                return get_embedding_job_progress(job), None
+        except IntegrityError:
+            with db.begin():
+                active_job = db.query(EmbeddingJob).filter(EmbeddingJob.ActiveKey == EMBEDDING_JOB_ACTIVE_KEY).first()
+                if active_job is not None:
+                    active_progress = get_embedding_job_progress(active_job)
+                    break
+    return None, active_progress
+
+def get_embedding_job(job_id: str, db: Session) -> JSONResponse:
+    """
+    埋め込みの作成ジョブの進捗（行数、チャンク数、トークン数、経過時間、残り時間の見込み）を取得します。
+
+    Arguments:
+        job_id {str} -- ジョブのID
+        db {Session} -- SQLAlchemyデータベースセッション
+
+    Returns:
+        JSONResponse -- ジョブの進捗を含むJSONレスポンス
+    """
+    try:
+        with db.begin():
+            job = db.get(EmbeddingJob, job_id)
+            if job is None:
+                return JSONResponse(status_code=404, content={"error": ERROR_MESSAGE_EMBEDDING_JOB_NOT_FOUND.format(id=job_id)})
+            return JSONResponse(status_code=200, content={"job": get_embedding_job_progress(job)})
+
+    except Exception as e:
+        db.rollback()
+        e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
+        backlog_gen_ai_chat_logger.info(e_error_msg)
+        return JSONResponse(status_code=500, content={"error": e_error_msg})
+
+def cancel_embedding_job(job_id: str, db: Session) -> JSONResponse:
+    """
+    埋め込みの作成ジョブのキャンセルを要求します。
+
+    ワーカースレッドは実行中のバッチを完了してからジョブを終了するため、処理済みのバッチの結果は残ります。
+    終了済みのジョブの場合は、何もせずに現在の状態を返します。
+
+    Arguments:
+        job_id {str} -- ジョブのID
+        db {Session} -- SQLAlchemyデータベースセッション
+
+    Returns:
+        JSONResponse -- ジョブの進捗を含むJSONレスポンス
+    """
+    backlog_gen_ai_chat_logger.info('#### Action: cancel_embedding_job ####')
+    try:
+        with db.begin():
+            job = db.get(EmbeddingJob, job_id)
+            if job is None:
+                return JSONResponse(status_code=404, content={"error": ERROR_MESSAGE_EMBEDDING_JOB_NOT_FOUND.format(id=job_id)})
+            if job.Status in ACTIVE_EMBEDDING_JOB_STATUSES:
+                job.CancelRequested = True
+            db.flush()
+            return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_EMBEDDING_JOB_CANCEL_REQUESTED, "job": get_embedding_job_progress(job)})
+
+    except Exception as e:
+        db.rollback()
+        e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
+        backlog_gen_ai_chat_logger.info(e_error_msg)
+        return JSONResponse(status_code=500, content={"error": e_error_msg})
+
+def resume_embedding_jobs(session_factory: sessionmaker):
+    """
+    アプリケーションの再起動などで中断された、実行中（待機中を含む）のジョブを再開します。
+
+    ジョブは最後にコミットしたバッチの次の行から再開します。アプリケーションの起動時に呼び出されることを想定しています。
+    すべてのワーカープロセスが呼び出しますが、ジョブを実行するのは占有できた1つのワーカープロセスだけです。
+    起動後も、占有期間が切れたジョブ（実行していたワーカープロセスが異常終了したジョブ）がないかを定期的に確認して引き継ぎます。
+
+    Arguments:
+        session_factory {sessionmaker} -- データベースのセッションを作成するファクトリ
+    """
+    _embedding_job_shutdown_event.clear()
+    submit_claimable_embedding_jobs(session_factory)
+    threading.Thread(target=_watch_embedding_jobs, args=(session_factory,), daemon=True, name='embedding-job-watcher').start()
+
+def submit_claimable_embedding_jobs(session_factory: sessionmaker):
+    """
+    占有されていない、または占有期間が切れた実行中（待機中を含む）のジョブを、ワーカースレッドで実行します。
+
+    Arguments:
+        session_factory {sessionmaker} -- データベースのセッションを作成するファクトリ
+    """
+    db = session_factory()
+    try:
+        with db.begin():
+            job_ids = [job_id for job_id, in db.query(EmbeddingJob.Id).filter(EmbeddingJob.Status.in_(ACTIVE_EMBEDDING_JOB_STATUSES), get_claimable_condition()).order_by(EmbeddingJob.CreateDate)]
+    except Exception as e:
+        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_GENERAL.format(reason=str(e)))
+        return
+    finally:
+        db.close()
+    for job_id in job_ids:
+        _embedding_job_executor.submit(run_embedding_job, job_id, session_factory)
+
+def _watch_embedding_jobs(session_factory: sessionmaker):
+    """
+    アプリケーションの終了まで、EMBEDDING_JOB_WATCH_SECONDSごとに占有期間が切れたジョブを確認して引き継ぎます。
+    """
+    while not _embedding_job_shutdown_event.wait(EMBEDDING_JOB_WATCH_SECONDS):
+        submit_claimable_embedding_jobs(session_factory)
+
+def shutdown_embedding_jobs():
+    """
+    実行中のジョブを、実行中のバッチの完了後に中断します。中断したジョブは次回の起動時に再開されます。
+
+    アプリケーションの終了時に呼び出されることを想定しています。
+    """
+    _embedding_job_shutdown_event.set()
+
+def run_embedding_job(job_id: str, session_factory: sessionmaker):
+    """
+    埋め込みの作成ジョブを実行します。
+
+    この関数は以下の処理を行います。
+    1. 前回の実行がバッチの途中で中断された場合は、コミットされなかったインデックスファイルを削除する
+    2. データストアから削除されたデータの古いベクトルを削除済みとして登録する
+    3. Embedding済みフラグがFalseのデータをチェックポイント（処理済みの最後のID）の次からyield_perで少しずつ読み込み、
+       EMBEDDING_JOB_BATCH_ROWS行のバッチごとに埋め込みを作成してコミットする
+    4. バッチの区切りでキャンセルの要求とアプリケーションの終了を確認し、占有期間を延長する
+       （アプリケーションの終了時は、処理が残っている場合のみ占有を解除して実行中のまま残し、すべての行を処理した場合は完了にする）
+    5. EMBEDDING_JOB_REFRESH_BATCHESバッチごとと終了時に、結果をベクトルストアに反映してコンパクションの要否を確認する
+
+    ジョブは最初に条件付きのUPDATEで占有し、他のワーカープロセスが占有している場合は何もしません。
+    バッチのコミット時に占有し続けていることを確認するため、占有期間が切れて他のワーカープロセスに引き継がれた場合は、
+    そのバッチをロールバックして終了します。
+
+    Arguments:
+        job_id {str} -- ジョブのID
+        session_factory {sessionmaker} -- データベースのセッションを作成するファクトリ
+    """
+    db = session_factory()
+    try:
+        if not claim_embedding_job(db, job_id):
+            return
+    except Exception as e:
+        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_GENERAL.format(reason=str(e)))
+        db.close()
+        return
+
+    read_db = session_factory()
+    status = EMBEDDING_JOB_STATUS_FAILED
+    error = None
+    embeddings_folder_path = None
+    # ベクトルストアにまだ反映していない、コミット済みのバッチ数
+    pending_batches = 0
+    try:
+        embeddings_folder_path = get_embeddings_folder_path()
+        with db.begin():
+            job = db.get(EmbeddingJob, job_id)
+            if job.CancelRequested:
+                status = EMBEDDING_JOB_STATUS_CANCELLED
+                return
+            if job.PendingIndexName:
+                remove_embedding_index_files(embeddings_folder_path, job.PendingIndexName)
+                job.PendingIndexName = None
+            remaining_rows = db.query(func.count(Datastore.Id)).filter(Datastore.IsUserForEmbedding == False, Datastore.Id > job.LastDatastoreId).scalar()
+            job.Status = EMBEDDING_JOB_STATUS_RUNNING
+            job.TotalRows = job.ProcessedRows + remaining_rows
+            job.UpdateDate = datetime.now()
+            last_datastore_id = job.LastDatastoreId
+
+        if retire_deleted_datastore_vectors(db, job_id, embeddings_folder_path):
+            pending_batches += 1
+
+        # 書き込み用のセッションでバッチごとにコミットしても読み込みが中断されないよう、読み込みには別のセッションを使用する
+        statement = select(Datastore).where(Datastore.IsUserForEmbedding == False, Datastore.Id > last_datastore_id).order_by(Datastore.Id).execution_options(yield_per=EMBEDDING_JOB_BATCH_ROWS)
+        with read_db.begin():
+            for data_store in read_db.scalars(statement).partitions():
+                if _embedding_job_shutdown_event.is_set():
+                    # 状態は実行中のままにし、占有を解除して次回の起動時（または他のワーカープロセス）に再開する
+                    return
+                if is_embedding_job_cancel_requested(db, job_id):
+                    status = EMBEDDING_JOB_STATUS_CANCELLED
+                    return
+                process_embedding_job_batch(db, job_id, data_store, embeddings_folder_path)
+                pending_batches += 1
+                if pending_batches >= EMBEDDING_JOB_REFRESH_BATCHES:
+                    publish_embedding_job_results(embeddings_folder_path)
+                    pending_batches = 0
+
+        status = EMBEDDING_JOB_STATUS_COMPLETED
+
+    except EmbeddingJobLeaseLostError:
+        # 引き継いだワーカープロセスが続きを実行する（終了状態への更新も、占有していないため行われない）
+        db.rollback()
+        return
+
+    except Exception as e:
+        db.rollback()
+        error = ERROR_MESSAGE_GENERAL.format(reason=str(e))
+        backlog_gen_ai_chat_logger.info(error)
+
+    finally:
+        read_db.close()
+        if pending_batches:
+            # 中断や失敗で終了する場合も、コミット済みのバッチの結果は反映する
+            try:
+                publish_embedding_job_results(embeddings_folder_path)
+            except Exception as e:
+                backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_GENERAL.format(reason=str(e)))
+        if _embedding_job_shutdown_event.is_set() and status == EMBEDDING_JOB_STATUS_FAILED:
+            # 終了時に処理が残っているジョブは、失敗にせず占有を解除する（すべての行を処理したジョブとキャンセルされたジョブは終了させる）
+            try:
+                release_embedding_job(db, job_id)
+            except Exception as e:
+                db.rollback()
+                backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_GENERAL.format(reason=str(e)))
+        else:
+            finish_embedding_job(db, job_id, status, error)
+        db.close()
+
+def publish_embedding_job_results(embeddings_folder_path: str):
+    """
+    コミット済みのバッチの結果を常駐しているベクトルストアに反映し、他のワーカープロセスに更新を知らせます。
+
+    反映はバッチごとではなくEMBEDDING_JOB_REFRESH_BATCHESバッチごとに行います。インデックスファイル数や削除済みのベクトル数が
+    ジョブの途中でしきい値を大きく超えないよう、反映するたびにコンパクションの要否を確認します。
+
+    Arguments:
+        embeddings_folder_path {str} -- 埋め込みフォルダのパス
+    """
+    refresh_vector_store(update_index_files=lambda: publish_embedding_version(embeddings_folder_path))
+    compact_embedding_if_needed()
+
+def process_embedding_job_batch(db: Session, job_id: str, data_store, embeddings_folder_path: str):
+    """
+    1つのバッチのデータの埋め込みを作成し、ベクトルとデータの対応、Embedding済みフラグ、ジョブのチェックポイントを1つのトランザクションでコミットします。
+
+    ドキュメントの分割、ベクトル化、インデックスの書き込みはウェーブごとに順に行い、バッチのチャンクとベクトルをまとめて保持しません。
+    インデックスファイルを書き込む前にインデックス名（各ウェーブのインデックスは、その名前に「_連番」を付けた名前）をジョブに記録するため、
+    コミットの前に中断された場合は、再開時にそのインデックスファイルを削除してバッチを最初から処理し直します。
+
+    Arguments:
+        db {Session} -- 書き込み用のSQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+        data_store {List[Datastore]} -- バッチのデータのリスト
+        embeddings_folder_path {str} -- 埋め込みフォルダのパス
+    """
+    start_time = time.monotonic()
+    index_name = get_random_uuid_name()
+    with db.begin():
+        update_owned_embedding_job(db, job_id, PendingIndexName=index_name)
+
+    try:
+        with db.begin():
+            removed_embedding_ids = get_embedding_ids(db, [data.Id for data in data_store])
+            replace_embedding_vectors(db, removed_embedding_ids, [])
+
+            # プロセスプールで分割が完了したチャンクから順にベクトル化し、ウェーブごとにインデックスを書き込む
+            embedding_model = get_embedding_model()
+            chunk_count = 0
+            tokens = 0
+            cache_hits = 0
+            cache_misses = 0
+            wave_chunks = embed_document_chunks(db, embedding_model, iter_document_chunks(create_documents(data_store)))
+            for wave_number, (chunks, vectors, cache_stats) in enumerate(wave_chunks):
+                records = create_embeddings(chunks, vectors, embedding_model, embeddings_folder_path, f"{index_name}_{wave_number}")
+                replace_embedding_vectors(db, [], records)
+                chunk_count += len(chunks)
+                # バッチ分けの際に数えた、キャッシュにないチャンクのトークン数（キャッシュのヒットは含まない）
+                tokens += cache_stats.get("tokens", 0)
+                cache_hits += cache_stats.get("hits", 0)
+                cache_misses += cache_stats.get("misses", 0)
+            mark_data_store_embedded(db, data_store)
+
+            # 占有し続けている場合のみチェックポイントを更新する（引き継がれていた場合はバッチ全体をロールバックする）
+            update_owned_embedding_job(
+                db, job_id,
+                ProcessedRows=EmbeddingJob.ProcessedRows + len(data_store),
+                ProcessedChunks=EmbeddingJob.ProcessedChunks + chunk_count,
+                ProcessedTokens=EmbeddingJob.ProcessedTokens + tokens,
+                CacheHits=EmbeddingJob.CacheHits + cache_hits,
+                CacheMisses=EmbeddingJob.CacheMisses + cache_misses,
+                RemovedVectors=EmbeddingJob.RemovedVectors + len(removed_embedding_ids),
+                ElapsedSeconds=EmbeddingJob.ElapsedSeconds + (time.monotonic() - start_time),
+                LastDatastoreId=data_store[-1].Id,
+                PendingIndexName=None)
+            # データベースから古いベクトルのIDが消えた後で登録に失敗し、検索結果に残り続けることがないよう、コミットの前に削除済みとして登録する
+            if removed_embedding_ids:
+                update_deleted_embedding_ids(embeddings_folder_path, added_ids=removed_embedding_ids)
+            processed_rows, total_rows = db.query(EmbeddingJob.ProcessedRows, EmbeddingJob.TotalRows).filter(EmbeddingJob.Id == job_id).one()
+            log_message = LOG_MESSAGE_EMBEDDING_JOB_BATCH.format(job_id=job_id, rows=len(data_store), chunks=chunk_count, tokens=tokens, processed_rows=processed_rows, total_rows=total_rows)
+    except Exception:
+        remove_embedding_index_files(embeddings_folder_path, index_name)
+        raise
+
+    backlog_gen_ai_chat_logger.info(log_message)
+
+def retire_deleted_datastore_vectors(db: Session, job_id: str, embeddings_folder_path: str):
+    """
+    データストアから削除されたデータの古いベクトルを削除済みとして登録し、削除されたデータ数とベクトル数をジョブに記録します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+        embeddings_folder_path {str} -- 埋め込みフォルダのパス
+
+    Returns:
+        bool -- 削除済みとして登録したベクトルがある場合はTrue
+    """
+    with db.begin():
+        deleted_datastore_ids = get_deleted_datastore_ids(db)
+        removed_embedding_ids = get_embedding_ids(db, deleted_datastore_ids)
+        replace_embedding_vectors(db, removed_embedding_ids, [])
+        if deleted_datastore_ids:
+            update_owned_embedding_job(
+                db, job_id,
+                DeletedRows=EmbeddingJob.DeletedRows + len(deleted_datastore_ids),
+                RemovedVectors=EmbeddingJob.RemovedVectors + len(removed_embedding_ids))
+        # データベースから古いベクトルのIDが消えた後で登録に失敗し、検索結果に残り続けることがないよう、コミットの前に削除済みとして登録する
+        if removed_embedding_ids:
+            update_deleted_embedding_ids(embeddings_folder_path, added_ids=removed_embedding_ids)
+    return bool(removed_embedding_ids)
+
+def mark_data_store_embedded(db: Session, data_store):
+    """
+    バッチのデータのEmbedding済みフラグをTrueにします。
+
+    読み込んだ後にアップロードで内容が変更されたデータは、次回のジョブで埋め込みを作り直すよう、フラグを変更しません。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        data_store {List[Datastore]} -- バッチのデータのリスト
+    """
+    db.execute(
+        update(Datastore.__table__)
+        .where(Datastore.Id == bindparam('b_Id'), Datastore.ContentHash.is_not_distinct_from(bindparam('b_ContentHash')))
+        .values(IsUserForEmbedding=True),
+        [{'b_Id': data.Id, 'b_ContentHash': data.ContentHash} for data in data_store])
+
+def claim_embedding_job(db: Session, job_id: str) -> bool:
+    """
+    条件付きのUPDATEで、実行中（待機中を含む）のジョブをこのワーカープロセスで占有します。
+
+    ジョブがこのワーカープロセスで占有されている場合、占有されていない場合、または占有期間が切れている場合のみ占有できます。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+
+    Returns:
+        bool -- 占有できた場合はTrue
+    """
+    now = datetime.now()
+    with db.begin():
+        result = db.execute(
+            update(EmbeddingJob)
+            .where(EmbeddingJob.Id == job_id, EmbeddingJob.Status.in_(ACTIVE_EMBEDDING_JOB_STATUSES), or_(EmbeddingJob.Owner == _embedding_job_owner, get_claimable_condition(now)))
+            .values(Owner=_embedding_job_owner, HeartbeatAt=now, UpdateDate=now)
+            .execution_options(synchronize_session=False))
+        return result.rowcount == 1
+
+def get_claimable_condition(now: datetime = None):
+    """
+    ジョブが占有されていない、または占有期間が切れていることを表す条件を取得します。
+
+    Arguments:
+        now {datetime} -- 現在の日時（省略時は現在の日時）
+
+    Returns:
+        ColumnElement -- SQLAlchemyの条件式
+    """
+    now = now or datetime.now()
+    return or_(EmbeddingJob.Owner.is_(None), EmbeddingJob.HeartbeatAt < now - timedelta(seconds=EMBEDDING_JOB_LEASE_SECONDS))
+
+def update_owned_embedding_job(db: Session, job_id: str, **values):
+    """
+    このワーカープロセスが占有している場合のみジョブを更新し、占有期間を延長します。呼び出し元でトランザクションを開始していること。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+        values {dict} -- 更新する列と値
+
+    Raises:
+        EmbeddingJobLeaseLostError: ジョブが他のワーカープロセスに引き継がれていた場合に発生
+    """
+    now = datetime.now()
+    result = db.execute(
+        update(EmbeddingJob)
+        .where(EmbeddingJob.Id == job_id, EmbeddingJob.Owner == _embedding_job_owner)
+        .values(HeartbeatAt=now, UpdateDate=now, **values)
+        .execution_options(synchronize_session=False))
+    if result.rowcount != 1:
+        raise EmbeddingJobLeaseLostError(job_id)
+
+def release_embedding_job(db: Session, job_id: str):
+    """
+    アプリケーションの終了時に、ジョブの占有を解除します。ジョブは実行中のまま残り、他のワーカープロセスか次回の起動時に再開されます。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+    """
+    with db.begin():
+        db.execute(
+            update(EmbeddingJob)
+            .where(EmbeddingJob.Id == job_id, EmbeddingJob.Owner == _embedding_job_owner)
+            .values(Owner=None, HeartbeatAt=None)
+            .execution_options(synchronize_session=False))
+
+def is_embedding_job_cancel_requested(db: Session, job_id: str) -> bool:
+    """
+    占有期間を延長し、ジョブのキャンセルが要求されているかどうかを確認します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+
+    Returns:
+        bool -- キャンセルが要求されている場合はTrue
+
+    Raises:
+        EmbeddingJobLeaseLostError: ジョブが他のワーカープロセスに引き継がれていた場合に発生
+    """
+    with db.begin():
+        update_owned_embedding_job(db, job_id)
+        return bool(db.query(EmbeddingJob.CancelRequested).filter(EmbeddingJob.Id == job_id).scalar())
+
+def finish_embedding_job(db: Session, job_id: str, status: str, error: str = None):
+    """
+    ジョブの状態を終了状態に更新し、占有を解除します。このワーカープロセスが占有している場合のみ更新します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        job_id {str} -- ジョブのID
+        status {str} -- 終了状態（completed / cancelled / failed）
+        error {str} -- エラーメッセージ
+    """
+    try:
+        with db.begin():
+            now = datetime.now()
+            result = db.execute(
+                update(EmbeddingJob)
+                .where(EmbeddingJob.Id == job_id, EmbeddingJob.Status.in_(ACTIVE_EMBEDDING_JOB_STATUSES), EmbeddingJob.Owner == _embedding_job_owner)
+                .values(Status=status, Error=error, EndDate=now, UpdateDate=now, ActiveKey=None, Owner=None, HeartbeatAt=None)
+                .execution_options(synchronize_session=False))
+            if result.rowcount != 1:
+                return
+        backlog_gen_ai_chat_logger.info(LOG_MESSAGE_EMBEDDING_JOB_FINISHED.format(job_id=job_id, status=status))
+    except Exception as e:
+        db.rollback()
+        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_GENERAL.format(reason=str(e)))
+
+def get_embedding_job_progress(job: EmbeddingJob) -> dict:
+    """
+    ジョブの進捗を取得します。
+
+    残り時間の見込みは、これまでに処理した行の1行あたりの処理時間から計算します。
+    埋め込みのキャッシュのヒット数・ミス数・ヒット率と、ベクトルの追加・削除の件数も返します。
+
+    Arguments:
+        job {EmbeddingJob} -- ジョブ
+
+    Returns:
+        dict -- ジョブのID、状態、行数、チャンク数、トークン数、経過時間（秒）、残り時間の見込み（秒）、キャッシュとベクトルの変更の統計情報、エラーメッセージ
+    """
+    processed_rows = job.ProcessedRows or 0
+    total_rows = job.TotalRows or 0
+    elapsed_seconds = job.ElapsedSeconds or 0
+    cache_hits = job.CacheHits or 0
+    cache_lookups = cache_hits + (job.CacheMisses or 0)
+    eta_seconds = None
+    if job.Status in ACTIVE_EMBEDDING_JOB_STATUSES and processed_rows > 0:
+        eta_seconds = round(elapsed_seconds / processed_rows * max(total_rows - processed_rows, 0), 1)
+    return {
+        "job_id": job.Id,
+        "status": job.Status,
+        "cancel_requested": bool(job.CancelRequested),
+        "processed_rows": processed_rows,
+        "total_rows": total_rows,
+        "processed_chunks": job.ProcessedChunks or 0,
+        "processed_tokens": job.ProcessedTokens or 0,
+        "elapsed_seconds": round(elapsed_seconds, 1),
+        "eta_seconds": eta_seconds,
+        "cache": {
+            "hits": cache_hits,
+            "misses": job.CacheMisses or 0,
+            "hit_rate": round(cache_hits / cache_lookups, 4) if cache_lookups else 0,
+        },
+        "sync": {
+            "rows_embedded": processed_rows,
+            "rows_deleted": job.DeletedRows or 0,
+            "vectors_added": job.ProcessedChunks or 0,
+            "vectors_removed": job.RemovedVectors or 0,
+        },
+        "error": job.Error,
+    }
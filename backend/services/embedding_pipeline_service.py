@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.constant import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_BATCH_MAX_TEXTS,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_TOKENS_PER_MINUTE,
+    LOG_MESSAGE_EMBEDDING_PIPELINE)
+from config import logger
+from functools import lru_cache
+import tiktoken
+import time
+from utils.rate_limiter import RateLimiter
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+# 同時に実行されるすべての埋め込み処理で共有する、Embedding APIのレートリミッター
+_embedding_rate_limiter = RateLimiter(EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_TOKENS_PER_MINUTE)
+
+@lru_cache(maxsize=1)
+def get_embedding_encoder():
+    """
+    埋め込みモデルに対応するトークナイザーを取得します。初回のみ読み込み、以降は同じインスタンスを返します。
+
+    Returns:
+        tiktoken.Encoding -- トークナイザー
+    """
+    return tiktoken.encoding_for_model(EMBEDDING_MODEL_NAME)
+
+def get_embedding_token_count(text: str) -> int:
+    """
+    テキストのトークン数を取得します。
+
+    Arguments:
+        text {str} -- テキスト
+
+    Returns:
+        int -- トークン数
+    """
+    return len(get_embedding_encoder().encode(text, disallowed_special=()))
+
+def get_token_batches(token_counts, max_batch_tokens=None, max_batch_texts=None):
+    """
+    テキストを、合計トークン数とテキスト数の上限を超えないバッチに分けます。
+
+    1つで上限を超えるテキストは、単独のバッチとします。
+
+    Arguments:
+        token_counts {List[int]} -- テキストごとのトークン数
+        max_batch_tokens {int} -- 1バッチあたりの最大トークン数（省略時はEMBEDDING_BATCH_MAX_TOKENS）
+        max_batch_texts {int} -- 1バッチあたりの最大テキスト数（省略時はEMBEDDING_BATCH_MAX_TEXTS）
+
+    Returns:
+        List[List[int]] -- バッチごとのテキストの位置のリスト
+    """
+    max_batch_tokens = max_batch_tokens or EMBEDDING_BATCH_MAX_TOKENS
+    max_batch_texts = max_batch_texts or EMBEDDING_BATCH_MAX_TEXTS
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for position, token_count in enumerate(token_counts):
+        if batch and (batch_tokens + token_count > max_batch_tokens or len(batch) >= max_batch_texts):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(position)
+        batch_tokens += token_count
+    if batch:
+        batches.append(batch)
+    return batches
+
+def embed_texts_concurrently(embedding_model, texts, rate_limiter=None):
+    """
+    テキストをトークン数で分けたバッチごとに、スレッドプールで並行してベクトル化します。
+
+    各バッチはAPIを呼び出す前にレートリミッターで1分あたりのリクエスト数とトークン数の枠を確保します。
+    いずれかのバッチでエラーが発生した場合は、未実行のバッチを取り消して例外を送出します。
+
+    Arguments:
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+        texts {List[str]} -- テキストのリスト
+        rate_limiter {RateLimiter} -- レートリミッター（省略時はプロセス全体で共有するレートリミッター）
+
+    Returns:
+        Tuple[List[List[float]], int] -- テキストと同じ順序のベクトルのリストと、バッチ分けのために数えた合計トークン数
+    """
+    if not texts:
+        return [], 0
+    rate_limiter = rate_limiter or _embedding_rate_limiter
+    start_time = time.time()
+    token_counts = [get_embedding_token_count(text) for text in texts]
+    batches = get_token_batches(token_counts)
+
+    def embed_batch(batch):
+        rate_limiter.acquire(sum(token_counts[position] for position in batch))
+        return embedding_model.embed_documents([texts[position] for position in batch])
+
+    vectors = [None] * len(texts)
+    with ThreadPoolExecutor(max_workers=min(EMBEDDING_MAX_CONCURRENCY, len(batches))) as executor:
+        futures = {executor.submit(embed_batch, batch): batch for batch in batches}
+        try:
+            for future in as_completed(futures):
+                for position, vector in zip(futures[future], future.result()):
+                    vectors[position] = vector
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    backlog_gen_ai_chat_logger.info(LOG_MESSAGE_EMBEDDING_PIPELINE.format(
+        texts=len(texts), tokens=sum(token_counts), batches=len(batches), seconds=round(time.time() - start_time, 3)))
+    return vectors, sum(token_counts)
@@ -1,156 +1,105 @@
-from fastapi.responses import JSONResponse
-from models.data_store import Datastore
 from sqlalchemy.orm import Session
 from config.constant import (
-    ERROR_MESSAGE_GENERAL, 
-    SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDING,
-    OPENAI_KEY,
-    EMBEDDING_MODEL_NAME,
-    ERROR_MESSAGE_ZERO_CHUNKS,
-    ERROR_MESSAGE_DATABASE_EXCEPTION,
     ERROR_MESSAGE_FAISS_EMBEDDING_SAVE_EXCEPTION,
-    SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION)
+    EMBEDDING_STORE_FORMAT,
+    EMBEDDING_STORE_FORMAT_MMAP,
+    MMAP_STORE_EXTENSION,
+    EMBEDDING_BATCH_MAX_TEXTS,
+    EMBEDDING_MAX_CONCURRENCY)
 from config import logger
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import itertools
+import numpy as np
+import os
+import uuid
 from exceptions.general_exception import CustomGeneralException
-from exceptions.database_exception import CustomDatabaseException
-from utils.utils import get_embeddings_folder_path, get_random_uuid_name, get_embedding_model
+from utils.utils import get_random_uuid_name
+from utils.vector_stores import build_faiss_index, save_faiss_vector_store, save_mmap_vector_store
+from services.embedding_cache_service import embed_documents_with_cache
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def create_embedding(db: Session) -> JSONResponse:
+def create_documents(data_store):
     """
-    データストア内の新しいデータに対して、埋め込みを生成します。
+    データストアのデータからDocumentリストを作成します。
 
-    引数:
-        db {Session} -- SQLAlchemyデータベースセッション
+    Arguments:
+        data_store {List[Datastore]} -- データのリスト
 
-    戻り値:
-        JSONResponse -- 成功または失敗を示すメッセージを含むJSONレスポンス
+    Returns:
+        List[Document] -- ドキュメントのリスト
     """
-    try:
-        with db.begin():
-            backlog_gen_ai_chat_logger.info('#### Action: create_embedding ####')
-
-            # data storeから新規データを取得する。Embedding済みのデータは除外する
-            data_store = db.query(Datastore).filter(Datastore.IsUserForEmbedding == False).order_by(Datastore.Id.desc()).all()
-
-            # 新規データがない場合、成功メッセージを返す
-            if not data_store:
-                backlog_gen_ai_chat_logger.info(SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDING)
-                return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDING})
-
-            # 新規データからDocumentリストを作成する
-            document_list = []
-            for data in data_store:
-                content = data.Title + "\n" + data.Content
-                document_list.append(Document(page_content=content, metadata={"Source": data.Source, "Title": data.Title, "Keywords": data.Keywords, "Category": data.Category}))
-
-            # Documentをチャンクに分割する
-            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=256, chunk_overlap=32)
-            document_chunks = text_splitter.split_documents(document_list)
-
-            # チャンクが存在しない場合、エラーメッセージを返す
-            chunks_length = len(document_chunks)
-            if (chunks_length == 0):
-                backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_ZERO_CHUNKS)
-                return JSONResponse(status_code=400, content={"error": ERROR_MESSAGE_ZERO_CHUNKS})
-
-            # Embeddingフォルダのパスを取得する
-            embeddings_folder_path = get_embeddings_folder_path()
+    document_list = []
+    for data in data_store:
+        content = data.Title + "\n" + data.Content
+        document_list.append(Document(page_content=content, metadata={"Source": data.Source, "Title": data.Title, "Keywords": data.Keywords, "Category": data.Category, "DatastoreId": data.Id}))
+    return document_list
 
-            # OpenAI Embeddingモデルを作成する
-            embedding_model = get_embedding_model()
-
-            # Embeddingを作成する
-            counter = 0
-            temp_chunks = []
-
-            # チャンク数が16を超える場合、16個ずつEmbeddingを作成する
-            if (chunks_length > 16):
-                for chunk in document_chunks:
-                    temp_chunks.append(chunk)
-                    counter += 1
-
-                    if (counter == 16):
-                        create_embeddings(temp_chunks, embedding_model, embeddings_folder_path)
-                        counter = 0
-                        temp_chunks.clear()
-
-                # 最後のチャンクが残っている場合、Embeddingを作成する
-                if (len(temp_chunks) > 0):
-                    create_embeddings(temp_chunks, embedding_model, embeddings_folder_path)
-                    temp_chunks.clear()
-
-            # チャンク数が16未満の場合、すべてのチャンクのEmbeddingを作成する
-            else:
-                create_embeddings(temp_chunks, embedding_model, embeddings_folder_path)
-
-            # data storeを更新して、新規データのEmbedding済みフラグをTrueにする
-            bulk_update_data_store(db, data_store)
-
-        return JSONResponse(status_code=200, content={"message": SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION})
-
-    except CustomDatabaseException as cde:
-        db.rollback()
-        e_error_msg = ERROR_MESSAGE_DATABASE_EXCEPTION.format(reason=str(cde))
-        backlog_gen_ai_chat_logger.info(e_error_msg)
-        return JSONResponse(status_code=500, content={"error": e_error_msg})
+def embed_document_chunks(db: Session, embedding_model, chunk_batches):
+    """
+    分割が完了したチャンクから順に、キャッシュを確認してEmbeddingを作成し、ウェーブごとに返します。
 
-    except CustomGeneralException as cge:
-        db.rollback()
-        return JSONResponse(status_code=500, content={"error": cge.message})
+    Embedding APIの並行実行数を使い切れるよう、チャンクがEMBEDDING_BATCH_MAX_TEXTS × EMBEDDING_MAX_CONCURRENCY件たまるごとに
+    まとめてベクトル化します。その間もプロセスプールでは残りのドキュメントの分割が続きます。
+    返したウェーブのチャンクとベクトルは保持しないため、呼び出し元がウェーブごとにインデックスを書き込めば、
+    メモリ使用量はデータ全体ではなく1ウェーブ分に収まります。
 
-    except Exception as e:
-        db.rollback()
-        e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
-        backlog_gen_ai_chat_logger.info(e_error_msg)
-        return JSONResponse(status_code=500, content={"error": e_error_msg})
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+        chunk_batches {Iterable[List[Document]]} -- チャンクのリストのイテレーター
 
-def create_embeddings(chunks, embedding_model, embeddings_folder_path):
+    Yields:
+        Tuple[List[Document], List[List[float]], dict] -- ウェーブのチャンクのリスト、チャンクと同じ順序のベクトルのリスト、キャッシュのヒット数・ミス数・ヒット率とEmbedding APIでベクトル化したトークン数
+    """
+    wave_size = EMBEDDING_BATCH_MAX_TEXTS * EMBEDDING_MAX_CONCURRENCY
+    chunks = []
+    # 最後のNoneは、残りのチャンクをベクトル化するための目印
+    for chunk_batch in itertools.chain(chunk_batches, [None]):
+        if chunk_batch is not None:
+            chunks.extend(chunk_batch)
+        if chunks and (chunk_batch is None or len(chunks) >= wave_size):
+            vectors, cache_stats = embed_documents_with_cache(db, embedding_model, [chunk.page_content for chunk in chunks])
+            yield chunks, vectors, cache_stats
+            chunks = []
+
+def create_embeddings(chunks, vectors, embedding_model, embeddings_folder_path, index_name=None):
     """
-    埋め込みを作成します。
+    作成済みのベクトルから、設定された種類（EMBEDDING_INDEX_TYPE）のインデックスを1つ作成して保存します。
+
+    EMBEDDING_STORE_FORMATがmmapの場合は、メモリマップ形式で保存します。
 
     Arguments:
         chunks {List[Document]} -- ドキュメントのリスト
+        vectors {List[List[float]]} -- ドキュメントと同じ順序のベクトルのリスト
         embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
         embeddings_folder_path {str} -- 埋め込みフォルダのパス
+        index_name {str} -- インデックス名（省略時はランダムなUUID）
+
+    Returns:
+        List[dict] -- 保存したドキュメントのレコード（id, page_content, metadata）
 
     Raises:
         CustomGeneralException: FAISSに関する例外が発生した場合に発生します
     """
     try:
-        # ベクトルストアを作成します
-        vector_store = FAISS.from_documents(chunks, embedding_model)
-        # ランダムなUUIDを取得します
-        index_name = get_random_uuid_name()
+        # インデックスを作成します
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = build_faiss_index(vectors)
+        records = []
+        for chunk in chunks:
+            # ベクトルのIDをメタデータにも持たせ、削除済みのベクトルを検索結果から除外できるようにします
+            embedding_id = str(uuid.uuid4())
+            records.append({"id": embedding_id, "page_content": chunk.page_content, "metadata": {**chunk.metadata, "EmbeddingId": embedding_id}})
+        # インデックス名が指定されていない場合は、ランダムなUUIDを取得します
+        if index_name is None:
+            index_name = get_random_uuid_name()
         # ローカルにベクトルストアを保存します
-        vector_store.save_local(folder_path=embeddings_folder_path, index_name=index_name)
+        if EMBEDDING_STORE_FORMAT == EMBEDDING_STORE_FORMAT_MMAP:
+            save_mmap_vector_store(os.path.join(embeddings_folder_path, index_name + MMAP_STORE_EXTENSION), vectors, records, index)
+        else:
+            save_faiss_vector_store(embeddings_folder_path, index_name, index, records, embedding_model)
+        return records
     except Exception as e:
         # FAISSに関する例外が発生した場合、CustomGeneralExceptionを発生させます
         raise CustomGeneralException(ERROR_MESSAGE_FAISS_EMBEDDING_SAVE_EXCEPTION.format(reason=str(e)))
-
-def bulk_update_data_store(db: Session, data_store):
-    """
-    データストアを一括更新します。
-
-    Arguments:
-        db {Session} -- SQLAlchemyデータベースセッション
-        data_store {List[Datastore]} -- 更新するデータのリスト
-
-    Raises:
-        CustomDatabaseException: データベースに関する例外が発生した場合に発生します
-    """
-    try:
-        # データストアを一括更新します
-        for data in data_store:
-            data.IsUserForEmbedding = True
-        db.bulk_save_objects(data_store)
-        # トランザクションをコミットします
-        db.commit()
-    except Exception as e:
-        # データベースに関する例外が発生した場合、CustomDatabaseExceptionを発生させます
-        raise CustomDatabaseException()
@@ -0,0 +1,55 @@
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from models.data_store import Datastore
+from models.embedding_vector import EmbeddingVector
+from config.constant import EMBEDDING_VECTOR_QUERY_BATCH_SIZE
+
+def get_deleted_datastore_ids(db: Session) -> list:
+    """
+    ベクトルが登録されているが、データストアから削除されたデータのIDを取得します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+
+    Returns:
+        List[int] -- 削除されたデータのIDのリスト
+    """
+    rows = db.query(EmbeddingVector.DatastoreId).filter(
+        EmbeddingVector.DatastoreId.not_in(select(Datastore.Id))).distinct().all()
+    return [row.DatastoreId for row in rows]
+
+def get_embedding_ids(db: Session, datastore_ids) -> list:
+    """
+    データに対応するベクトルのID（ドキュメントのID）を取得します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        datastore_ids {List[int]} -- データのIDのリスト
+
+    Returns:
+        List[str] -- ベクトルのIDのリスト
+    """
+    embedding_ids = []
+    for start in range(0, len(datastore_ids), EMBEDDING_VECTOR_QUERY_BATCH_SIZE):
+        rows = db.query(EmbeddingVector.EmbeddingId).filter(
+            EmbeddingVector.DatastoreId.in_(datastore_ids[start:start + EMBEDDING_VECTOR_QUERY_BATCH_SIZE])).all()
+        embedding_ids.extend(row.EmbeddingId for row in rows)
+    return embedding_ids
+
+def replace_embedding_vectors(db: Session, removed_embedding_ids, records):
+    """
+    削除したベクトルの登録を削除し、新しく作成したベクトルとデータの対応を登録します。
+
+    Arguments:
+        db {Session} -- SQLAlchemyデータベースセッション
+        removed_embedding_ids {List[str]} -- 削除したベクトルのIDのリスト
+        records {List[dict]} -- 新しく作成したドキュメントのレコード（id, page_content, metadata）
+    """
+    for start in range(0, len(removed_embedding_ids), EMBEDDING_VECTOR_QUERY_BATCH_SIZE):
+        db.execute(delete(EmbeddingVector).where(
+            EmbeddingVector.EmbeddingId.in_(removed_embedding_ids[start:start + EMBEDDING_VECTOR_QUERY_BATCH_SIZE])))
+    if records:
+        db.execute(insert(EmbeddingVector), [
+            {"DatastoreId": record["metadata"]["DatastoreId"], "EmbeddingId": record["id"]}
+            for record in records
+        ])
@@ -1,5 +1,5 @@
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.constant import (
     ERROR_MESSAGE_EMPTY_CHATID,
     ERROR_MESSAGE_EMPTY_RATING,
@@ -10,7 +10,7 @@ from models.feedback import Feedback
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def create_feedback(chat_id: int, content: str, rating: int, db: Session) -> JSONResponse:
+async def create_feedback(chat_id: int, content: str, rating: int, db: AsyncSession) -> JSONResponse:
     """
     新規のフィードバックをデータベースに登録する
 
@@ -18,7 +18,7 @@ def create_feedback(chat_id: int, content: str, rating: int, db: Session) -> JSO
     - chat_id: フィードバックが属するチャットのID (int)
     - content: フィードバックの内容 (str)
     - rating: フィードバックの評価値 (1-10) (int)
-    - db: データベースセッション (sqlalchemy.orm.Session)
+    - db: 非同期のデータベースセッション (sqlalchemy.ext.asyncio.AsyncSession)
 
     戻り値:
     - JSONResponse: 作成されたフィードバックのID (int) 
@@ -35,15 +35,14 @@ def create_feedback(chat_id: int, content: str, rating: int, db: Session) -> JSO
         feedback = Feedback(**FeedbackCreate(ChatId=chat_id, Content=content, Rating=rating).model_dump())
 
         # データベースにフィードバックを登録する
-        with db.begin():
+        async with db.begin():
             db.add(feedback)
-            db.commit()
         backlog_gen_ai_chat_logger.info(f"Feedback created successfully with id {feedback.Id}, ChatId: {feedback.ChatId}, Content: {feedback.Content}, Rating: {feedback.Rating}")
 
         return JSONResponse(status_code=200, content={"feedback_id": feedback.Id})
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
         backlog_gen_ai_chat_logger.info(e_error_msg)
         return JSONResponse(status_code=500, content={"error": e_error_msg})
@@ -0,0 +1,116 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from models.chat import Chat
+from models.message import Message
+from config.constant import (
+    HISTORY_MAX_TOKENS,
+    HISTORY_RECENT_TURNS,
+    HISTORY_SUMMARY_MAX_TOKENS,
+    HISTORY_SUMMARY_MODEL_NAME,
+    LOG_MESSAGE_HISTORY_SUMMARY_UPDATED,
+    ERROR_MESSAGE_GENERAL)
+from config import logger
+from config.prompt import get_history_summary_prompt, get_history_summary_message
+from services.chat_service import get_chat
+from services.openai_service import call_completion_api, get_token_count
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+async def get_chat_history(chat_id: int, db: AsyncSession) -> dict:
+    """
+    指定されたchat_idの会話履歴を、トークン数の上限（HISTORY_MAX_TOKENS）に収まるように取得します。
+
+    要約済みの古いメッセージはチャットに保存された要約に置き換え、要約されていないメッセージは
+    新しいものから上限に収まる分だけそのまま使用します。
+
+    Parameters:
+        chat_id (int): チャットのID
+        db (AsyncSession): 非同期のデータベースのセッション
+
+    Returns:
+        dict: Completion APIに送信する形式のメッセージのリスト（messages）と、チャットに会話履歴があるかどうか（has_history）
+    """
+    async with db.begin():
+        chat = await get_chat(chat_id, db)
+        summary = chat.Summary
+        messages = (await db.execute(select(Message).where(Message.ChatId == chat_id, Message.Id > (chat.SummarizedMessageId or 0)).order_by(Message.Id.desc()))).scalars().all()
+        recent_messages = [{'role':message.Type, 'content':message.Content} for message in messages]
+
+    history_messages = []
+    remaining_tokens = HISTORY_MAX_TOKENS
+    if summary:
+        summary_message = {'role':'system', 'content':get_history_summary_message(summary)}
+        remaining_tokens -= get_token_count(summary_message['content'])
+        history_messages.append(summary_message)
+
+    # 新しいメッセージから順に、上限に収まる分だけそのまま使用する
+    verbatim_messages = []
+    for message in recent_messages:
+        remaining_tokens -= get_token_count(message['content'])
+        if remaining_tokens < 0:
+            break
+        verbatim_messages.append(message)
+    history_messages.extend(reversed(verbatim_messages))
+
+    return {'messages': history_messages, 'has_history': bool(summary or recent_messages)}
+
+async def update_chat_summary(chat_id: int, session_factory: async_sessionmaker):
+    """
+    直近HISTORY_RECENT_TURNSターンより古く、まだ要約されていないメッセージを、チャットの要約に追加します。
+
+    前回の要約と新しく古くなったメッセージのみから要約を作り直すため、毎回会話全体を要約し直すことはありません。
+    回答の返却後に呼び出され、エラーが発生しても回答には影響しません（次回の呼び出しで再度要約されます）。
+
+    Parameters:
+        chat_id (int): チャットのID
+        session_factory (async_sessionmaker): 非同期のデータベースのセッションを作成するファクトリ（リクエストのセッションは回答の返却後に閉じられるため、新しいセッションを使用します）
+    """
+    try:
+        async with session_factory() as db:
+            summary, summarized_message_id, messages = await get_messages_to_summarize(chat_id, db)
+            if not messages:
+                return
+            conversation = '\n'.join(f"{message.Type}: {message.Content}" for message in messages)
+            message_list = [{'role':'user', 'content':get_history_summary_prompt(summary or '', conversation)}]
+            new_summary = await call_completion_api(message_list, HISTORY_SUMMARY_MODEL_NAME, HISTORY_SUMMARY_MAX_TOKENS)
+            await save_chat_summary(chat_id, new_summary, summarized_message_id, messages[-1].Id, db)
+        backlog_gen_ai_chat_logger.info(LOG_MESSAGE_HISTORY_SUMMARY_UPDATED.format(chat_id=chat_id, summarized_messages=len(messages)))
+    except Exception as e:
+        backlog_gen_ai_chat_logger.info(ERROR_MESSAGE_GENERAL.format(reason=str(e)))
+
+async def get_messages_to_summarize(chat_id: int, db: AsyncSession):
+    """
+    チャットの現在の要約と、直近HISTORY_RECENT_TURNSターンより古く、まだ要約されていないメッセージを取得します。
+
+    Parameters:
+        chat_id (int): チャットのID
+        db (AsyncSession): 非同期のデータベースのセッション
+
+    Returns:
+        Tuple[str, int, list[Message]]: 現在の要約、要約に含めた最後のメッセージのID、古い順の要約するメッセージのリスト
+    """
+    async with db.begin():
+        chat = await get_chat(chat_id, db)
+        messages = (await db.execute(select(Message).where(Message.ChatId == chat_id, Message.Id > (chat.SummarizedMessageId or 0)).order_by(Message.Id))).scalars().all()
+        # 1ターンはユーザーメッセージとアシスタントメッセージの2件
+        messages_to_summarize = messages[:max(len(messages) - HISTORY_RECENT_TURNS * 2, 0)]
+        db.expunge_all()
+        return chat.Summary, chat.SummarizedMessageId or 0, messages_to_summarize
+
+async def save_chat_summary(chat_id: int, summary: str, previous_summarized_message_id: int, summarized_message_id: int, db: AsyncSession):
+    """
+    チャットの要約と、要約に含めた最後のメッセージのIDを保存します。
+
+    同じチャットの要約が同時に更新された場合に片方の結果で上書きしないよう、
+    要約を作成する前のメッセージのIDから変わっていない場合のみ保存します。
+
+    Parameters:
+        chat_id (int): チャットのID
+        summary (str): 要約
+        previous_summarized_message_id (int): 要約を作成する前の、要約に含めた最後のメッセージのID
+        summarized_message_id (int): 要約に含めた最後のメッセージのID
+        db (AsyncSession): 非同期のデータベースのセッション
+    """
+    async with db.begin():
+        await db.execute(update(Chat).where(Chat.Id == chat_id, func.coalesce(Chat.SummarizedMessageId, 0) == previous_summarized_message_id).values(
+            Summary=summary, SummarizedMessageId=summarized_message_id).execution_options(synchronize_session=False))
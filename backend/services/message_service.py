@@ -1,5 +1,6 @@
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.constant import (
     ERROR_MESSAGE_EMPTY_CHATID,
     ERROR_MESSAGE_GENERAL,
@@ -10,13 +11,13 @@ from services.chat_service import get_chat
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def get_messages(chat_id: int, email: str, db: Session) -> JSONResponse:
+async def get_messages(chat_id: int, email: str, db: AsyncSession) -> JSONResponse:
     """
     チャットのメッセージを取得する
 
     Args:
         chat_id (int): チャットID
-        db (Session): データベースセッション
+        db (AsyncSession): 非同期のデータベースセッション
         email (str): メールアドレス
 
     Returns:
@@ -32,10 +33,10 @@ def get_messages(chat_id: int, email: str, db: Session) -> JSONResponse:
             return JSONResponse(status_code=400, content={"error": ERROR_MESSAGE_EMPTY_EMAIL})
 
         # データベースからチャットを取得する
-        chat = get_chat(chat_id, db)
+        chat = await get_chat(chat_id, db)
         
         # データベースからメッセージを取得する
-        messages = db.query(Message).filter(Message.ChatId == chat_id and chat.User == email).all()
+        messages = (await db.execute(select(Message).where(Message.ChatId == chat_id and chat.User == email))).scalars().all()
 
         # メッセージをJSON形式に変換する
         messages_json = []
@@ -54,7 +55,7 @@ def get_messages(chat_id: int, email: str, db: Session) -> JSONResponse:
         return JSONResponse(status_code=200, content={"messages": messages_json})
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
         backlog_gen_ai_chat_logger.info(e_error_msg)
         return JSONResponse(status_code=500, content={"error": e_error_msg})
@@ -0,0 +1,25 @@
+from fastapi.responses import JSONResponse
+from config import logger
+from utils.utils import get_query_embedding_cache_stats
+from utils.http_clients import get_http_pool_stats
+from utils.db_pool_metrics import get_db_pool_stats
+from services.user_query_service import get_query_coalescing_stats
+from services.openai_service import get_completion_stats
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+def get_metrics() -> JSONResponse:
+    """
+    このプロセスのキャッシュ、OpenAI API用のHTTP接続プール、クエリをまとめた件数、Completion APIの呼び出し、データベースの接続プールの統計情報を取得します。
+
+    戻り値:
+        JSONResponse -- 統計情報を含むJSONレスポンス
+    """
+    backlog_gen_ai_chat_logger.info('#### Action: get_metrics ####')
+    return JSONResponse(status_code=200, content={
+        "query_embedding_cache": get_query_embedding_cache_stats(),
+        "openai_http_pool": get_http_pool_stats(),
+        "query_coalescing": get_query_coalescing_stats(),
+        "completion": get_completion_stats(),
+        "database_pool": get_db_pool_stats(),
+    })
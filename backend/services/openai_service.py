@@ -1,18 +1,41 @@
 import openai
 from config.constant import (
-    OPENAI_KEY,
     COMPLETION_MODEL_NAME,
     COMPLETION_MODEL_TEMPERATURE,
     COMPLETION_MODEL_TOP_P,
     COMPLETION_MODEL_FREQUENCY_PENALTY,
     COMPLETION_MODEL_PRESENCE_PENALTY,
     COMPLETION_MODEL_N,
+    COMPLETION_FALLBACK_MODEL_NAME,
+    COMPLETION_ROUTING_RULES,
+    COMPLETION_STREAM_INCLUDE_USAGE,
     TIKTOKEN_MODEL_NAME,
+    TIKTOKEN_DEFAULT_ENCODING_NAME,
+    TIKTOKEN_TOKENS_PER_MESSAGE,
+    TIKTOKEN_TOKENS_PER_NAME,
+    TIKTOKEN_TOKENS_PER_REPLY,
+    COMPLETION_MAX_RETRIES,
+    COMPLETION_RETRY_BASE_SECONDS,
+    COMPLETION_RETRY_MAX_SECONDS,
+    COMPLETION_HEDGE_ENABLED,
+    COMPLETION_HEDGE_PERCENTILE,
+    COMPLETION_HEDGE_MIN_SAMPLES,
+    COMPLETION_HEDGE_MIN_DELAY_SECONDS,
+    COMPLETION_LATENCY_SAMPLES,
+    COMPLETION_CIRCUIT_FAILURE_THRESHOLD,
+    COMPLETION_CIRCUIT_RESET_SECONDS,
+    COMPLETION_REQUESTS_PER_MINUTE,
+    COMPLETION_TOKENS_PER_MINUTE,
+    COMPLETION_ESTIMATED_CHARS_PER_TOKEN,
+    LOG_MESSAGE_COMPLETION_RETRY,
+    LOG_MESSAGE_COMPLETION_HEDGED,
+    LOG_MESSAGE_COMPLETION_FALLBACK,
     ERR_MSG_OPEN_AI_API_ERROR,
     ERR_MSG_OPEN_AI_TIMEOUT,
     ERR_MSG_OPEN_AI_RATE_LIMIT_ERROR,
     ERR_MSG_OPEN_AI_API_CONNECTION_ERROR,
     ERR_MSG_OPEN_AI_OTHERS_ERROR,
+    ERR_MSG_OPEN_AI_CIRCUIT_OPEN,
     ERR_MSG_CONTENT_FILTER,
     ERR_MSG_TOKEN_LENGTH,
     ERR_MSG_CONTENT_NULL,
@@ -23,23 +46,46 @@ from config.constant import (
     DISP_MSG_TOKEN_LENGTH,
     DISP_MSG_CONTENT_FILTER,
     DISP_MSG_CONTENT_NULL)
+import asyncio
 import tiktoken
 from config import logger
+from fastapi.concurrency import run_in_threadpool
+from functools import lru_cache
 import time
-from openai import OpenAI
+from utils.http_clients import get_async_openai_client
+from utils.rate_limiter import RateLimiter
+from utils.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, get_backoff_seconds
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def call_completion_api_stream(message_list):
+# すべてのリクエストで共有する、Completion APIのレートリミッター、モデルごとのサーキットブレーカー、最初のトークンまでの時間
+_completion_rate_limiter = RateLimiter(COMPLETION_REQUESTS_PER_MINUTE, COMPLETION_TOKENS_PER_MINUTE)
+_completion_circuit_breakers = {}
+_time_to_first_token_tracker = LatencyTracker(COMPLETION_LATENCY_SAMPLES)
+_completion_stats = {'retries': 0, 'hedged': 0, 'hedge_wins': 0}
+
+# 最初のトークンを受信する前に発生した場合にリトライするエラー（タイムアウト、接続エラー、レート制限、サーバーエラー）
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+# フォールバックのモデルがある場合に、リトライせずにフォールバックのモデルに切り替えるエラー
+FALLBACK_ERRORS = (openai.APITimeoutError, openai.RateLimitError, CircuitOpenError)
+
+async def call_completion_api_stream(message_list, model=None):
     """
      OpenAIのコンプリートAPIを呼び出す。
      このメソッドはstream=Trueを使って処理を高速化し、メモリ使用量を下げる。
+     AsyncOpenAIで非同期に呼び出すため、ストリーミング中もスレッドを占有しない。
+     最初のトークンを受信するまでのエラーはリトライし、上流が不安定な間はサーキットブレーカーですぐに失敗させる（open_completion_streamを参照）。
+     タイムアウト、レート制限、サーキットブレーカーで失敗した場合は、COMPLETION_FALLBACK_MODEL_NAMEのモデルに切り替える。
+     トークン数はストリームの最後に返される使用量を使用し、返されない場合は実際に使用したモデルのキャッシュしたトークナイザーで数える
+     （COMPLETION_STREAM_INCLUDE_USAGEがfalseの場合は、回答は受信した差分ごとに、プロンプトは回答を待つ間に数える。
+     trueで使用量が返されなかった場合は、ストリーム終了後に回答全体とプロンプトを一度だけ数える）。
  
      Parameters:
          message_list (list): OpenAI APIに送信するメッセージのリスト
+         model (str): 使用するモデル名（省略時はCOMPLETION_MODEL_NAME）
  
      Yields:
-         dict: レスポンステキスト、プロンプトトークン数、コンプリーショントークン数、総トークン数、レスポンスタイム、has_errorフィールドを含む辞書
+         dict: レスポンステキスト、プロンプトトークン数、コンプリーショントークン数、総トークン数、レスポンスタイム、has_error、実際に使用したモデル名（model）フィールドを含む辞書
      """
     result = {
         'response_text' : '',
@@ -47,7 +93,8 @@ def call_completion_api_stream(message_list):
         'completion_tokens' : 0,
         'total_tokens' : 0,
         'response_time' : 0,
-        'has_error' : False
+        'has_error' : False,
+        'model' : model or COMPLETION_MODEL_NAME
     }
 
     start_time = time.time()
@@ -55,37 +102,72 @@ def call_completion_api_stream(message_list):
     completion_tokens = 0
     total_tokens = 0
 
-    client = OpenAI(api_key=OPENAI_KEY)
+    # リトライはopen_completion_streamで行うため、OpenAIクライアントのリトライは無効にする
+    client = get_async_openai_client().with_options(max_retries=0)
+    # ストリームで使用量が返されない設定の場合は、回答を待つ間にプロンプトのトークン数を数えておく
+    prompt_tokens_task = None if COMPLETION_STREAM_INCLUDE_USAGE else asyncio.ensure_future(run_in_threadpool(get_message_list_token_count, message_list, result['model']))
 
     try:
-        response = client.chat.completions.create(
-            model = COMPLETION_MODEL_NAME,
+        stream_options = {'stream_options': {'include_usage': True}} if COMPLETION_STREAM_INCLUDE_USAGE else {}
+        request_options = dict(
+            model = result['model'],
             messages = message_list,
             temperature = COMPLETION_MODEL_TEMPERATURE,
             top_p = COMPLETION_MODEL_TOP_P,
             frequency_penalty = COMPLETION_MODEL_FREQUENCY_PENALTY,
             presence_penalty = COMPLETION_MODEL_PRESENCE_PENALTY,
             n = COMPLETION_MODEL_N,
-            stream = True
+            stream = True,
+            **stream_options
         )
+        estimated_tokens = get_estimated_token_count(message_list)
+        fallback_model = COMPLETION_FALLBACK_MODEL_NAME if COMPLETION_FALLBACK_MODEL_NAME != result['model'] else None
+        try:
+            response = await open_completion_stream(client, request_options, estimated_tokens, FALLBACK_ERRORS if fallback_model else ())
+        except FALLBACK_ERRORS as e:
+            if not fallback_model:
+                raise
+            backlog_gen_ai_chat_logger.info(LOG_MESSAGE_COMPLETION_FALLBACK.format(model=result['model'], fallback_model=fallback_model, reason=type(e).__name__))
+            result['model'] = request_options['model'] = fallback_model
+            # フォールバックのモデルのトークナイザーで数え直す
+            if prompt_tokens_task is not None:
+                prompt_tokens_task.cancel()
+                prompt_tokens_task = asyncio.ensure_future(run_in_threadpool(get_message_list_token_count, message_list, fallback_model))
+            response = await open_completion_stream(client, request_options, estimated_tokens)
 
-        response_text = ''
-        for chunk in response:
-            if chunk:
-                content = chunk.choices[0].delta.content
-                if content:
-                    response_text += content
-                    result['response_text'] = content
-                    yield result
+        finish_reason = None
+        usage = None
+        response_contents = []
+        async for chunk in response:
+            # 使用量は選択肢を含まない最後のチャンクで返される
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = get_finish_reason(chunk) or finish_reason
+            content = chunk.choices[0].delta.content
+            if content:
+                # ストリームで使用量が返されない設定の場合は、受信した差分ごとにトークン数を数える
+                if COMPLETION_STREAM_INCLUDE_USAGE:
+                    response_contents.append(content)
                 else:
-                    result['response_text'] = ''
-                    yield result
+                    completion_tokens += get_token_count(content, result['model'])
+                result['response_text'] = content
+                yield result
+            else:
+                result['response_text'] = ''
+                yield result
 
-        prompt_tokens = get_token_count(get_message_list_as_string(message_list))
-        completion_tokens = get_token_count(response_text)
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+        elif prompt_tokens_task is not None:
+            prompt_tokens = await prompt_tokens_task
+        else:
+            # 使用量を要求したが返されなかった場合のみ、回答全体とプロンプトを一度だけ数える
+            completion_tokens = await run_in_threadpool(get_token_count, ''.join(response_contents), result['model'])
+            prompt_tokens = await run_in_threadpool(get_message_list_token_count, message_list, result['model'])
         total_tokens = prompt_tokens + completion_tokens
-        
-        finish_reason = get_finish_reason(chunk)
 
         if(finish_reason == 'stop'):
             result['prompt_tokens'] = prompt_tokens
@@ -101,19 +183,24 @@ def call_completion_api_stream(message_list):
             err_msg = ' ' + DISP_MSG_CONTENT_NULL
             set_error_info(result, ERR_MSG_CONTENT_NULL, err_msg)
         
-    except openai.APIError as e:
-        set_error_info(result,  ERR_MSG_OPEN_AI_API_ERROR, "APIError : " + DISP_MSG_OPEN_AI_RETRY, e)
-    except openai.Timeout as e:
+    except CircuitOpenError as e:
+        set_error_info(result,  ERR_MSG_OPEN_AI_CIRCUIT_OPEN, "CircuitOpen : " + DISP_MSG_OPEN_AI_RETRY, e)
+    except openai.APITimeoutError as e:
         set_error_info(result,  ERR_MSG_OPEN_AI_TIMEOUT, "Timeout : " + DISP_MSG_OPEN_AI_RETRY, e)
     except openai.RateLimitError as e:
         set_error_info(result,  ERR_MSG_OPEN_AI_RATE_LIMIT_ERROR, "RateLimitError : " + DISP_MSG_OPEN_AI_RATE_LIMIT, e)
     except openai.APIConnectionError as e:
         set_error_info(result,  ERR_MSG_OPEN_AI_API_CONNECTION_ERROR, "APIConnectionError : " + DISP_MSG_OPEN_AI_API_CONNECTION_ERROR, e)
-    except openai.InvalidRequestError as e:
+    except openai.BadRequestError as e:
         set_error_info(result,  ERR_MSG_OPEN_AI_OTHERS_ERROR, "InvalidRequestError : " + DISP_MSG_OPEN_AI_OTHERS_ERROR, e) 
+    except openai.APIError as e:
+        set_error_info(result,  ERR_MSG_OPEN_AI_API_ERROR, "APIError : " + DISP_MSG_OPEN_AI_RETRY, e)
     except Exception as e:
         set_error_info(result,  ERR_MSG_OPEN_AI_OTHERS_ERROR, "Exception : " + DISP_MSG_OPEN_AI_OTHERS_ERROR, e)
     finally:
+        # ストリームの途中でエラーになった場合は、プロンプトのトークン数を数えるタスクを残さない
+        if prompt_tokens_task is not None and not prompt_tokens_task.done():
+            prompt_tokens_task.cancel()
         result['prompt_tokens'] = prompt_tokens
         result['completion_tokens'] = completion_tokens
         result['total_tokens'] = total_tokens
@@ -122,47 +209,331 @@ def call_completion_api_stream(message_list):
         result['response_time'] = response_time
         yield result
 
-def get_token_count(string):
+async def open_completion_stream(client, request_options, estimated_tokens, fallback_errors=()):
+    """
+     Completion APIのストリームを開始し、最初のチャンクを受信するまで待ちます。
+
+     最初のチャンクを受信する前のタイムアウト、接続エラー、レート制限、サーバーエラーは、
+     ジッター付きの指数バックオフ（Retry-Afterヘッダーがある場合はその秒数以上）で最大COMPLETION_MAX_RETRIES回リトライする。
+     fallback_errorsのエラーはリトライせずに発生させる（呼び出し元でフォールバックのモデルに切り替えるため）。
+     各リクエストの前に、共有のレートリミッターで枠を確保し、モデルのサーキットブレーカーが開いている場合はすぐに失敗させる。
+     COMPLETION_HEDGE_ENABLEDがtrueの場合は、最初のチャンクまでの時間が直近のパーセンタイルを超えたときに同じリクエストをもう1つ送信し、
+     先に最初のチャンクを受信した方を使用する。
+
+     Parameters:
+         client (AsyncOpenAI): OpenAIクライアント
+         request_options (dict): chat.completions.createの引数
+         estimated_tokens (int): レートリミッターで確保するトークン数
+         fallback_errors (tuple): リトライせずに発生させるエラーの型
+
+     Returns:
+         AsyncIterator: 最初のチャンクから始まる、レスポンスのチャンクのストリーム
+
+     Raises:
+         CircuitOpenError: サーキットブレーカーが開いている場合に発生
+         openai.APIError: リトライしないエラーが発生した場合、またはリトライの上限に達した場合に発生
+    """
+    circuit_breaker = get_completion_circuit_breaker(request_options['model'])
+    for attempt in range(COMPLETION_MAX_RETRIES + 1):
+        circuit_breaker.check()
+        await _completion_rate_limiter.aacquire(estimated_tokens)
+        started_at = time.monotonic()
+        try:
+            response, first_chunk = await start_hedged_completion_stream(client, request_options, estimated_tokens)
+        except RETRYABLE_ERRORS as e:
+            circuit_breaker.record_failure()
+            if attempt == COMPLETION_MAX_RETRIES or isinstance(e, fallback_errors):
+                raise
+            wait_seconds = max(get_backoff_seconds(attempt, COMPLETION_RETRY_BASE_SECONDS, COMPLETION_RETRY_MAX_SECONDS), get_retry_after_seconds(e))
+            _completion_stats['retries'] += 1
+            backlog_gen_ai_chat_logger.info(LOG_MESSAGE_COMPLETION_RETRY.format(attempt=attempt + 1, wait_seconds=round(wait_seconds, 3), reason=type(e).__name__))
+            await asyncio.sleep(wait_seconds)
+            continue
+        _time_to_first_token_tracker.add(time.monotonic() - started_at)
+        circuit_breaker.record_success()
+        return iterate_completion_stream(response, first_chunk)
+
+async def start_hedged_completion_stream(client, request_options, estimated_tokens):
+    """
+     Completion APIのストリームを開始し、最初のチャンクを受信するまで待ちます。
+
+     ヘッジが有効で、待ち時間がget_hedge_delay()の秒数を超えた場合は、レートリミッターに枠がある場合のみ同じリクエストをもう1つ送信し、
+     先に最初のチャンクを受信した方を使用して、もう一方はキャンセルする。
+
+     Parameters:
+         client (AsyncOpenAI): OpenAIクライアント
+         request_options (dict): chat.completions.createの引数
+         estimated_tokens (int): ヘッジのリクエストでレートリミッターから確保するトークン数
+
+     Returns:
+         Tuple[AsyncStream, ChatCompletionChunk]: レスポンスと最初のチャンク（チャンクがない場合はNone）
+    """
+    hedge_delay = get_hedge_delay()
+    tasks = {asyncio.ensure_future(start_completion_stream(client, request_options))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done and _completion_rate_limiter.try_acquire(estimated_tokens) == 0:
+            hedge = asyncio.ensure_future(start_completion_stream(client, request_options))
+            tasks.add(hedge)
+            _completion_stats['hedged'] += 1
+            backlog_gen_ai_chat_logger.info(LOG_MESSAGE_COMPLETION_HEDGED.format(delay_seconds=round(hedge_delay, 3)))
+        else:
+            hedge = None
+
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                if succeeded[0] is hedge:
+                    _completion_stats['hedge_wins'] += 1
+                # 同時に最初のチャンクを受信したもう一方のストリームは閉じる
+                for task in succeeded[1:]:
+                    await task.result()[0].close()
+                return succeeded[0].result()
+            error = next(iter(done)).exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def start_completion_stream(client, request_options):
+    """
+     Completion APIのストリームを開始し、最初のチャンクを受信するまで待ちます。
+
+     Parameters:
+         client (AsyncOpenAI): OpenAIクライアント
+         request_options (dict): chat.completions.createの引数
+
+     Returns:
+         Tuple[AsyncStream, ChatCompletionChunk]: レスポンスと最初のチャンク（チャンクがない場合はNone）
+    """
+    response = await client.chat.completions.create(**request_options)
+    try:
+        first_chunk = await response.__aiter__().__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    except BaseException:
+        # キャンセルされた場合やエラーの場合は、接続を解放する
+        await response.close()
+        raise
+    return response, first_chunk
+
+async def iterate_completion_stream(response, first_chunk):
+    """
+     受信済みの最初のチャンクと、残りのチャンクを順に返します。
+
+     Parameters:
+         response (AsyncStream): レスポンス
+         first_chunk (ChatCompletionChunk): 最初のチャンク（チャンクがない場合はNone）
+
+     Yields:
+         ChatCompletionChunk: レスポンスのチャンク
+    """
+    if first_chunk is None:
+        return
+    yield first_chunk
+    async for chunk in response:
+        yield chunk
+
+def get_completion_circuit_breaker(model):
+    """
+     モデルのサーキットブレーカーを取得します。初回のみ作成します。
+
+     Parameters:
+         model (str): モデル名
+
+     Returns:
+         CircuitBreaker: サーキットブレーカー
+    """
+    circuit_breaker = _completion_circuit_breakers.get(model)
+    if circuit_breaker is None:
+        circuit_breaker = _completion_circuit_breakers.setdefault(model, CircuitBreaker(COMPLETION_CIRCUIT_FAILURE_THRESHOLD, COMPLETION_CIRCUIT_RESET_SECONDS))
+    return circuit_breaker
+
+def select_completion_model(prompt_tokens, language=None, hint=None, top_score=None, score_spread=None):
+    """
+     COMPLETION_ROUTING_RULESのルールに従って、リクエストに使用するモデルを選択します。
+
+     上から順に、ルールに指定された条件をすべて満たす最初のルールのモデルを使用する。
+     条件に使用する値がない場合（検索結果がない場合など）、その条件は満たさないものとする。
+
+     Parameters:
+         prompt_tokens (int): 見積もったプロンプトのトークン数
+         language (str): 検出した言語
+         hint (str): リクエストで指定されたモデルのヒント
+         top_score (float): 最も近いチャンクの距離
+         score_spread (float): 検索結果の距離の最大と最小の差
+
+     Returns:
+         str: モデル名（満たすルールがない場合はCOMPLETION_MODEL_NAME）
+    """
+    for rule in COMPLETION_ROUTING_RULES:
+        conditions = [
+            'max_prompt_tokens' not in rule or prompt_tokens <= rule['max_prompt_tokens'],
+            'languages' not in rule or language in rule['languages'],
+            'hints' not in rule or hint in rule['hints'],
+            'max_top_score' not in rule or (top_score is not None and top_score <= rule['max_top_score']),
+            'min_score_spread' not in rule or (score_spread is not None and score_spread >= rule['min_score_spread'])]
+        if all(conditions):
+            return rule['model']
+    return COMPLETION_MODEL_NAME
+
+def get_hedge_delay():
+    """
+     ヘッジのリクエストを送信するまでの秒数を取得します。
+
+     直近の最初のチャンクまでの時間のCOMPLETION_HEDGE_PERCENTILEパーセンタイル（COMPLETION_HEDGE_MIN_DELAY_SECONDS以上）を使用する。
+
+     Returns:
+         float: 秒数（ヘッジが無効な場合、またはサンプル数が足りない場合はNone）
+    """
+    if not COMPLETION_HEDGE_ENABLED:
+        return None
+    percentile = _time_to_first_token_tracker.get_percentile(COMPLETION_HEDGE_PERCENTILE, COMPLETION_HEDGE_MIN_SAMPLES)
+    if percentile is None:
+        return None
+    return max(percentile, COMPLETION_HEDGE_MIN_DELAY_SECONDS)
+
+def get_retry_after_seconds(error):
+    """
+     エラーのレスポンスのRetry-Afterヘッダーの秒数を取得します。
+
+     Parameters:
+         error (openai.APIError): エラー
+
+     Returns:
+         float: 秒数（ヘッダーがない場合は0、COMPLETION_RETRY_MAX_SECONDSを上限とする）
+    """
+    response = getattr(error, 'response', None)
+    try:
+        return min(float(response.headers.get('retry-after', 0)), COMPLETION_RETRY_MAX_SECONDS)
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+def get_estimated_token_count(message_list):
+    """
+     レートリミッターで確保するため、メッセージの文字数からプロンプトのトークン数を見積もります。
+
+     Parameters:
+         message_list (list[dict]): メッセージのリスト
+
+     Returns:
+         int: 見積もったトークン数
+    """
+    return int(sum(len(message['content']) for message in message_list) / COMPLETION_ESTIMATED_CHARS_PER_TOKEN)
+
+def get_completion_stats():
+    """
+     Completion APIの呼び出しの、リトライ、ヘッジ、サーキットブレーカー、最初のチャンクまでの時間の統計情報を取得します。
+
+     Returns:
+         dict: 統計情報
+    """
+    return {
+        **_completion_stats,
+        "circuit_breakers": {model: circuit_breaker.get_stats() for model, circuit_breaker in list(_completion_circuit_breakers.items())},
+        "time_to_first_token_seconds": {
+            "p50": _time_to_first_token_tracker.get_percentile(50),
+            "p95": _time_to_first_token_tracker.get_percentile(95),
+            "p99": _time_to_first_token_tracker.get_percentile(99),
+        },
+    }
+
+async def call_completion_api(message_list, model, max_tokens):
+    """
+     OpenAIのコンプリートAPIを非同期に呼び出し、回答のテキストをまとめて返す。
+     会話履歴の要約など、ユーザーに直接返さない補助的な処理に使用する。
+     回答の呼び出しと同じく、open_completion_streamで共有のレートリミッターの枠を確保し、
+     モデルのサーキットブレーカーが開いている場合はすぐに失敗させる（障害中に要約がAPIの枠を使い切らないようにするため）。
+
+     Parameters:
+         message_list (list): OpenAI APIに送信するメッセージのリスト
+         model (str): モデル名
+         max_tokens (int): 回答の最大トークン数
+
+     Returns:
+         str: 回答のテキスト
+
+     Raises:
+         CircuitOpenError: サーキットブレーカーが開いている場合
+         openai.OpenAIError: OpenAI APIの呼び出しでエラーが発生した場合
+     """
+    # リトライはopen_completion_streamで行うため、OpenAIクライアントのリトライは無効にする
+    client = get_async_openai_client().with_options(max_retries=0)
+    request_options = dict(
+        model = model,
+        messages = message_list,
+        temperature = 0,
+        max_tokens = max_tokens,
+        stream = True
+    )
+    response = await open_completion_stream(client, request_options, get_estimated_token_count(message_list))
+    contents = []
+    async for chunk in response:
+        if chunk.choices:
+            contents.append(chunk.choices[0].delta.content or '')
+    return ''.join(contents)
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = TIKTOKEN_MODEL_NAME):
+    """
+    モデルに対応するトークナイザーを取得します。初回のみ読み込み、以降は同じインスタンスを返します。
+    tiktokenが対応していないモデルの場合は、TIKTOKEN_DEFAULT_ENCODING_NAMEのトークナイザーを使用します。
+
+    Args:
+        model (str): モデル名
+
+    Returns:
+        tiktoken.Encoding: トークナイザー
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(TIKTOKEN_DEFAULT_ENCODING_NAME)
+
+def get_token_count(string, model=None):
     """
     この関数は文字列を受け取り、その文字列に含まれるトークン数を返します。
-    TikTok AIモデルのエンコーディングを取得するencoding_for_model関数を使用し、
-    そのエンコーディングのencode関数を使用して、入力文字列からトークンを取得します。
+    モデルに対応する、キャッシュしたトークナイザーを使用します。
 
     Args:
         string (str): トークン数を数える文字列
+        model (str): トークン数を数えるモデル名（省略時はTIKTOKEN_MODEL_NAME）
 
     Returns:
         int: 入力文字列に含まれるトークン数
 
     Raises:
-        Exception: encoding_for_modelまたはencodeでエラーが発生した場合
+        Exception: トークナイザーの取得またはencodeでエラーが発生した場合
     """
     try:
-        encoding = tiktoken.encoding_for_model(TIKTOKEN_MODEL_NAME)
-        tokens = encoding.encode(string)
-        return len(tokens)
+        return len(get_encoder(model or TIKTOKEN_MODEL_NAME).encode(string, disallowed_special=()))
     except Exception as e:
         backlog_gen_ai_chat_logger.info(str(e))
         raise Exception(str(e))
-    
-def get_message_list_as_string(message_list):
+
+def get_message_list_token_count(message_list, model=None):
     """
-    この関数はメッセージのリストを受け取り、そのメッセージを1つの文字列にして返します。
+    この関数はメッセージのリストを受け取り、Chat Completion APIのプロンプトとして数えられるトークン数を返します。
 
-    各メッセージは "{role} : {content}" の形式です。
+    メッセージごとの区切りのトークン（nameフィールドを含む）と、回答の開始のトークンも加算します。
 
     Args:
         message_list (list[dict]): メッセージのリスト。各メッセージはroleとcontentの2つのキーを持つ辞書型です。
+        model (str): トークン数を数えるモデル名（省略時はTIKTOKEN_MODEL_NAME）
 
     Returns:
-        str: すべてのメッセージを "{role} : {content}" の形式で連結した文字列。
+        int: プロンプトのトークン数
     """
-    message_string = ''
+    token_count = TIKTOKEN_TOKENS_PER_REPLY
     for message in message_list:
-        role = message['role']
-        content = message['content']
-        message_string = f"{message_string} \n {role} : {content}"
-    return message_string
+        token_count += TIKTOKEN_TOKENS_PER_MESSAGE
+        for key, value in message.items():
+            token_count += get_token_count(value, model)
+            if key == 'name':
+                token_count += TIKTOKEN_TOKENS_PER_NAME
+    return token_count
 
 def get_finish_reason(chunk):
     """
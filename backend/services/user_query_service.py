@@ -1,10 +1,10 @@
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from models.message import Message
 from models.message_log import MessageLog
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.constant import (
     ERROR_MESSAGE_GENERAL,
-    ERROR_MESSAGE_FAISS_VECTORSTORE_LOAD_EXCEPTION,
     ERROR_MESSAGE_EMPTY_QUERY,
     NO_OF_SIMILAR_DOCUMENTS,
     ERROR_MESSAGE_EMPTY_CHATID,
@@ -12,39 +12,52 @@ from config.constant import (
     DEFAULT_CHAT_LANGUAGE,
     USER_MESSAGE_TYPE,
     ASSISTANT_MESSAGE_TYPE,
-    COMPLETION_MODEL_NAME,
     ERROR_MESSAGE_EMPTY_EMAIL)
 from config import logger
-import os
-from langchain_community.vectorstores import FAISS
 from exceptions.general_exception import CustomGeneralException
-from utils.utils import get_embeddings_folder_path, get_embedding_model, get_total_costs
+from utils.utils import get_total_costs
 from config.prompt import get_chat_prompt, SYSTEM_PROMPT
 from langdetect import detect
-from services.openai_service import call_completion_api_stream
-from services.chat_service import get_chat
+from services.openai_service import call_completion_api_stream, select_completion_model, get_estimated_token_count
+from services.history_service import get_chat_history
+from services.vector_store_service import get_vector_store, get_vector_store_version
+from services.answer_cache_service import get_cached_answer, set_cached_answer
+from services.context_service import pack_context
+from utils.single_flight import SingleFlight
+import hashlib
+import json
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
-def get_query_answer(chat_id: int, email: str, query: str, db: Session): 
+# 同時に受け付けた同じクエリの検索と、同じプロンプトの回答の作成を1回にまとめる
+_context_single_flight = SingleFlight()
+_completion_single_flight = SingleFlight()
+
+async def get_query_answer(chat_id: int, email: str, query: str, db: AsyncSession, model_hint: str = None):
     """
     この関数はモデルからクエリに対する回答を取得するために使用されます。
+    イベントループをブロックしないよう、Completion APIとクエリのベクトル化は非同期で呼び出し、
+    ベクトル検索とデータベースへのアクセスは短い単位でスレッドプールで実行します。
     この関数は以下の処理を行います。
     1. queryとchat_idとメールの全てがNoneでないかをチェック
-    2. 両方がNoneでない場合はベクトルストアを取得し、クエリに対する類似度の高いドキュメントを検索する
-    3. 指定されたchat_idのメッセージをデータベースから取得する
-    4. クエリから言語を検出する
+    2. 指定されたchat_idの会話履歴を、トークン数の上限に収まるようにデータベースから取得する（古いメッセージは要約に置き換える）
+    3. クエリから言語を検出する
+    4. 会話履歴のない最初の質問で回答キャッシュにヒットした場合は、キャッシュの回答を返してメッセージを保存する
+       ヒットしない場合はベクトルストアを取得し、クエリに対する類似度の高いドキュメントを検索する
+       検索結果は重複・隣接するチャンクをまとめ、トークン数の上限に収まるコンテキストにする（同じクエリの検索が実行中の場合は結果を共有する）
     5. システムプロンプト、メッセージのリスト、クエリのコンテンツを含むメッセージのリストを作成する
-    6. 作成したメッセージリストをopenai completion apiを呼び出す
+    6. プロンプトのトークン数、言語、検索結果の距離、ヒントから使用するモデルを選択し、作成したメッセージリストでopenai completion apiを呼び出す
+       （同じモデルとメッセージリストの回答を作成中の場合は、そのストリームを共有する）
     7. レスポンスをパースし、ユーザーメッセージとアシスタントメッセージをデータベースに追加する
     8. メッセージログを作成しデータベースに追加する
  
     Parameters:
         chat_id (int): クエリが出されたチャットのID
         query (str): ユーザーが出したクエリ
-        db (Session): データベースのセッション
+        db (AsyncSession): 非同期のデータベースのセッション
+        model_hint (str): モデルのルーティングに使用する、リクエストで指定されたヒント
  
-    Returns:
+    Yields:
          JSONResponse: 回答またはエラーメッセージを含むJSONレスポンスを返す
     """
     try:
@@ -59,100 +72,157 @@ def get_query_answer(chat_id: int, email: str, query: str, db: Session):
             yield JSONResponse(status_code=400, content={'status' : 'answer','error': ERROR_MESSAGE_EMPTY_CHATID})
 
         else:
-            with db.begin():
-                vector_store = get_vector_store()
-                yield JSONResponse(status_code=200, content={'status' : 'processing','message': 'Searching for relevant data'})
-                similarity_search_result = vector_store.similarity_search(query=query, k=NO_OF_SIMILAR_DOCUMENTS)
-
-                # データベースからチャットを取得する
-                chat = get_chat(chat_id, db)
-                # データベースからメッセージを取得する
-                messages = db.query(Message).filter(Message.ChatId == chat_id and chat.User == email).all()
-
-                code = detect(query)
-                if(code in CODES_TO_CHAT_LANGUAGE):
-                    language = CODES_TO_CHAT_LANGUAGE[code]
-                else:
-                    language = DEFAULT_CHAT_LANGUAGE
-
-                message_list = []
-                message_list.append({'role':'system', 'content':SYSTEM_PROMPT})
-
-                for message in messages:
-                    message_list.append({'role':message.Type, 'content':message.Content})
-
-                query_content = get_chat_prompt(language=language, context=similarity_search_result, query=query)
-                message_list.append({'role':'user', 'content':query_content})
-
-                backlog_gen_ai_chat_logger.info(f"message_list: {message_list}")
-
-                response_content = ''
-                yield JSONResponse(status_code=200, content={'status' : 'processing','message': 'Create a response'})
-                for result in call_completion_api_stream(message_list):
-                    response_text = result['response_text']
-                    response_content += response_text
-                    prompt_tokens = result['prompt_tokens']
-                    completion_tokens = result['completion_tokens']
-                    total_tokens = result['total_tokens']
-                    response_time = result['response_time']
-                    has_error = result['has_error']
-                    if(response_text != ''):
-                        yield JSONResponse(status_code=200, content={'status' : 'answer','message': response_text})
-
-                total_cost = get_total_costs(prompt_tokens, completion_tokens)
-                backlog_gen_ai_chat_logger.info(f"response: {response_content}")
-                backlog_gen_ai_chat_logger.info(f"Query Log: prompt_tokens:{prompt_tokens}, completion_tokens:{completion_tokens}, total_tokens:{total_tokens}, total_cost:{total_cost}, response_time:{response_time}, has_error:{has_error}")
-
-                user_message = Message(ChatId=chat_id, Type=USER_MESSAGE_TYPE, Content=query)
-                assistant_message = Message(ChatId=chat_id, Type=ASSISTANT_MESSAGE_TYPE, Content=response_content)
-                db.add_all([user_message, assistant_message])
-                db.flush()
-                message_log = MessageLog(MessageId=user_message.Id, Model=COMPLETION_MODEL_NAME, PromptTokens=prompt_tokens, CompletionTokens=completion_tokens, TotalTokens=total_tokens, TotalCost=total_cost, ResponseTime=response_time, HasError=has_error)
-                db.add(message_log)
-                db.commit()
+            vector_store = await run_in_threadpool(get_vector_store)
+            index_version = get_vector_store_version()
+
+            # データベースから、トークン数の上限に収まるチャットの会話履歴を取得する
+            history = await get_chat_history(chat_id, db)
+
+            code = detect(query)
+            if(code in CODES_TO_CHAT_LANGUAGE):
+                language = CODES_TO_CHAT_LANGUAGE[code]
+            else:
+                language = DEFAULT_CHAT_LANGUAGE
+
+            yield JSONResponse(status_code=200, content={'status' : 'processing','message': 'Searching for relevant data'})
+            query_embedding = await vector_store.embedding_function.aembed_query(query)
+
+            # 回答が会話履歴に依存しないよう、回答キャッシュは履歴のない最初の質問のみで使用する
+            use_answer_cache = not history['has_history']
+            cached_answer = get_cached_answer(query, language, index_version, query_embedding) if use_answer_cache else None
+            if cached_answer is not None:
+                yield JSONResponse(status_code=200, content={'status' : 'answer','message': cached_answer['answer']})
+                # キャッシュの回答を作成したモデルを記録する
+                await add_messages(db, chat_id, query, cached_answer['answer'], MessageLog(Model=cached_answer['model'], PromptTokens=0, CompletionTokens=0, TotalTokens=0, TotalCost=0, ResponseTime=0, HasError=False, IsCacheHit=True))
+                return
+
+            # 同じクエリの検索が実行中の場合は、その結果を共有する
+            search_result = await _context_single_flight.call((index_version, query), lambda: run_in_threadpool(search_context, vector_store, query_embedding))
+
+            message_list = []
+            message_list.append({'role':'system', 'content':SYSTEM_PROMPT})
+            message_list.extend(history['messages'])
+
+            query_content = get_chat_prompt(language=language, context=search_result['context'], query=query)
+            message_list.append({'role':'user', 'content':query_content})
+
+            backlog_gen_ai_chat_logger.info(f"message_list: {message_list}")
+
+            response_content = ''
+            yield JSONResponse(status_code=200, content={'status' : 'processing','message': 'Create a response'})
+            # 同じプロンプトの回答を作成中の場合は、Completion APIを呼び出さずにそのストリームを共有する
+            model = select_completion_model(get_estimated_token_count(message_list), language, model_hint, search_result['top_score'], search_result['score_spread'])
+            completion_stream, is_coalesced = _completion_single_flight.subscribe(get_message_list_key(model, message_list), lambda: copy_completion_stream(message_list, model))
+            async for result in completion_stream:
+                response_text = result['response_text']
+                response_content += response_text
+                prompt_tokens = result['prompt_tokens']
+                # フォールバックした場合は、実際に使用したモデルを記録する
+                model = result['model']
+                completion_tokens = result['completion_tokens']
+                total_tokens = result['total_tokens']
+                response_time = result['response_time']
+                has_error = result['has_error']
+                if(response_text != ''):
+                    yield JSONResponse(status_code=200, content={'status' : 'answer','message': response_text})
+
+            total_cost = get_total_costs(prompt_tokens, completion_tokens, model)
+            backlog_gen_ai_chat_logger.info(f"response: {response_content}")
+            backlog_gen_ai_chat_logger.info(f"Query Log: model:{model}, prompt_tokens:{prompt_tokens}, completion_tokens:{completion_tokens}, total_tokens:{total_tokens}, total_cost:{total_cost}, response_time:{response_time}, has_error:{has_error}")
+
+            if use_answer_cache and not has_error:
+                set_cached_answer(query, language, index_version, response_content, model, query_embedding)
+
+            # 共有したストリームのトークン数とコストは、Completion APIを呼び出したリクエストのみに記録する
+            if is_coalesced:
+                prompt_tokens = completion_tokens = total_tokens = total_cost = 0
+            await add_messages(db, chat_id, query, response_content, MessageLog(Model=model, PromptTokens=prompt_tokens, CompletionTokens=completion_tokens, TotalTokens=total_tokens, TotalCost=total_cost, ResponseTime=response_time, HasError=has_error, IsCacheHit=False, IsCoalesced=is_coalesced))
 
     except CustomGeneralException as cge:
-        db.rollback()
+        await db.rollback()
         yield JSONResponse(status_code=200, content={'status' : 'answer','message': cge.message})
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         e_error_msg = ERROR_MESSAGE_GENERAL.format(reason=str(e))
         backlog_gen_ai_chat_logger.info(e_error_msg)
         yield JSONResponse(status_code=200, content={'status' : 'answer','message': e_error_msg})
-    
-def get_vector_store():
+
+async def add_messages(db: AsyncSession, chat_id: int, query: str, answer: str, message_log: MessageLog):
     """
-    エンコーディングフォルダからベクトルストアを読み込みます。
+    ユーザーメッセージとアシスタントメッセージ、ユーザーメッセージのメッセージログをデータベースに追加します。
 
-    この関数は、エンコーディングフォルダにあるインデックスファイルをすべて読み込み、1つのベクトルストアにマージします。
+    Parameters:
+        db (AsyncSession): 非同期のデータベースのセッション
+        chat_id (int): クエリが出されたチャットのID
+        query (str): ユーザーが出したクエリ
+        answer (str): アシスタントの回答
+        message_log (MessageLog): MessageIdを除いたメッセージログ
+    """
+    async with db.begin():
+        user_message = Message(ChatId=chat_id, Type=USER_MESSAGE_TYPE, Content=query)
+        assistant_message = Message(ChatId=chat_id, Type=ASSISTANT_MESSAGE_TYPE, Content=answer)
+        db.add_all([user_message, assistant_message])
+        await db.flush()
+        message_log.MessageId = user_message.Id
+        db.add(message_log)
+
+def search_context(vector_store, query_embedding) -> dict:
+    """
+    クエリに対する類似度の高いドキュメントを検索し、トークン数の上限に収まるコンテキストを作成します。
+    モデルのルーティングに使用するため、検索結果の距離も返します。
 
-    読み込まれたベクトルストアを返します。
+    Parameters:
+        vector_store (FAISS | MmapVectorStore | MultiVectorStore | FilteredVectorStore): 検索するベクトルストア
+        query_embedding (List[float]): クエリのベクトル
 
-    Args:
-        なし
+    Returns:
+        dict: プロンプトに埋め込むコンテキスト（context）、最も近いチャンクの距離（top_score）、距離の最大と最小の差（score_spread）
+              検索結果がない場合、距離はNone
+    """
+    similarity_search_result = vector_store.similarity_search_with_score_by_vector(query_embedding, NO_OF_SIMILAR_DOCUMENTS)
+    scores = [float(score) for _, score in similarity_search_result]
+    return {
+        'context': pack_context(similarity_search_result),
+        'top_score': min(scores) if scores else None,
+        'score_spread': max(scores) - min(scores) if scores else None,
+    }
+
+def get_message_list_key(model: str, message_list: list) -> str:
+    """
+    同じプロンプトの回答の作成をまとめるため、モデル名とメッセージリストからキーを作成します。
+
+    Parameters:
+        model (str): 使用するモデル名
+        message_list (list): OpenAI APIに送信するメッセージのリスト
 
     Returns:
-        FAISS.VectorStore: マージされたベクトルストア
+        str: キー（SHA-256のハッシュ値）
+    """
+    return hashlib.sha256(json.dumps([model, message_list], ensure_ascii=False).encode('utf-8')).hexdigest()
 
-    Raises:
-        CustomGeneralException: ベクトルストアの読み込み時にエラーが発生した場合に発生
+async def copy_completion_stream(message_list: list, model: str):
     """
-    try:
-        embeddings_folder_path = get_embeddings_folder_path()
-        file_names = next(os.walk(embeddings_folder_path))[2]
-        file_names_without_extension = [os.path.splitext(file_name)[0] for file_name in file_names]
-        file_names_without_duplicates = list(set(file_names_without_extension))
-
-        for index in range(len(file_names_without_duplicates)):
-            file_name = file_names_without_duplicates[index]
-            temp_vector_store = FAISS.load_local(folder_path=embeddings_folder_path, index_name=file_name, embeddings=get_embedding_model(), allow_dangerous_deserialization=True)
-            if(index == 0):
-                vector_store = temp_vector_store
-            else:
-                vector_store.merge_from(temp_vector_store)
+    Completion APIのストリームを、複数の購読者で共有できるよう、値をコピーして返します。
+
+    Parameters:
+        message_list (list): OpenAI APIに送信するメッセージのリスト
+        model (str): 使用するモデル名
 
-        return vector_store
+    Yields:
+        dict: call_completion_api_streamの結果のコピー
+    """
+    async for result in call_completion_api_stream(message_list, model):
+        yield dict(result)
 
-    except Exception as e:
-        raise CustomGeneralException(ERROR_MESSAGE_FAISS_VECTORSTORE_LOAD_EXCEPTION.format(reason=str(e)))
+def get_query_coalescing_stats() -> dict:
+    """
+    同時に受け付けたクエリの検索と回答の作成をまとめた件数を取得します。
+
+    Returns:
+        dict: 検索と回答の作成それぞれの統計情報
+    """
+    return {
+        "context": _context_single_flight.get_stats(),
+        "completion": _completion_single_flight.get_stats(),
+    }
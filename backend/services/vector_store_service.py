@@ -0,0 +1,306 @@
+from langchain_community.vectorstores import FAISS
+from config.constant import (
+    ERROR_MESSAGE_FAISS_VECTORSTORE_LOAD_EXCEPTION,
+    ERROR_MESSAGE_NO_EMBEDDING_FILES,
+    EMBEDDING_VERSION_CHECK_SECONDS,
+    EMBEDDING_SEARCH_MODE,
+    EMBEDDING_SEARCH_MODE_SHARDED,
+    LOG_MESSAGE_VECTOR_STORE_LOADED,
+    LOG_MESSAGE_VECTOR_STORE_UPDATED)
+from config import logger
+import faiss
+import os
+import threading
+import time
+from exceptions.general_exception import CustomGeneralException
+from utils.utils import (
+    get_embeddings_folder_path,
+    get_embedding_model,
+    get_embedding_index_names,
+    get_mmap_store_names,
+    get_embedding_version,
+    get_deleted_embedding_ids)
+from utils.vector_stores import (
+    MmapVectorStore,
+    MultiVectorStore,
+    FilteredVectorStore,
+    remove_faiss_deleted_ids,
+    set_faiss_search_parameters)
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+# プロセス全体で共有する常駐ベクトルストアとそのバージョン
+_vector_store = None
+_vector_store_version = 0
+
+# 常駐ベクトルストアを読み込んだ時点のエンベディングフォルダのバージョンと、最後に確認した時刻
+_embedding_version = None
+_embedding_version_checked_at = 0.0
+
+# ロード・差し替え処理を直列化するためのロック（検索処理はロックを取得しない）
+_vector_store_lock = threading.Lock()
+
+# 常駐ベクトルストアに読み込み済みのインデックス名、検索対象のベクトルストア、削除済みのベクトルのIDなど。
+# 差分の反映（refresh_vector_store）で、追加されたインデックスファイルと削除済みのベクトルだけを読み込むために使用する
+_vector_store_state = {}
+
+def load_vector_store(state: dict = None):
+    """
+    エンベディングフォルダからベクトルストアを読み込みます。
+
+    この関数は、エンベディングフォルダにある全件検索のFAISSインデックスファイルをすべて読み込み、1つのベクトルストアにマージします。
+    EMBEDDING_SEARCH_MODEがshardedの場合はマージせず、検索時に各インデックスを並行して検索して上位k件をマージします。
+    メモリマップ形式のベクトルストアはマージせずに読み取り専用でメモリマップし、複数ある場合はまとめて検索できるようにします。
+    削除済みのベクトルは、全件検索のFAISSインデックスからはremove_idsで取り除き、それ以外のベクトルストアでは検索結果から除外します。
+
+    Arguments:
+        state {dict} -- 指定された場合、差分の反映に使用する読み込みの状態を格納します
+
+    Returns:
+        FAISS | MmapVectorStore | MultiVectorStore | FilteredVectorStore: 読み込まれたベクトルストア
+
+    Raises:
+        CustomGeneralException: ベクトルストアの読み込み時にエラーが発生した場合に発生
+    """
+    try:
+        embeddings_folder_path = get_embeddings_folder_path()
+        index_names = get_embedding_index_names(embeddings_folder_path)
+        mmap_store_names = get_mmap_store_names(embeddings_folder_path)
+
+        if not index_names and not mmap_store_names:
+            raise Exception(ERROR_MESSAGE_NO_EMBEDDING_FILES)
+
+        embedding_model = get_embedding_model()
+        all_deleted_ids = get_deleted_embedding_ids(embeddings_folder_path)
+        vector_stores, flat_vector_stores = load_vector_store_files(embeddings_folder_path, index_names, mmap_store_names, embedding_model)
+        deleted_ids = remove_flat_deleted_ids(flat_vector_stores, all_deleted_ids)
+
+        # 全件検索のFAISSインデックス以外のベクトルストアがある場合は、残りの削除済みのベクトルを検索結果から除外する
+        filtered_ids = deleted_ids if len(vector_stores) > len(flat_vector_stores) else set()
+        if state is not None:
+            state.clear()
+            state.update(store_names=set(index_names) | set(mmap_store_names), vector_stores=vector_stores, deleted_ids=all_deleted_ids, filtered_ids=filtered_ids)
+        return wrap_vector_stores(vector_stores, filtered_ids, embedding_model)
+
+    except Exception as e:
+        raise CustomGeneralException(ERROR_MESSAGE_FAISS_VECTORSTORE_LOAD_EXCEPTION.format(reason=str(e)))
+
+def load_vector_store_files(embeddings_folder_path, index_names, mmap_store_names, embedding_model):
+    """
+    インデックスファイルとメモリマップ形式のベクトルストアを読み込みます。
+
+    全件検索のFAISSインデックスは、EMBEDDING_SEARCH_MODEがshardedの場合を除いて1つにマージします。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        index_names {List[str]} -- 読み込むインデックス名の一覧
+        mmap_store_names {List[str]} -- 読み込むメモリマップ形式のベクトルストア名の一覧
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+
+    Returns:
+        Tuple[list, list] -- 検索対象のベクトルストアのリストと、そのうち全件検索のFAISSインデックスのリスト
+    """
+    vector_stores = [MmapVectorStore(os.path.join(embeddings_folder_path, mmap_store_name), embedding_model) for mmap_store_name in mmap_store_names]
+
+    is_sharded_search = EMBEDDING_SEARCH_MODE == EMBEDDING_SEARCH_MODE_SHARDED
+    flat_vector_stores = []
+    for file_name in index_names:
+        temp_vector_store = FAISS.load_local(folder_path=embeddings_folder_path, index_name=file_name, embeddings=embedding_model, allow_dangerous_deserialization=True)
+        # 近似最近傍（IVF / HNSW）のインデックスはマージせず、検索パラメータを設定して個別に検索する
+        if not isinstance(temp_vector_store.index, faiss.IndexFlat):
+            set_faiss_search_parameters(temp_vector_store.index)
+            vector_stores.append(temp_vector_store)
+        # シャード単位で検索する場合は、全件検索のインデックスもマージせずに個別に検索する
+        elif is_sharded_search or not flat_vector_stores:
+            flat_vector_stores.append(temp_vector_store)
+            vector_stores.append(temp_vector_store)
+        else:
+            flat_vector_stores[0].merge_from(temp_vector_store)
+    return vector_stores, flat_vector_stores
+
+def remove_flat_deleted_ids(flat_vector_stores, deleted_ids) -> set:
+    """
+    読み込んだばかりの（検索に使用されていない）全件検索のFAISSインデックスから、削除済みのベクトルをremove_idsで取り除きます。
+
+    Arguments:
+        flat_vector_stores {List[FAISS]} -- 全件検索のFAISSインデックスのリスト
+        deleted_ids {set} -- 削除済みのベクトルのID
+
+    Returns:
+        set -- 取り除けなかった削除済みのベクトルのID
+    """
+    for flat_vector_store in flat_vector_stores:
+        if deleted_ids:
+            deleted_ids = deleted_ids - remove_faiss_deleted_ids(flat_vector_store, deleted_ids)
+    return deleted_ids
+
+def wrap_vector_stores(vector_stores, filtered_ids, embedding_model):
+    """
+    検索対象のベクトルストアを1つのベクトルストアにまとめ、削除済みのベクトルがある場合は検索結果から除外します。
+
+    Arguments:
+        vector_stores {list} -- 検索対象のベクトルストアのリスト
+        filtered_ids {set} -- 検索結果から除外する削除済みのベクトルのID
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+
+    Returns:
+        FAISS | MmapVectorStore | MultiVectorStore | FilteredVectorStore: まとめたベクトルストア
+    """
+    vector_store = vector_stores[0] if len(vector_stores) == 1 else MultiVectorStore(vector_stores, embedding_model)
+    if filtered_ids:
+        return FilteredVectorStore(vector_store, filtered_ids, embedding_model)
+    return vector_store
+
+def get_vector_store():
+    """
+    メモリに常駐しているベクトルストアを取得します。
+
+    まだ読み込まれていない場合のみ、ディスクから読み込みます。
+    呼び出し元は取得した参照を処理の終了まで使い続けるため、処理中に新しいバージョンへ差し替えられても影響を受けません。
+    他のワーカープロセスがインデックスファイルを更新した場合は、バックグラウンドで読み直します。
+
+    Returns:
+        FAISS | MmapVectorStore | MultiVectorStore: 常駐しているベクトルストア
+
+    Raises:
+        CustomGeneralException: ベクトルストアの読み込み時にエラーが発生した場合に発生
+    """
+    vector_store = _vector_store
+    if vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _load_and_set_vector_store()
+            vector_store = _vector_store
+    else:
+        _reload_if_embedding_version_changed()
+    return vector_store
+
+def reload_vector_store(update_index_files=None):
+    """
+    ディスクからベクトルストアを読み直し、常駐しているベクトルストアをアトミックに差し替えます。
+
+    新しいベクトルストアの読み込みが完了してから参照を差し替えるため、読み込み中も古いバージョンで検索できます。
+
+    Args:
+        update_index_files (Callable, optional): 読み込みの前にロックを取得した状態で実行する、インデックスファイルの差し替え処理
+
+    Raises:
+        CustomGeneralException: ベクトルストアの読み込み時にエラーが発生した場合に発生
+    """
+    with _vector_store_lock:
+        if update_index_files is not None:
+            update_index_files()
+        _load_and_set_vector_store()
+
+def refresh_vector_store(update_index_files=None):
+    """
+    前回の読み込み以降に追加されたインデックスファイルと削除済みのベクトルだけを読み込み、常駐しているベクトルストアに反映します。
+
+    処理量はコーパス全体ではなく変更の量に比例します。検索はロックを取得せずに常駐しているベクトルストアを参照するため、
+    読み込み済みのインデックスは変更せず、追加されたインデックスを検索対象に加え、読み込み済みのインデックスの削除済みのベクトルは検索結果から除外します。
+    追加されたインデックスの削除済みのベクトルは、検索に使用する前にremove_idsで取り除きます。
+    除外したベクトルはコンパクションでインデックスから取り除かれ、その際の読み直しで検索対象のベクトルストアの数も元に戻ります。
+    読み込み済みのインデックスファイルが削除された（コンパクションされた）場合や、まだ読み込まれていない場合は、すべて読み直します。
+
+    Args:
+        update_index_files (Callable, optional): 読み込みの前にロックを取得した状態で実行する、インデックスファイルの差し替え処理
+
+    Raises:
+        CustomGeneralException: ベクトルストアの読み込み時にエラーが発生した場合に発生
+    """
+    global _vector_store, _vector_store_version, _embedding_version
+    with _vector_store_lock:
+        if update_index_files is not None:
+            update_index_files()
+        embeddings_folder_path = get_embeddings_folder_path()
+        embedding_version = get_embedding_version(embeddings_folder_path)
+        index_names = get_embedding_index_names(embeddings_folder_path)
+        mmap_store_names = get_mmap_store_names(embeddings_folder_path)
+        store_names = set(index_names) | set(mmap_store_names)
+        state = _vector_store_state
+        if _vector_store is None or 'store_names' not in state or not state['store_names'] <= store_names:
+            _load_and_set_vector_store()
+            return
+
+        try:
+            embedding_model = get_embedding_model()
+            all_deleted_ids = get_deleted_embedding_ids(embeddings_folder_path)
+            new_vector_stores, new_flat_vector_stores = load_vector_store_files(
+                embeddings_folder_path,
+                [index_name for index_name in index_names if index_name not in state['store_names']],
+                [mmap_store_name for mmap_store_name in mmap_store_names if mmap_store_name not in state['store_names']],
+                embedding_model)
+            remaining_ids = remove_flat_deleted_ids(new_flat_vector_stores, all_deleted_ids)
+            # 新しい削除済みのベクトルのうち、追加された全件検索のインデックスから取り除けなかったものを検索結果から除外する
+            filtered_ids = state['filtered_ids'] | ((all_deleted_ids - state['deleted_ids']) & remaining_ids)
+            vector_stores = state['vector_stores'] + new_vector_stores
+            vector_store = wrap_vector_stores(vector_stores, filtered_ids, embedding_model)
+        except Exception as e:
+            raise CustomGeneralException(ERROR_MESSAGE_FAISS_VECTORSTORE_LOAD_EXCEPTION.format(reason=str(e)))
+
+        state.update(store_names=store_names, vector_stores=vector_stores, deleted_ids=all_deleted_ids, filtered_ids=filtered_ids)
+        _vector_store = vector_store
+        _vector_store_version += 1
+        _embedding_version = embedding_version
+        backlog_gen_ai_chat_logger.info(LOG_MESSAGE_VECTOR_STORE_UPDATED.format(version=_vector_store_version, added=len(new_vector_stores), filtered=len(filtered_ids)))
+
+def init_vector_store():
+    """
+    アプリケーション起動時にベクトルストアを読み込みます。
+
+    エンベディングファイルがまだ存在しない場合などに読み込みが失敗しても、起動は継続します。
+    """
+    try:
+        reload_vector_store()
+    except CustomGeneralException as cge:
+        backlog_gen_ai_chat_logger.info(cge.message)
+
+def get_vector_store_version() -> int:
+    """
+    常駐しているベクトルストアのバージョンを取得します。
+
+    Returns:
+        int: ベクトルストアのバージョン（未読み込みの場合は0）
+    """
+    return _vector_store_version
+
+def _load_and_set_vector_store():
+    """
+    ベクトルストアを読み込み、常駐しているベクトルストアを差し替えてバージョンを更新します。呼び出し元でロックを取得していること。
+
+    Raises:
+        CustomGeneralException: ベクトルストアの読み込み時にエラーが発生した場合に発生
+    """
+    global _vector_store, _vector_store_version, _embedding_version
+    # 読み込み中にファイルが更新された場合に次回読み直されるよう、読み込み前のバージョンを記録する
+    embedding_version = get_embedding_version(get_embeddings_folder_path())
+    state = {}
+    vector_store = load_vector_store(state)
+    _vector_store_state.clear()
+    _vector_store_state.update(state)
+    _vector_store = vector_store
+    _vector_store_version += 1
+    _embedding_version = embedding_version
+    backlog_gen_ai_chat_logger.info(LOG_MESSAGE_VECTOR_STORE_LOADED.format(version=_vector_store_version))
+
+def _reload_if_embedding_version_changed():
+    """
+    一定間隔でエンベディングフォルダのバージョンを確認し、変更されていればバックグラウンドで変更を反映します。
+    """
+    global _embedding_version_checked_at
+    now = time.monotonic()
+    if now - _embedding_version_checked_at < EMBEDDING_VERSION_CHECK_SECONDS:
+        return
+    _embedding_version_checked_at = now
+
+    if get_embedding_version(get_embeddings_folder_path()) != _embedding_version and not _vector_store_lock.locked():
+        threading.Thread(target=_refresh_vector_store_in_background, daemon=True).start()
+
+def _refresh_vector_store_in_background():
+    """
+    他のワーカープロセスによるインデックスファイルの変更を、常駐しているベクトルストアに反映します。
+    """
+    try:
+        refresh_vector_store()
+    except CustomGeneralException as cge:
+        backlog_gen_ai_chat_logger.info(cge.message)
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+from services.answer_cache_service import get_cached_answer, set_cached_answer, clear_answer_cache, normalize_query
+
+class TestAnswerCacheService(unittest.TestCase):
+    """answer_cache_serviceのテストクラスです。
+
+    回答キャッシュの完全一致・意味的一致による取得と、破棄が正しく動作するかをテストします。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。キャッシュを空にします。"""
+        clear_answer_cache()
+
+    def test_normalize_query(self):
+        """全角・半角、大文字・小文字、空白の違いが正規化されることを確認します。"""
+        self.assertEqual(normalize_query('  Ｂａｃｋｌｏｇ   API\nとは '), 'backlog api とは')
+
+    def test_exact_match(self):
+        """正規化したクエリと言語が一致する場合に回答を返すことを確認します。"""
+        set_cached_answer('What is Backlog?', 'ENGLISH', 1, 'answer', 'model')
+        self.assertEqual(get_cached_answer('what is  backlog?', 'ENGLISH', 1), {'answer': 'answer', 'model': 'model'})
+        self.assertIsNone(get_cached_answer('what is backlog?', 'JAPANESE', 1))
+
+    def test_semantic_match_is_disabled_by_default(self):
+        """既定では、ベクトルが非常に近い別のクエリ（否定や固有名詞だけが異なる質問）にも回答を返さないことを確認します。"""
+        set_cached_answer('How do I enable notifications?', 'ENGLISH', 1, 'answer', 'model', [1.0, 0.0])
+        self.assertIsNone(get_cached_answer('How do I disable notifications?', 'ENGLISH', 1, [0.999, 0.045]))
+
+    @patch('services.answer_cache_service.ANSWER_CACHE_SEMANTIC_DISTANCE', 0.02)
+    def test_semantic_match(self):
+        """意味的一致を有効にした場合、クエリのベクトルのコサイン距離がしきい値以下の場合のみ回答を返すことを確認します。"""
+        set_cached_answer('first query', 'ENGLISH', 1, 'answer', 'model', [1.0, 0.0])
+        self.assertEqual(get_cached_answer('second query', 'ENGLISH', 1, [0.99, 0.05]), {'answer': 'answer', 'model': 'model'})
+        # コサイン類似度0.97（距離0.03）の近いが別の質問には返さない
+        self.assertIsNone(get_cached_answer('third query', 'ENGLISH', 1, [0.97, 0.2431]))
+        self.assertIsNone(get_cached_answer('fourth query', 'ENGLISH', 1, [0.5, 0.5]))
+
+    def test_index_version_change_invalidates(self):
+        """ベクトルストアのバージョンが変わった場合、キャッシュが破棄されることを確認します。"""
+        set_cached_answer('query', 'ENGLISH', 1, 'answer', 'model')
+        self.assertIsNone(get_cached_answer('query', 'ENGLISH', 2))
+        self.assertIsNone(get_cached_answer('query', 'ENGLISH', 1))
+
+    @patch('services.answer_cache_service.ANSWER_CACHE_MAX_ENTRIES', 2)
+    def test_lru_eviction(self):
+        """上限を超えた場合、最も長く使われていない回答が削除されることを確認します。"""
+        set_cached_answer('first', 'ENGLISH', 1, 'first answer', 'model')
+        set_cached_answer('second', 'ENGLISH', 1, 'second answer', 'model')
+        get_cached_answer('first', 'ENGLISH', 1)
+        set_cached_answer('third', 'ENGLISH', 1, 'third answer', 'model')
+        self.assertEqual(get_cached_answer('first', 'ENGLISH', 1)['answer'], 'first answer')
+        self.assertIsNone(get_cached_answer('second', 'ENGLISH', 1))
+
+    @patch('services.answer_cache_service.ANSWER_CACHE_TTL_SECONDS', 0)
+    def test_ttl_expiration(self):
+        """有効期限を過ぎた回答を返さないことを確認します。"""
+        set_cached_answer('query', 'ENGLISH', 1, 'answer', 'model')
+        self.assertIsNone(get_cached_answer('query', 'ENGLISH', 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from unittest.mock import patch
+import faiss
+import json
+import os
+import tempfile
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from services import vector_store_service
+from services.compaction_service import compact_embedding, get_compaction_groups
+from config.constant import (
+    SUCCESS_MESSAGE_EMBEDDING_FILES_COMPACTION,
+    SUCCESS_MESSAGE_NO_EMBEDDING_FILES_FOR_COMPACTION,
+    EMBEDDING_COMPACTION_FOLDER_NAME,
+    EMBEDDING_STORE_FORMAT_FAISS,
+    EMBEDDING_STORE_FORMAT_MMAP,
+    EMBEDDING_INDEX_TYPE_IVF,
+    EMBEDDING_INDEX_TYPE_HNSW,
+    SUCCESS_MESSAGE_EMBEDDING_INDEX_BUILD)
+from utils.utils import get_deleted_embedding_ids, save_deleted_embedding_ids, get_embedding_index_names, get_mmap_store_names
+from utils.vector_stores import MmapVectorStore
+
+class TestCompactEmbedding(unittest.TestCase):
+    """compaction_serviceのテストクラスです。
+
+    インデックスファイルのコンパクションが正しく動作するかをテストします。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。
+
+        一時的なエンベディングフォルダを作成し、エンベディングフォルダのパスとEmbeddingモデルをモック化します。
+        """
+        self.embedding_model = FakeEmbeddings(size=8)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder_path = self.temp_dir.name
+        self.patchers = [
+            patch(target, return_value=self.folder_path)
+            for target in ['services.compaction_service.get_embeddings_folder_path', 'services.vector_store_service.get_embeddings_folder_path']
+        ] + [
+            patch(target, return_value=self.embedding_model)
+            for target in ['services.compaction_service.get_embedding_model', 'services.vector_store_service.get_embedding_model']
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        vector_store_service._vector_store = None
+
+    def tearDown(self):
+        """テスト実行後の後処理を行います。"""
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def save_index(self, index_name, texts):
+        """テスト用のインデックスファイルを保存します。"""
+        documents = [Document(page_content=text) for text in texts]
+        FAISS.from_documents(documents, self.embedding_model).save_local(folder_path=self.folder_path, index_name=index_name)
+
+    @patch('services.compaction_service.EMBEDDING_STORE_FORMAT', EMBEDDING_STORE_FORMAT_FAISS)
+    def test_compact_embedding_merges_shards(self):
+        """複数のインデックスファイルが1つにまとめられ、古いファイルが削除されることを確認します。"""
+        self.save_index('first', ['a', 'b'])
+        self.save_index('second', ['c'])
+        self.save_index('third', ['d', 'e'])
+        response = compact_embedding()
+        body = json.loads(response.body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body['message'], SUCCESS_MESSAGE_EMBEDDING_FILES_COMPACTION)
+        self.assertEqual(body['report']['shards_before'], 3)
+        self.assertEqual(body['report']['shards_after'], 1)
+        self.assertGreater(body['report']['bytes_reclaimed'], 0)
+        index_names = get_embedding_index_names(self.folder_path)
+        self.assertEqual(len(index_names), 1)
+        self.assertNotIn('first', index_names)
+        self.assertFalse(os.path.exists(os.path.join(self.folder_path, EMBEDDING_COMPACTION_FOLDER_NAME)))
+        self.assertEqual(vector_store_service.get_vector_store().index.ntotal, 5)
+
+    @patch('services.compaction_service.EMBEDDING_STORE_FORMAT', EMBEDDING_STORE_FORMAT_MMAP)
+    def test_compact_embedding_mmap_format(self):
+        """mmap形式の場合、FAISSのインデックスファイルがメモリマップ形式のベクトルストア1つにまとめられることを確認します。"""
+        self.save_index('first', ['a', 'b'])
+        self.save_index('second', ['c'])
+        response = compact_embedding()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_embedding_index_names(self.folder_path), [])
+        mmap_store_names = get_mmap_store_names(self.folder_path)
+        self.assertEqual(len(mmap_store_names), 1)
+        vector_store = vector_store_service.get_vector_store()
+        self.assertIsInstance(vector_store, MmapVectorStore)
+        self.assertEqual(vector_store.ntotal, 3)
+        self.assertEqual(len(vector_store.similarity_search('c', k=2)), 2)
+
+    @patch('services.compaction_service.EMBEDDING_STORE_FORMAT', EMBEDDING_STORE_FORMAT_MMAP)
+    def test_compact_embedding_purges_deleted_ids(self):
+        """削除済みのベクトルがコンパクション時に取り除かれ、削除済みのベクトルの一覧から削除されることを確認します。"""
+        for index_name, texts in [('first', ['a', 'b']), ('second', ['c'])]:
+            documents = [Document(page_content=text, metadata={'EmbeddingId': text}) for text in texts]
+            FAISS.from_documents(documents, self.embedding_model, ids=texts).save_local(folder_path=self.folder_path, index_name=index_name)
+        save_deleted_embedding_ids(self.folder_path, ['b', 'not-compacted'])
+        response = compact_embedding()
+        self.assertEqual(json.loads(response.body)['report']['vectors_purged'], 1)
+        self.assertEqual(get_deleted_embedding_ids(self.folder_path), {'not-compacted'})
+        vector_store = vector_store_service.get_vector_store()
+        documents = vector_store.similarity_search('a', k=3)
+        self.assertEqual(sorted(document.page_content for document in documents), ['a', 'c'])
+
+    def test_compact_embedding_single_shard(self):
+        """インデックスファイルが1つだけの場合、何もしないことを確認します。"""
+        self.save_index('first', ['a'])
+        response = compact_embedding()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.body), {"message": SUCCESS_MESSAGE_NO_EMBEDDING_FILES_FOR_COMPACTION})
+        self.assertEqual(get_embedding_index_names(self.folder_path), ['first'])
+
+    @patch('services.compaction_service.EMBEDDING_STORE_FORMAT', EMBEDDING_STORE_FORMAT_FAISS)
+    @patch('utils.vector_stores.EMBEDDING_INDEX_TYPE', EMBEDDING_INDEX_TYPE_IVF)
+    @patch('utils.vector_stores.EMBEDDING_ANN_MIN_VECTORS', 0)
+    def test_build_embedding_index_ivf(self):
+        """インデックスの作成で、すべてのインデックスがIVFのインデックス1つに作り直されることを確認します。"""
+        self.save_index('first', [str(number) for number in range(60)])
+        self.save_index('second', [str(number) for number in range(60, 100)])
+        response = compact_embedding(full_rebuild=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.body)['message'], SUCCESS_MESSAGE_EMBEDDING_INDEX_BUILD)
+        self.assertEqual(len(get_embedding_index_names(self.folder_path)), 1)
+        vector_store = vector_store_service.get_vector_store()
+        self.assertIsInstance(vector_store.index, faiss.IndexIVF)
+        self.assertEqual(vector_store.index.ntotal, 100)
+        self.assertEqual(len(vector_store.similarity_search('1', k=4)), 4)
+
+    @patch('services.compaction_service.EMBEDDING_STORE_FORMAT', EMBEDDING_STORE_FORMAT_MMAP)
+    @patch('utils.vector_stores.EMBEDDING_INDEX_TYPE', EMBEDDING_INDEX_TYPE_HNSW)
+    @patch('utils.vector_stores.EMBEDDING_ANN_MIN_VECTORS', 0)
+    def test_build_embedding_index_hnsw_mmap_format(self):
+        """mmap形式でHNSWを指定した場合、HNSWのインデックスを読み込んで検索できることを確認します。"""
+        self.save_index('first', [str(number) for number in range(50)])
+        response = compact_embedding(full_rebuild=True)
+        self.assertEqual(response.status_code, 200)
+        vector_store = vector_store_service.get_vector_store()
+        self.assertIsInstance(vector_store, MmapVectorStore)
+        self.assertIsInstance(vector_store.index, faiss.IndexHNSW)
+        query = vector_store.vectors[7].tolist()
+        self.assertEqual(vector_store.similarity_search_by_vector(query, k=1)[0].page_content, '7')
+
+    @patch('services.compaction_service.EMBEDDING_COMPACTION_MAX_SHARD_BYTES', 100)
+    def test_get_compaction_groups(self):
+        """最大サイズに達したインデックスを除外し、最大サイズを超えないようにグループ化されることを確認します。"""
+        index_sizes = {'a': 40, 'b': 40, 'c': 150, 'd': 40, 'e': 30}
+        groups = get_compaction_groups(['a', 'b', 'c', 'd', 'e'], index_sizes)
+        self.assertEqual(groups, [['a', 'b'], ['d', 'e']])
+
+if __name__ == '__main__':
+    unittest.main()
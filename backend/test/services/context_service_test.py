@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from services.context_service import pack_context, merge_contents
+
+class TestContextService(unittest.TestCase):
+    """context_serviceのテストクラスです。
+
+    トークン数は文字数として計算します。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。"""
+        token_count_patcher = patch('services.context_service.get_token_count', side_effect=len)
+        token_count_patcher.start()
+        self.addCleanup(token_count_patcher.stop)
+        self.text = 'Backlog is a project management tool for teams. It supports tasks, wikis and git repositories.'
+
+    def create_document(self, content, source='https://example.com/a', datastore_id=1, title='Backlog'):
+        """テスト用のドキュメントを作成します。"""
+        return Document(page_content=content, metadata={'Source': source, 'Title': title, 'DatastoreId': datastore_id, 'Keywords': 'keyword'})
+
+    def test_merge_contents(self):
+        """オーバーラップが一致するチャンクを順序に関わらず1つにつなげ、含まれるチャンクは取り除くことを確認します。"""
+        first, second = self.text[:60], self.text[30:]
+        self.assertEqual(merge_contents(first, second), self.text)
+        self.assertEqual(merge_contents(second, first), self.text)
+        self.assertEqual(merge_contents(self.text, self.text[10:40]), self.text)
+        self.assertIsNone(merge_contents(self.text[:40], self.text[50:]))
+
+    def test_pack_context_merges_same_source(self):
+        """同じソースのチャンクをマージし、スコア順に簡潔な形式で出力することを確認します。"""
+        documents_with_scores = [
+            (self.create_document('Other source content.', source='https://example.com/b', datastore_id=2, title='Other'), 0.2),
+            (self.create_document(self.text[30:]), 0.3),
+            (self.create_document(self.text[:60]), 0.1),
+            (self.create_document(self.text[:60]), 0.4)]
+        context = pack_context(documents_with_scores)
+        self.assertEqual(context, f"[1] Backlog\nSource: https://example.com/a\n{self.text}\n\n[2] Other\nSource: https://example.com/b\nOther source content.")
+        self.assertNotIn('keyword', context)
+
+    def test_pack_context_token_budget(self):
+        """トークン数の上限に収まらないパッセージを出力しないことを確認します。"""
+        documents_with_scores = [
+            (self.create_document(self.text), 0.1),
+            (self.create_document('Short.', source='https://example.com/b', datastore_id=2, title='Other'), 0.2)]
+        context = pack_context(documents_with_scores, max_tokens=60)
+        self.assertEqual(context, '[1] Other\nSource: https://example.com/b\nShort.')
+
+if __name__ == '__main__':
+    unittest.main()
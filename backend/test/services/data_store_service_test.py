@@ -1,79 +1,251 @@
 import unittest
-from unittest.mock import MagicMock
-from pandas.errors import ParserError
+from unittest.mock import MagicMock, patch
+from io import BytesIO
+from openpyxl import Workbook
+import pyarrow
+import pyarrow.parquet
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
 import json
+from models import data_store
+from models.data_store import Datastore
 from services.data_store_service import upload_file
 from config.constant import (
-    ERROR_MESSAGE_NOT_EXCEL_FILE,
+    ERROR_MESSAGE_UNSUPPORTED_FILE_FORMAT,
     SUCCESS_MESSAGE_FILE_UPLOAD,
     ERROR_MESSAGE_GENERAL,
-    ERROR_MESSAGE_PANDAS_PARSER_FAIL
+    ERROR_MESSAGE_UPLOAD_MISSING_COLUMNS,
+    ERROR_MESSAGE_UPLOAD_EMPTY_VALUE,
+    ERROR_MESSAGE_UPLOAD_VALUE_TOO_LONG
 )
 
-class TestDataStoreService(unittest.TestCase):
+HEADER = ["Keywords", "Title", "Source", "Content", "Category"]
+
+def create_excel_file(rows, header=HEADER):
+    """
+    テスト用のExcelファイルを作成する
+    """
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(header)
+    for row in rows:
+        worksheet.append(row)
+    file = BytesIO()
+    workbook.save(file)
+    file.seek(0)
+    return MagicMock(filename="test.xlsx", file=file)
+
+async def collect_responses(gen):
+    """
+    アップロードのレスポンスをすべて取得する
+    """
+    return [json.loads(response.body) async for response in gen]
+
+class TestDataStoreService(unittest.IsolatedAsyncioTestCase):
     """
-    データストアサービスのテスト用のモックデータベースを作成する
+    データストアサービスのテスト用のインメモリデータベースを作成する
     """
-    def setUp(self):
+    async def asyncSetUp(self):
+        """
+        テスト用のデータストアサービスのインメモリデータベースを作成する
+        """
+        self.engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(data_store.Base.metadata.create_all)
+        self.db = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)()
+
+    async def asyncTearDown(self):
+        """
+        テスト用のインメモリデータベースを破棄する
+        """
+        await self.db.close()
+        await self.engine.dispose()
+
+    async def get_saved_titles(self):
         """
-        テスト用のデータストアサービスのモックデータベースを作成する
+        保存されたデータのタイトルを取得する
         """
-        self.mock_db = MagicMock()
+        return (await self.db.execute(select(Datastore.Title).order_by(Datastore.Id))).scalars().all()
 
-    def test_upload_file_invalid_file_format(self):
+    async def test_upload_file_invalid_file_format(self):
         """
         アップロードされたファイルの形式が正しくない場合
         """
-        file = MagicMock(filename="test.txt")
-        response = upload_file(file, self.mock_db)
-        self.assertEqual(response.status_code, 400)
-        self.assertEqual(json.loads(response.body), {"error": ERROR_MESSAGE_NOT_EXCEL_FILE})
+        file = MagicMock(filename="test.txt", file=BytesIO(b"Keywords,Title"))
+        responses = [response async for response in upload_file(file, self.db)]
+        self.assertEqual(responses[-1].status_code, 400)
+        self.assertEqual(json.loads(responses[-1].body), {"status": "done", "error": ERROR_MESSAGE_UNSUPPORTED_FILE_FORMAT})
 
-    def test_upload_file_successful_upload(self):
+    @patch("services.data_store_service.DATA_STORE_UPLOAD_CHUNK_ROWS", 2)
+    async def test_upload_file_successful_upload(self):
         """
         正常にファイルをアップロードできる場合のテスト
 
         テストの検証
-        - アップロードに成功したことを示すレスポンスコード200が返却されること
+        - チャンクを保存するたびに、保存した行数が返却されること
         - アップロードに成功したことを示すメッセージがレスポンスボディに含まれていること
+        - 空の行を除くすべての行が、数値も文字列として保存されること
+        """
+        rows = [[f"kw{index}", f"Title{index}", f"Source{index}", f"Content{index}", index] for index in range(5)]
+        rows.insert(2, [None] * 5)
+        responses = await collect_responses(upload_file(create_excel_file(rows), self.db))
+        self.assertEqual([response["rows"] for response in responses if response["status"] == "processing"], [2, 4, 5])
+        self.assertEqual(responses[-1], {"status": "done", "message": SUCCESS_MESSAGE_FILE_UPLOAD, "rows": 5, "inserted": 5, "updated": 0, "unchanged": 0})
+        self.assertEqual(await self.get_saved_titles(), [f"Title{index}" for index in range(5)])
+        saved = (await self.db.execute(select(Datastore).where(Datastore.Title == "Title4"))).scalars().one()
+        self.assertEqual(saved.Category, "4")
+        self.assertFalse(saved.IsUserForEmbedding)
+
+    @patch("services.data_store_service.DATA_STORE_UPLOAD_CHUNK_ROWS", 2)
+    async def test_upload_file_is_idempotent(self):
+        """
+        同じキー（SourceとTitle）の行を再度アップロードした場合のテスト
+
+        テストの検証
+        - 変更されていない行は追加も更新もされず、データが重複しないこと
+        - 内容が変更された行は更新され、Embedding済みフラグがFalseに戻ること
+        - 同じファイル内で重複する行は1行として保存されること
+        """
+        rows = [[f"kw{index}", f"Title{index}", "Source", f"Content{index}", "Cat"] for index in range(3)]
+        responses = await collect_responses(upload_file(create_excel_file(rows + [rows[0]]), self.db))
+        self.assertEqual({key: responses[-1][key] for key in ["inserted", "updated", "unchanged"]}, {"inserted": 3, "updated": 0, "unchanged": 1})
+
+        async with self.db.begin():
+            await self.db.execute(Datastore.__table__.update().values(IsUserForEmbedding=True))
+
+        rows[1][3] = "Changed content"
+        rows.append(["kw3", "Title3", "Source", "Content3", "Cat"])
+        responses = await collect_responses(upload_file(create_excel_file(rows), self.db))
+        self.assertEqual({key: responses[-1][key] for key in ["inserted", "updated", "unchanged"]}, {"inserted": 1, "updated": 1, "unchanged": 2})
+
+        saved = (await self.db.execute(select(Datastore.Title, Datastore.Content, Datastore.IsUserForEmbedding).order_by(Datastore.Id))).all()
+        self.assertEqual([tuple(row) for row in saved], [
+            ("Title0", "Content0", True),
+            ("Title1", "Changed content", False),
+            ("Title2", "Content2", True),
+            ("Title3", "Content3", False)])
+
+    async def test_upload_file_missing_columns(self):
+        """
+        アップロードされたExcelファイルに必要な列がない場合
+
+        テストの検証
+        - 足りない列を示すメッセージが返却され、データが保存されないこと
+        """
+        file = create_excel_file([["kw", "Title", "Source", "Content"]], header=HEADER[:4])
+        responses = await collect_responses(upload_file(file, self.db))
+        self.assertEqual(responses[-1]["error"], ERROR_MESSAGE_UPLOAD_MISSING_COLUMNS.format(columns="Category"))
+        self.assertEqual(await self.get_saved_titles(), [])
+
+    @patch("services.data_store_service.DATA_STORE_UPLOAD_CHUNK_ROWS", 2)
+    async def test_upload_file_invalid_value_keeps_committed_chunks(self):
         """
-        file = MagicMock(filename="test.xlsx")
-        file.file = MagicMock()
-        data_frame = MagicMock(iterrows=lambda: [(0, {"Keywords": "kw1", "Title": "Title1", "Source": "Source1", "Content": "Content1", "Category": "Cat1"})])
-        with unittest.mock.patch("services.data_store_service.pd.read_excel", return_value=data_frame):
-            response = upload_file(file, self.mock_db)
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(json.loads(response.body), {"message": SUCCESS_MESSAGE_FILE_UPLOAD})
+        途中の行の値が不正な場合
 
-    def test_upload_file_pandas_parser_error(self):
+        テストの検証
+        - 不正な値の列と行番号を示すメッセージが返却されること
+        - 不正な値を含むチャンクは保存されず、それまでにコミットしたチャンクは保存されていること
+        """
+        rows = [[f"kw{index}", f"Title{index}", f"Source{index}", f"Content{index}", "Cat"] for index in range(4)]
+        rows[3][0] = None
+        responses = await collect_responses(upload_file(create_excel_file(rows), self.db))
+        self.assertEqual(responses[-1], {"status": "done", "error": ERROR_MESSAGE_UPLOAD_EMPTY_VALUE.format(column="Keywords", row=5), "rows": 2, "inserted": 2, "updated": 0, "unchanged": 0})
+        self.assertEqual(await self.get_saved_titles(), ["Title0", "Title1"])
+
+    async def test_upload_file_value_too_long(self):
+        """
+        値が列の最大文字数を超える場合
+        """
+        rows = [["kw", "T" * 256, "Source", "Content", "Cat"]]
+        responses = await collect_responses(upload_file(create_excel_file(rows), self.db))
+        self.assertEqual(responses[-1]["error"], ERROR_MESSAGE_UPLOAD_VALUE_TOO_LONG.format(column="Title", row=2, max_length=255))
+
+    async def test_upload_file_parser_error(self):
         """
         アップロードされたExcelファイルの形式が不正な場合
 
         テストの検証
         - アップロードに失敗したことを示すレスポンスコード400が返却されること
-        - アップロードに失敗した理由を示すメッセージがレスポンスボディに含まれていること
         """
-        file = MagicMock(filename="test.xlsx")
-        file.file = MagicMock()
-        with unittest.mock.patch("services.data_store_service.pd.read_excel", side_effect=ParserError("Error parsing Excel file")):
-            response = upload_file(file, self.mock_db)
-        self.assertEqual(response.status_code, 400)
-        self.assertEqual(json.loads(response.body), {"error": ERROR_MESSAGE_PANDAS_PARSER_FAIL.format(reason="Error parsing Excel file")})
+        file = MagicMock(filename="test.xlsx", file=BytesIO(b"PK\x03\x04not an excel file"))
+        responses = [response async for response in upload_file(file, self.db)]
+        self.assertEqual(responses[-1].status_code, 400)
+
+    @patch("services.data_store_service.DATA_STORE_UPLOAD_CHUNK_ROWS", 2)
+    async def test_upload_file_csv(self):
+        """
+        CSVファイルをアップロードできる場合のテスト（拡張子から判定する）
+        """
+        content = "Keywords,Title,Source,Content,Category\n" + "".join(f"kw{index},Title{index},Source{index},\"Content, {index}\",Cat\n" for index in range(3))
+        file = MagicMock(filename="test.CSV", file=BytesIO(content.encode("utf-8-sig")))
+        responses = await collect_responses(upload_file(file, self.db))
+        self.assertEqual(responses[-1]["message"], SUCCESS_MESSAGE_FILE_UPLOAD)
+        self.assertEqual(responses[-1]["rows"], 3)
+        self.assertEqual(await self.get_saved_titles(), ["Title0", "Title1", "Title2"])
+        contents = (await self.db.execute(select(Datastore.Content).order_by(Datastore.Id))).scalars().all()
+        self.assertEqual(contents[1], "Content, 1")
+
+    async def test_upload_file_jsonl(self):
+        """
+        JSON Linesファイルをアップロードできる場合のテスト（拡張子ではなく内容から判定する）
+
+        テストの検証
+        - 空の行は読み飛ばし、キーがない値は不正な値として行番号が返却されること
+        """
+        records = [{"Keywords": "kw", "Title": f"Title{index}", "Source": "Source", "Content": "Content", "Category": "Cat"} for index in range(2)]
+        content = "\n".join(json.dumps(record) for record in records) + "\n\n"
+        file = MagicMock(filename="knowledge_base.txt", file=BytesIO(content.encode("utf-8")))
+        responses = await collect_responses(upload_file(file, self.db))
+        self.assertEqual(responses[-1]["message"], SUCCESS_MESSAGE_FILE_UPLOAD)
+        self.assertEqual(responses[-1]["rows"], 2)
+        self.assertEqual(await self.get_saved_titles(), ["Title0", "Title1"])
+
+        content += json.dumps({"Keywords": "kw", "Title": "Title2", "Source": "Source", "Content": "Content"})
+        file = MagicMock(filename="knowledge_base.jsonl", file=BytesIO(content.encode("utf-8")))
+        responses = await collect_responses(upload_file(file, self.db))
+        self.assertEqual(responses[-1]["error"], ERROR_MESSAGE_UPLOAD_EMPTY_VALUE.format(column="Category", row=4))
+
+    async def test_upload_file_jsonl_parser_error(self):
+        """
+        JSON Linesファイルに、JSONオブジェクトではない行がある場合
+        """
+        file = MagicMock(filename="knowledge_base.jsonl", file=BytesIO(b'{"Keywords": "kw"}\n[1, 2]\n'))
+        responses = [response async for response in upload_file(file, self.db)]
+        self.assertEqual(responses[-1].status_code, 400)
+
+    @patch("services.data_store_service.DATA_STORE_UPLOAD_CHUNK_ROWS", 2)
+    async def test_upload_file_parquet(self):
+        """
+        Parquetファイルを、レコードバッチごとにアップロードできる場合のテスト
+        """
+        table = pyarrow.table({
+            "Keywords": [f"kw{index}" for index in range(3)],
+            "Title": [f"Title{index}" for index in range(3)],
+            "Source": ["Source"] * 3,
+            "Content": ["Content"] * 3,
+            "Category": ["Cat"] * 3})
+        file = BytesIO()
+        pyarrow.parquet.write_table(table, file)
+        file.seek(0)
+        responses = await collect_responses(upload_file(MagicMock(filename="test.parquet", file=file), self.db))
+        self.assertEqual([response["rows"] for response in responses], [2, 3, 3])
+        self.assertEqual(await self.get_saved_titles(), ["Title0", "Title1", "Title2"])
 
-    def test_upload_file_general_error(self):
+    async def test_upload_file_general_error(self):
         """
-        アップロードされたExcelファイルの形式が不正な場合（パーサーエラー以外のエラー）
+        データベースへの保存に失敗した場合（パーサーエラー以外のエラー）
 
         テストの検証
         - アップロードに失敗したことを示すレスポンスコード500が返却されること
         - アップロードに失敗した理由を示すメッセージがレスポンスボディに含まれていること
         """
-        file = MagicMock(filename="test.xlsx")
-        file.file = MagicMock()
-        with unittest.mock.patch("services.data_store_service.pd.read_excel", side_effect=Exception("General error")):
-            response = upload_file(file, self.mock_db)
-        self.assertEqual(response.status_code, 500)
-        self.assertEqual(json.loads(response.body), {"error": ERROR_MESSAGE_GENERAL.format(reason="General error")})
+        db = MagicMock(AsyncSession)
+        db.execute.side_effect = Exception("General error")
+        rows = [["kw", "Title", "Source", "Content", "Cat"]]
+        responses = [response async for response in upload_file(create_excel_file(rows), db)]
+        self.assertEqual(responses[-1].status_code, 500)
+        self.assertEqual(json.loads(responses[-1].body), {"status": "done", "error": ERROR_MESSAGE_GENERAL.format(reason="General error"), "rows": 0, "inserted": 0, "updated": 0, "unchanged": 0})
 
 if __name__ == '__main__':
     unittest.main()
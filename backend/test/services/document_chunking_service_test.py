@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+from langchain.docstore.document import Document
+from services.document_chunking_service import (
+    get_chunking_settings,
+    get_text_splitter,
+    iter_document_chunks,
+    shutdown_chunking_executor)
+
+# 文字数で分割する設定（テスト環境ではtiktokenのエンコーディングをダウンロードできないため）
+CATEGORY_SETTINGS = {
+    'Short': {'chunk_size': 10, 'chunk_overlap': 0},
+    'Long': {'chunk_size': 40},
+}
+
+def create_documents():
+    """Categoryの異なるドキュメントを作成します。"""
+    return [
+        Document(page_content=f'Document {index} ' + 'word ' * 10, metadata={'Category': 'Short' if index % 2 else 'Long', 'DatastoreId': index})
+        for index in range(6)
+    ]
+
+@patch('services.document_chunking_service.DOCUMENT_CHUNK_CATEGORY_SETTINGS', CATEGORY_SETTINGS)
+@patch('services.document_chunking_service.DOCUMENT_CHUNK_SPLITTER', 'character')
+@patch('services.document_chunking_service.DOCUMENT_CHUNK_SIZE', 20)
+@patch('services.document_chunking_service.DOCUMENT_CHUNK_OVERLAP', 5)
+@patch('services.document_chunking_service.DOCUMENT_CHUNK_TASK_DOCUMENTS', 2)
+class TestDocumentChunkingService(unittest.TestCase):
+    """document_chunking_serviceのテストクラスです。"""
+
+    def get_expected_chunks(self, documents):
+        """ドキュメントごとに、Categoryの設定のスプリッターで分割したチャンクを取得します。"""
+        return [chunk for document in documents for chunk in get_text_splitter(*get_chunking_settings(document.metadata['Category'])).split_documents([document])]
+
+    def test_get_chunking_settings(self):
+        """Categoryの設定に指定されていない項目は、既定値を使用することを確認します。"""
+        self.assertEqual(get_chunking_settings('Short'), ('character', 10, 0, 'gpt2'))
+        self.assertEqual(get_chunking_settings('Long'), ('character', 40, 5, 'gpt2'))
+        self.assertEqual(get_chunking_settings('Unknown'), ('character', 20, 5, 'gpt2'))
+
+    @patch('services.document_chunking_service.DOCUMENT_CHUNK_WORKERS', 1)
+    def test_iter_document_chunks_in_process(self):
+        """プロセスプールを使用しない場合も、タスクごとにCategoryの設定で分割したチャンクを返すことを確認します。"""
+        documents = create_documents()
+        chunk_batches = list(iter_document_chunks(documents))
+        self.assertEqual(len(chunk_batches), 3)
+        self.assertEqual([chunk for chunks in chunk_batches for chunk in chunks], self.get_expected_chunks(documents))
+        self.assertTrue(all(len(chunk.page_content) <= 10 for chunk in chunk_batches[0] if chunk.metadata['Category'] == 'Short'))
+
+    @patch('services.document_chunking_service.DOCUMENT_CHUNK_WORKERS', 2)
+    def test_iter_document_chunks_in_process_pool(self):
+        """プロセスプールで分割した場合も、ドキュメントの順序どおりに同じチャンクを返すことを確認します。"""
+        self.addCleanup(shutdown_chunking_executor)
+        documents = create_documents()
+        chunks = [chunk for chunks in iter_document_chunks(documents) for chunk in chunks]
+        self.assertEqual(chunks, self.get_expected_chunks(documents))
+        self.assertEqual(list(dict.fromkeys(chunk.metadata['DatastoreId'] for chunk in chunks)), list(range(6)))
+
+    def test_unsupported_splitter(self):
+        """分割方法が不正な場合は、ValueErrorが発生することを確認します。"""
+        with self.assertRaises(ValueError):
+            get_text_splitter('unknown', 10, 0, 'gpt2')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import sessionmaker
+from models.embedding_cache import Base, EmbeddingCache
+from services.embedding_cache_service import embed_documents_with_cache, get_text_hash, save_cached_embeddings
+from utils.database import get_insert_ignore_statement
+
+class TestEmbedDocumentsWithCache(unittest.TestCase):
+    """embed_documents_with_cache関数のテストクラスです。
+
+    SQLiteのインメモリデータベースを使用して、キャッシュの保存と再利用をテストします。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。
+
+        SQLiteのインメモリデータベースにテーブルを作成し、埋め込みモデルをモック化します。
+        """
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.db_session = sessionmaker(bind=engine)()
+        self.embedding_model = MagicMock()
+        self.embedding_model.model = "test-model"
+        self.embedding_model.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.5] for text in texts]
+        token_count_patcher = patch('services.embedding_pipeline_service.get_embedding_token_count', side_effect=len)
+        token_count_patcher.start()
+        self.addCleanup(token_count_patcher.stop)
+
+    def tearDown(self):
+        """テスト実行後の後処理を行います。"""
+        self.db_session.close()
+
+    def test_first_run_embeds_and_saves(self):
+        """キャッシュが空の場合、重複を除いたテキストをベクトル化してキャッシュに保存することを確認します。"""
+        vectors, cache_stats = embed_documents_with_cache(self.db_session, self.embedding_model, ["a", "bb", "a"])
+        self.assertEqual(vectors, [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]])
+        # 重複を除いてベクトル化したテキストのトークン数のみ数える
+        self.assertEqual(cache_stats, {"hits": 0, "misses": 3, "hit_rate": 0, "tokens": 3})
+        self.embedding_model.embed_documents.assert_called_once_with(["a", "bb"])
+        self.assertEqual(self.db_session.query(EmbeddingCache).count(), 2)
+
+    def test_unchanged_texts_make_no_api_calls(self):
+        """キャッシュ済みのテキストのみの場合、Embedding APIを呼び出さないことを確認します。"""
+        embed_documents_with_cache(self.db_session, self.embedding_model, ["a", "bb"])
+        self.embedding_model.embed_documents.reset_mock()
+        vectors, cache_stats = embed_documents_with_cache(self.db_session, self.embedding_model, ["bb", "a"])
+        self.assertEqual(vectors, [[2.0, 0.5], [1.0, 0.5]])
+        self.assertEqual(cache_stats, {"hits": 2, "misses": 0, "hit_rate": 1.0, "tokens": 0})
+        self.embedding_model.embed_documents.assert_not_called()
+
+    def test_cache_is_keyed_by_model_name(self):
+        """埋め込みモデル名が異なる場合、キャッシュを使用しないことを確認します。"""
+        embed_documents_with_cache(self.db_session, self.embedding_model, ["a"])
+        self.embedding_model.model = "other-model"
+        _, cache_stats = embed_documents_with_cache(self.db_session, self.embedding_model, ["a"])
+        self.assertEqual(cache_stats["misses"], 1)
+        self.assertEqual(self.db_session.query(EmbeddingCache).filter(EmbeddingCache.TextHash == get_text_hash("a")).count(), 2)
+
+    def test_concurrently_saved_texts_are_ignored(self):
+        """確認後に他の処理が同じテキストのベクトルを保存していた場合も、一意制約のエラーにならないことを確認します。"""
+        embed_documents_with_cache(self.db_session, self.embedding_model, ["a"])
+        with patch('services.embedding_cache_service.get_cached_embeddings', return_value={}):
+            vectors, _ = embed_documents_with_cache(self.db_session, self.embedding_model, ["a", "bb"])
+        self.assertEqual(vectors, [[1.0, 0.5], [2.0, 0.5]])
+        self.assertEqual(self.db_session.query(EmbeddingCache).count(), 2)
+
+    @patch('services.embedding_cache_service.Session')
+    def test_cache_is_committed_in_own_transaction(self, mock_session):
+        """SQLite以外では、呼び出し元のトランザクションとは別のトランザクションで保存することを確認します。"""
+        db_session = MagicMock()
+        db_session.get_bind.return_value.dialect.name = 'mysql'
+        save_cached_embeddings(db_session, "test-model", {get_text_hash("a"): [1.0, 0.5]})
+        db_session.execute.assert_not_called()
+        cache_db = mock_session.return_value.__enter__.return_value
+        cache_db.begin.assert_called_once()
+        statement = cache_db.execute.call_args[0][0]
+        self.assertIn('ON DUPLICATE KEY UPDATE', str(statement.compile(dialect=mysql.dialect())))
+
+    def test_insert_ignore_statement_for_other_databases(self):
+        """対応していないデータベースでは、通常のINSERT文を使用することを確認します。"""
+        statement = get_insert_ignore_statement('oracle', EmbeddingCache.__table__)
+        self.assertNotIn('ON CONFLICT', str(statement))
+        self.assertNotIn('ON DUPLICATE KEY', str(statement))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.orm import sessionmaker
+from langchain.docstore.document import Document
+from models import data_store, embedding_vector, embedding_job
+from models.data_store import Datastore
+from models.embedding_vector import EmbeddingVector
+from models.embedding_job import EmbeddingJob
+from services.embedding_job_service import (
+    submit_embedding_job,
+    run_embedding_job_now,
+    get_embedding_job,
+    cancel_embedding_job,
+    resume_embedding_jobs,
+    run_embedding_job)
+from config.constant import (
+    EMBEDDING_JOB_ACTIVE_KEY,
+    SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION,
+    EMBEDDING_JOB_STATUS_QUEUED,
+    EMBEDDING_JOB_STATUS_RUNNING,
+    EMBEDDING_JOB_STATUS_COMPLETED,
+    EMBEDDING_JOB_STATUS_CANCELLED,
+    EMBEDDING_JOB_STATUS_FAILED)
+from datetime import datetime, timedelta
+from utils.utils import get_deleted_embedding_ids
+import json
+import os
+import tempfile
+import threading
+
+def iter_document_chunks(documents):
+    """ドキュメントごとに、分割せずに1つのチャンクとして返します（テスト用）。"""
+    return iter([[Document(page_content=document.page_content, metadata={"DatastoreId": document.metadata["DatastoreId"]})] for document in documents])
+
+def enable_wal(dbapi_connection, connection_record):
+    """書き込み中も読み込みを続けられるよう、SQLiteをWALモードにします（MySQLでは不要）。"""
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+@patch('services.embedding_job_service.EMBEDDING_JOB_BATCH_ROWS', 2)
+@patch('services.embedding_job_service.compact_embedding_if_needed')
+@patch('services.embedding_job_service.refresh_vector_store')
+@patch('services.embedding_service.embed_documents_with_cache', side_effect=lambda db, model, texts: ([[1.0, 0.0]] * len(texts), {"tokens": sum(len(text) for text in texts)}))
+@patch('services.embedding_job_service.get_embedding_model')
+@patch('services.embedding_job_service.iter_document_chunks', side_effect=iter_document_chunks)
+class TestEmbeddingJobService(unittest.TestCase):
+    """embedding_job_serviceのテストクラスです。
+
+    SQLiteのファイルデータベースを使用して、バッチごとのコミット、再開、キャンセルをテストします。
+    インデックスファイルの書き込みは、インデックス名のファイルを作成するだけのモックに置き換えます。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。
+
+        5件の未処理のデータを登録します。
+        """
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.embeddings_folder_path = os.path.join(temp_dir.name, 'embeddings')
+        os.mkdir(self.embeddings_folder_path)
+
+        self.engine = create_engine(f"sqlite:///{os.path.join(temp_dir.name, 'test.db')}")
+        event.listen(self.engine, 'connect', enable_wal)
+        self.addCleanup(self.engine.dispose)
+        for base in [data_store.Base, embedding_vector.Base, embedding_job.Base]:
+            base.metadata.create_all(bind=self.engine)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        db = self.session_factory()
+        db.add_all([Datastore(Id=index, Keywords='kw', Title=f'Title{index}', Source='Source', Content='Content', Category='Cat', IsUserForEmbedding=False) for index in range(1, 6)])
+        db.commit()
+        db.close()
+        self.db_session = self.session_factory()
+        self.addCleanup(self.db_session.close)
+
+        folder_patcher = patch('services.embedding_job_service.get_embeddings_folder_path', return_value=self.embeddings_folder_path)
+        folder_patcher.start()
+        self.addCleanup(folder_patcher.stop)
+        self.create_embeddings_patcher = patch('services.embedding_job_service.create_embeddings', side_effect=self.create_embeddings)
+        self.mock_create_embeddings = self.create_embeddings_patcher.start()
+        self.addCleanup(self.create_embeddings_patcher.stop)
+        self.executor_patcher = patch('services.embedding_job_service._embedding_job_executor')
+        self.mock_executor = self.executor_patcher.start()
+        self.mock_executor.submit.side_effect = lambda func, *args: func(*args)
+        self.addCleanup(self.executor_patcher.stop)
+        # 占有期間が切れたジョブの定期的な確認は行わない
+        watcher_patcher = patch('services.embedding_job_service._watch_embedding_jobs')
+        watcher_patcher.start()
+        self.addCleanup(watcher_patcher.stop)
+
+    def create_embeddings(self, chunks, vectors, embedding_model, embeddings_folder_path, index_name):
+        """インデックス名のファイルを作成し、チャンクのレコードを返します（テスト用）。"""
+        open(os.path.join(embeddings_folder_path, index_name + '.faiss'), 'w').close()
+        return [{"id": f"{index_name}-{position}", "page_content": chunk.page_content, "metadata": chunk.metadata} for position, chunk in enumerate(chunks)]
+
+    def add_job(self, **values):
+        """ジョブを登録してIDを返します。"""
+        db = self.session_factory()
+        db.add(EmbeddingJob(**{'Id': 'job-1', 'Status': EMBEDDING_JOB_STATUS_QUEUED, 'CancelRequested': False, 'ActiveKey': EMBEDDING_JOB_ACTIVE_KEY, **values}))
+        db.commit()
+        db.close()
+        return 'job-1'
+
+    def get_job(self, job_id):
+        """ジョブの進捗を取得します。"""
+        return json.loads(get_embedding_job(job_id, self.db_session).body)['job']
+
+    def get_embedded_ids(self):
+        """Embedding済みのデータのIDを取得します。"""
+        with self.db_session.begin():
+            return [data_id for data_id, in self.db_session.query(Datastore.Id).filter(Datastore.IsUserForEmbedding == True).order_by(Datastore.Id)]
+
+    def test_submit_processes_rows_in_checkpointed_batches(self, *mocks):
+        """ジョブを登録すると、バッチごとに埋め込みを作成してコミットし、進捗を記録することを確認します。"""
+        response = submit_embedding_job(self.db_session, self.session_factory)
+        self.assertEqual(response.status_code, 200)
+        job = self.get_job(json.loads(response.body)['job']['job_id'])
+
+        self.assertEqual(job['status'], EMBEDDING_JOB_STATUS_COMPLETED)
+        self.assertEqual((job['processed_rows'], job['total_rows'], job['processed_chunks']), (5, 5, 5))
+        self.assertEqual(job['processed_tokens'], sum(len(f'Title{index}\nContent') for index in range(1, 6)))
+        self.assertIsNone(job['eta_seconds'])
+        self.assertEqual(self.mock_create_embeddings.call_count, 3)
+        self.assertEqual(self.get_embedded_ids(), [1, 2, 3, 4, 5])
+        with self.db_session.begin():
+            self.assertEqual(self.db_session.query(EmbeddingVector).count(), 5)
+
+    def test_submit_returns_active_job(self, *mocks):
+        """実行中のジョブがある場合は、新しいジョブを登録せずに409を返すことを確認します。"""
+        job_id = self.add_job(Status=EMBEDDING_JOB_STATUS_RUNNING)
+        response = submit_embedding_job(self.db_session, self.session_factory)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.body)['job']['job_id'], job_id)
+        self.mock_executor.submit.assert_not_called()
+
+    @patch('services.embedding_service.EMBEDDING_MAX_CONCURRENCY', 1)
+    @patch('services.embedding_service.EMBEDDING_BATCH_MAX_TEXTS', 1)
+    def test_batch_writes_index_per_wave(self, *mocks):
+        """バッチのチャンクをまとめずに、ウェーブごとにベクトル化してインデックスを書き込むことを確認します。"""
+        run_embedding_job(self.add_job(), self.session_factory)
+        index_names = [call[0][4] for call in self.mock_create_embeddings.call_args_list]
+        self.assertEqual(len(index_names), 5)
+        self.assertEqual([index_name.rsplit('_', 1)[1] for index_name in index_names], ['0', '1', '0', '1', '0'])
+        self.assertEqual([len(call[0][0]) for call in self.mock_create_embeddings.call_args_list], [1] * 5)
+        with self.db_session.begin():
+            self.assertEqual(self.db_session.query(EmbeddingVector).count(), 5)
+
+    def test_submit_allows_one_active_job(self, *mocks):
+        """実行中のジョブの確認を通り抜けても、一意制約により2つ目のジョブは登録されず409を返すことを確認します。"""
+        self.mock_executor.submit.side_effect = None
+        first = submit_embedding_job(self.db_session, self.session_factory)
+        second_db = self.session_factory()
+        self.addCleanup(second_db.close)
+        second = submit_embedding_job(second_db, self.session_factory)
+        self.assertEqual((first.status_code, second.status_code), (200, 409))
+        self.assertEqual(json.loads(second.body)['job']['job_id'], json.loads(first.body)['job']['job_id'])
+        with self.db_session.begin():
+            self.assertEqual(self.db_session.query(EmbeddingJob).count(), 1)
+
+    def test_job_owned_by_other_worker_is_not_run(self, *mocks):
+        """他のワーカープロセスが占有期間内のジョブは、再開時にも実行しないことを確認します。"""
+        self.add_job(Status=EMBEDDING_JOB_STATUS_RUNNING, Owner='other-worker', HeartbeatAt=datetime.now())
+        resume_embedding_jobs(self.session_factory)
+        run_embedding_job('job-1', self.session_factory)
+        self.mock_create_embeddings.assert_not_called()
+        self.assertEqual(self.get_job('job-1')['status'], EMBEDDING_JOB_STATUS_RUNNING)
+        self.assertEqual(self.get_embedded_ids(), [])
+
+    def test_expired_lease_is_taken_over(self, *mocks):
+        """占有期間が切れたジョブは、他のワーカープロセスが引き継いで完了することを確認します。"""
+        self.add_job(Status=EMBEDDING_JOB_STATUS_RUNNING, Owner='crashed-worker', HeartbeatAt=datetime.now() - timedelta(days=1))
+        resume_embedding_jobs(self.session_factory)
+        self.assertEqual(self.get_job('job-1')['status'], EMBEDDING_JOB_STATUS_COMPLETED)
+        self.assertEqual(self.get_embedded_ids(), [1, 2, 3, 4, 5])
+        with self.db_session.begin():
+            job = self.db_session.get(EmbeddingJob, 'job-1')
+            self.assertEqual((job.ActiveKey, job.Owner), (None, None))
+
+    def test_batch_is_rolled_back_when_lease_is_lost(self, *mocks):
+        """バッチの処理中にジョブが他のワーカープロセスに引き継がれた場合は、そのバッチをロールバックして終了することを確認します。"""
+        def create_embeddings(*args):
+            with self.session_factory() as other_db, other_db.begin():
+                other_db.execute(update(EmbeddingJob).values(Owner='other-worker', HeartbeatAt=datetime.now()))
+            open(os.path.join(self.embeddings_folder_path, args[4] + '.faiss'), 'w').close()
+            return self.create_embeddings(*args)
+
+        self.mock_create_embeddings.side_effect = create_embeddings
+        run_embedding_job(self.add_job(), self.session_factory)
+        job = self.get_job('job-1')
+        self.assertEqual((job['status'], job['processed_rows']), (EMBEDDING_JOB_STATUS_RUNNING, 0))
+        self.assertEqual(self.get_embedded_ids(), [])
+        self.assertEqual(os.listdir(self.embeddings_folder_path), [])
+
+    def test_run_embedding_job_now(self, *mocks):
+        """/create_embeddingから、ジョブとして完了まで実行し、バッチごとに合計したキャッシュのヒット数とベクトルの変更の件数を返すことを確認します。"""
+        mock_embed_documents_with_cache = mocks[2]
+        mock_embed_documents_with_cache.side_effect = lambda db, model, texts: ([[1.0, 0.0]] * len(texts), {"hits": 1, "misses": len(texts) - 1, "hit_rate": 0})
+        response = run_embedding_job_now(self.db_session, self.session_factory)
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.body)
+        self.assertEqual(body['message'], SUCCESS_MESSAGE_EMBEDDING_FILES_CREATION)
+        self.assertEqual((body['job']['status'], body['job']['processed_rows']), (EMBEDDING_JOB_STATUS_COMPLETED, 5))
+        # 3バッチ（2行、2行、1行）で、ウェーブごとに1件ヒット
+        self.assertEqual(body['cache'], {"hits": 3, "misses": 2, "hit_rate": 0.6})
+        self.assertEqual(body['sync'], {"rows_embedded": 5, "rows_deleted": 0, "vectors_added": 5, "vectors_removed": 0})
+        self.assertEqual(self.get_job(body['job']['job_id'])['cache'], body['cache'])
+        self.mock_executor.submit.assert_not_called()
+
+    def test_run_embedding_job_now_refuses_while_job_is_active(self, *mocks):
+        """実行中のジョブがある場合、/create_embeddingは実行せずに409を返すことを確認します。"""
+        self.add_job(Status=EMBEDDING_JOB_STATUS_RUNNING, Owner='other-worker', HeartbeatAt=datetime.now())
+        response = run_embedding_job_now(self.db_session, self.session_factory)
+        self.assertEqual(response.status_code, 409)
+        self.mock_create_embeddings.assert_not_called()
+
+    def test_failed_batch_keeps_committed_batches(self, *mocks):
+        """バッチの処理に失敗した場合、それまでのバッチの結果は残り、失敗したバッチのインデックスファイルは削除されることを確認します。"""
+        calls = []
+
+        def create_embeddings(*args):
+            calls.append(args[4])
+            if len(calls) == 2:
+                open(os.path.join(self.embeddings_folder_path, args[4] + '.faiss'), 'w').close()
+                raise Exception('Embedding API error')
+            return self.create_embeddings(*args)
+
+        self.mock_create_embeddings.side_effect = create_embeddings
+        run_embedding_job(self.add_job(), self.session_factory)
+        job = self.get_job('job-1')
+        self.assertEqual(job['status'], EMBEDDING_JOB_STATUS_FAILED)
+        self.assertIn('Embedding API error', job['error'])
+        self.assertEqual(job['processed_rows'], 2)
+        self.assertEqual(self.get_embedded_ids(), [1, 2])
+        self.assertEqual(os.listdir(self.embeddings_folder_path), [calls[0] + '.faiss'])
+
+    def test_resume_continues_from_checkpoint(self, *mocks):
+        """中断されたジョブを再開すると、コミットされなかったインデックスファイルを削除し、チェックポイントの次の行から処理することを確認します。"""
+        open(os.path.join(self.embeddings_folder_path, 'orphan.faiss'), 'w').close()
+        with self.db_session.begin():
+            self.db_session.execute(update(Datastore).where(Datastore.Id <= 2).values(IsUserForEmbedding=True))
+        self.add_job(Status=EMBEDDING_JOB_STATUS_RUNNING, ProcessedRows=2, TotalRows=5, LastDatastoreId=2, PendingIndexName='orphan', ElapsedSeconds=4.0)
+        self.assertEqual(self.get_job('job-1')['eta_seconds'], 6.0)
+
+        resume_embedding_jobs(self.session_factory)
+        job = self.get_job('job-1')
+        self.assertEqual(job['status'], EMBEDDING_JOB_STATUS_COMPLETED)
+        self.assertEqual((job['processed_rows'], job['total_rows']), (5, 5))
+        self.assertFalse(os.path.exists(os.path.join(self.embeddings_folder_path, 'orphan.faiss')))
+        processed_titles = [chunk.page_content.split('\n')[0] for call in self.mock_create_embeddings.call_args_list for chunk in call[0][0]]
+        self.assertEqual(processed_titles, ['Title3', 'Title4', 'Title5'])
+
+    def run_job_with_shutdown_during_batch(self, batch_number):
+        """指定したバッチ（1から数える）の処理中にアプリケーションが終了するようにして、ジョブを実行します。"""
+        shutdown_event = threading.Event()
+        calls = []
+
+        def create_embeddings(*args):
+            calls.append(args[-1])
+            if len(calls) == batch_number:
+                shutdown_event.set()
+            return self.create_embeddings(*args)
+
+        self.mock_create_embeddings.side_effect = create_embeddings
+        with patch('services.embedding_job_service._embedding_job_shutdown_event', shutdown_event):
+            run_embedding_job(self.add_job(), self.session_factory)
+        with self.db_session.begin():
+            job = self.db_session.get(EmbeddingJob, 'job-1')
+            return job.Status, job.Owner, job.ActiveKey
+
+    def test_shutdown_releases_unfinished_job(self, *mocks):
+        """終了時に処理が残っているジョブは、実行中のまま占有を解除し、再開できるようにすることを確認します。"""
+        self.assertEqual(self.run_job_with_shutdown_during_batch(1), (EMBEDDING_JOB_STATUS_RUNNING, None, EMBEDDING_JOB_ACTIVE_KEY))
+        self.assertEqual(self.get_embedded_ids(), [1, 2])
+
+    def test_shutdown_after_last_batch_finishes_job(self, *mocks):
+        """最後のバッチの処理中に終了した場合も、すべての行を処理したジョブは完了にして占有を解除することを確認します。"""
+        self.assertEqual(self.run_job_with_shutdown_during_batch(3), (EMBEDDING_JOB_STATUS_COMPLETED, None, None))
+        self.assertEqual(self.get_embedded_ids(), [1, 2, 3, 4, 5])
+
+    def test_cancel_stops_after_current_batch(self, *mocks):
+        """キャンセルを要求すると、実行中のバッチの完了後にジョブが終了することを確認します。"""
+        def create_embeddings(*args):
+            cancel_db = self.session_factory()
+            cancel_embedding_job('job-1', cancel_db)
+            cancel_db.close()
+            return self.create_embeddings(*args)
+
+        self.mock_create_embeddings.side_effect = create_embeddings
+        run_embedding_job(self.add_job(), self.session_factory)
+        job = self.get_job('job-1')
+        self.assertEqual(job['status'], EMBEDDING_JOB_STATUS_CANCELLED)
+        self.assertTrue(job['cancel_requested'])
+        self.assertEqual(job['processed_rows'], 2)
+        self.assertEqual(self.get_embedded_ids(), [1, 2])
+
+    def test_row_changed_during_job_is_not_marked(self, *mocks):
+        """読み込んだ後に内容が変更されたデータは、Embedding済みにしないことを確認します。"""
+        def create_embeddings(*args):
+            with self.session_factory() as other_db, other_db.begin():
+                other_db.execute(update(Datastore).where(Datastore.Id == 1).values(Content='Changed', ContentHash='changed'))
+            return self.create_embeddings(*args)
+
+        self.mock_create_embeddings.side_effect = create_embeddings
+        run_embedding_job(self.add_job(), self.session_factory)
+        self.assertEqual(self.get_embedded_ids(), [2, 3, 4, 5])
+
+    def test_old_vectors_are_deleted_before_commit(self, *mocks):
+        """変更・削除されたデータの古いベクトルは、ベクトルストアへの反映に失敗してもコミットの前に削除済みとして登録されていることを確認します。"""
+        with self.session_factory() as db, db.begin():
+            db.add_all([EmbeddingVector(EmbeddingId='old-1', DatastoreId=1), EmbeddingVector(EmbeddingId='deleted-9', DatastoreId=9)])
+        mock_refresh_vector_store = mocks[3]
+        mock_refresh_vector_store.side_effect = Exception('Publish failed')
+        run_embedding_job(self.add_job(), self.session_factory)
+        self.assertEqual(self.get_job('job-1')['status'], EMBEDDING_JOB_STATUS_COMPLETED)
+        self.assertEqual(get_deleted_embedding_ids(self.embeddings_folder_path), {'old-1', 'deleted-9'})
+        self.assertEqual(self.get_job('job-1')['sync'], {"rows_embedded": 5, "rows_deleted": 1, "vectors_added": 5, "vectors_removed": 2})
+        with self.db_session.begin():
+            self.assertEqual(self.db_session.query(EmbeddingVector).filter(EmbeddingVector.EmbeddingId.in_(['old-1', 'deleted-9'])).count(), 0)
+
+    @patch('services.embedding_job_service.EMBEDDING_JOB_REFRESH_BATCHES', 2)
+    def test_vector_store_is_refreshed_every_refresh_batches(self, *mocks):
+        """ベクトルストアへの反映とコンパクションの確認は、バッチごとではなく一定のバッチ数ごとと終了時に行うことを確認します。"""
+        mock_refresh_vector_store, mock_compact_embedding_if_needed = mocks[3], mocks[4]
+        run_embedding_job(self.add_job(), self.session_factory)
+        self.assertEqual(self.mock_create_embeddings.call_count, 3)
+        self.assertEqual(mock_refresh_vector_store.call_count, 2)
+        self.assertEqual(mock_compact_embedding_if_needed.call_count, 2)
+
+    def test_get_embedding_job_not_found(self, *mocks):
+        """存在しないジョブの場合は404を返すことを確認します。"""
+        self.assertEqual(get_embedding_job('unknown', self.db_session).status_code, 404)
+        self.assertEqual(cancel_embedding_job('unknown', self.db_session).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from services.embedding_pipeline_service import embed_texts_concurrently, get_token_batches
+from utils.rate_limiter import RateLimiter
+
+class TestGetTokenBatches(unittest.TestCase):
+    """get_token_batches関数のテストクラスです。"""
+
+    def test_batches_respect_token_and_text_limits(self):
+        """バッチの合計トークン数とテキスト数が上限を超えないことを確認します。"""
+        batches = get_token_batches([40, 30, 50, 10, 10, 10], max_batch_tokens=80, max_batch_texts=2)
+        self.assertEqual(batches, [[0, 1], [2, 3], [4, 5]])
+
+    def test_oversized_text_is_single_batch(self):
+        """1つで上限を超えるテキストは単独のバッチになることを確認します。"""
+        batches = get_token_batches([10, 200, 10], max_batch_tokens=100, max_batch_texts=10)
+        self.assertEqual(batches, [[0], [1], [2]])
+
+class TestEmbedTextsConcurrently(unittest.TestCase):
+    """embed_texts_concurrently関数のテストクラスです。"""
+
+    def setUp(self):
+        """テスト実行前の設定を行います。トークン数は文字数として計算します。"""
+        token_count_patcher = patch('services.embedding_pipeline_service.get_embedding_token_count', side_effect=len)
+        token_count_patcher.start()
+        self.addCleanup(token_count_patcher.stop)
+        self.embedding_model = MagicMock()
+        self.embedding_model.embed_documents.side_effect = lambda texts: [[float(text)] for text in texts]
+
+    @patch('services.embedding_pipeline_service.EMBEDDING_BATCH_MAX_TOKENS', 4)
+    def test_vectors_keep_text_order(self):
+        """複数のバッチを並行して実行しても、テキストと同じ順序でベクトルを返すことを確認します。"""
+        texts = [str(number) for number in range(10)]
+        rate_limiter = RateLimiter(1000, 1000)
+        vectors, tokens = embed_texts_concurrently(self.embedding_model, texts, rate_limiter)
+        self.assertEqual(vectors, [[float(number)] for number in range(10)])
+        self.assertEqual(tokens, 10)
+        self.assertEqual(self.embedding_model.embed_documents.call_count, 3)
+
+    def test_error_is_raised(self):
+        """バッチでエラーが発生した場合、例外を送出することを確認します。"""
+        self.embedding_model.embed_documents.side_effect = Exception('API error')
+        with self.assertRaises(Exception):
+            embed_texts_concurrently(self.embedding_model, ['1', '2'], RateLimiter(1000, 1000))
+
+class TestRateLimiter(unittest.TestCase):
+    """RateLimiterクラスのテストクラスです。"""
+
+    def setUp(self):
+        """テスト実行前の設定を行います。時計と待機処理を置き換え、待機した分だけ時刻を進めます。"""
+        self.now = 0.0
+        self.sleep_seconds = []
+
+        def sleep(seconds):
+            self.sleep_seconds.append(seconds)
+            self.now += seconds
+
+        self.rate_limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=100, clock=lambda: self.now, sleep=sleep)
+
+    def test_waits_when_requests_are_exhausted(self):
+        """1分あたりのリクエスト数を使い切った場合、補充されるまで待機することを確認します。"""
+        self.assertEqual(self.rate_limiter.acquire(10), 0.0)
+        self.assertEqual(self.rate_limiter.acquire(10), 0.0)
+        self.assertAlmostEqual(self.rate_limiter.acquire(10), 30.0)
+
+    def test_waits_when_tokens_are_exhausted(self):
+        """1分あたりのトークン数を使い切った場合、必要なトークン数が補充されるまで待機することを確認します。"""
+        self.rate_limiter.acquire(100)
+        self.assertAlmostEqual(self.rate_limiter.acquire(50), 30.0)
+
+if __name__ == '__main__':
+    unittest.main()
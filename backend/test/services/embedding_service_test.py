@@ -1,46 +1,27 @@
 import unittest
 from unittest.mock import MagicMock, patch
-from services.embedding_service import create_embedding
-from config.constant import SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDING, ERROR_MESSAGE_DATABASE_EXCEPTION
+from services.embedding_service import embed_document_chunks
+from langchain.docstore.document import Document
 from sqlalchemy.orm import Session
-import json
-from exceptions.general_exception import CustomGeneralException
-from exceptions.database_exception import CustomDatabaseException
 
-class TestCreateEmbedding(unittest.TestCase):
-    """テストクラスです。embedding_service.create_embedding関数のテストを行います。"""
+class TestEmbedDocumentChunks(unittest.TestCase):
+    """テストクラスです。embedding_service.embed_document_chunks関数のテストを行います。"""
 
-    @patch('fastapi.responses.JSONResponse')
-    def test_no_data_in_data_store(self, mock_json_response):
-        """データストアにデータがない場合のテストです。
-        SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDINGを返すことを確認します。
+    @patch('services.embedding_service.EMBEDDING_MAX_CONCURRENCY', 1)
+    @patch('services.embedding_service.EMBEDDING_BATCH_MAX_TEXTS', 3)
+    @patch('services.embedding_service.embed_documents_with_cache')
+    def test_embed_chunks_in_waves(self, mock_embed_documents_with_cache):
+        """分割が完了したチャンクを、一定の件数ごとにまとめてベクトル化することを確認します。
+        ウェーブごとに、チャンクと同じ順序のベクトルとキャッシュのヒット数が返されることを確認します。
         """
-        db_session = MagicMock(Session)
-        db_session.query().filter().order_by().all.return_value = []
-        response = create_embedding(db_session)
-        msg = json.loads(response.body.decode("utf-8")).get("message")
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(msg, SUCCESS_MESSAGE_NO_NEW_DATA_FOR_EMBEDDING)
+        mock_embed_documents_with_cache.side_effect = lambda db, model, texts: ([[float(text)] for text in texts], {"hits": 1, "misses": len(texts) - 1, "hit_rate": 0})
+        chunk_batches = [[Document(page_content=str(index)) for index in range(start, start + 2)] for start in range(0, 8, 2)]
 
-    def test_create_embedding_database_exception(self):
-        """データベースで例外が発生した場合のテストです。
-        500を返すことを確認します。
-        """
-        db_session = MagicMock(Session)
-        db_session.query().filter().order_by().all.side_effect = CustomDatabaseException('Database error')
-        response = create_embedding(db_session)
-        self.assertEqual(response.status_code, 500)
-        self.assertEqual(json.loads(response.body), {'error': ERROR_MESSAGE_DATABASE_EXCEPTION.format(reason='Database error')})
-
-    def test_create_embedding_general_exception(self):
-        """一般例外が発生した場合のテストです。
-        500を返すことを確認します。
-        """
-        db_session = MagicMock(Session)
-        db_session.query().filter().order_by().all.side_effect = CustomGeneralException('Custom error')
-        response = create_embedding(db_session)
-        self.assertEqual(response.status_code, 500)
-        self.assertEqual(json.loads(response.body), {'error': 'Custom error'})
+        waves = list(embed_document_chunks(MagicMock(Session), MagicMock(), iter(chunk_batches)))
+        self.assertEqual([[chunk.page_content for chunk in chunks] for chunks, _, _ in waves], [['0', '1', '2', '3'], ['4', '5', '6', '7']])
+        self.assertEqual([vectors for _, vectors, _ in waves], [[[float(index)] for index in range(start, start + 4)] for start in (0, 4)])
+        self.assertEqual([len(call[0][2]) for call in mock_embed_documents_with_cache.call_args_list], [4, 4])
+        self.assertEqual([cache_stats["hits"] for _, _, cache_stats in waves], [1, 1])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
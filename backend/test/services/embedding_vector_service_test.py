@@ -0,0 +1,49 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import data_store, embedding_vector
+from models.data_store import Datastore
+from models.embedding_vector import EmbeddingVector
+from services.embedding_vector_service import get_deleted_datastore_ids, get_embedding_ids, replace_embedding_vectors
+
+class TestEmbeddingVectorService(unittest.TestCase):
+    """embedding_vector_serviceのテストクラスです。
+
+    SQLiteのインメモリデータベースを使用して、ベクトルとデータの対応の登録と削除をテストします。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。
+
+        SQLiteのインメモリデータベースにテーブルを作成し、ID 1と2のデータを登録します。
+        """
+        engine = create_engine("sqlite://")
+        data_store.Base.metadata.create_all(bind=engine)
+        embedding_vector.Base.metadata.create_all(bind=engine)
+        self.db_session = sessionmaker(bind=engine)()
+        self.db_session.add_all([Datastore(Id=1, Title='1', Content='1'), Datastore(Id=2, Title='2', Content='2')])
+        replace_embedding_vectors(self.db_session, [], [
+            {'id': embedding_id, 'page_content': '', 'metadata': {'DatastoreId': datastore_id}}
+            for embedding_id, datastore_id in [('1-a', 1), ('1-b', 1), ('2-a', 2), ('3-a', 3)]
+        ])
+
+    def tearDown(self):
+        """テスト実行後の後処理を行います。"""
+        self.db_session.close()
+
+    def test_get_deleted_datastore_ids(self):
+        """データストアから削除されたデータのIDのみを返すことを確認します。"""
+        self.assertEqual(get_deleted_datastore_ids(self.db_session), [3])
+
+    def test_get_embedding_ids(self):
+        """指定されたデータのベクトルのIDを返すことを確認します。"""
+        self.assertEqual(sorted(get_embedding_ids(self.db_session, [1, 3])), ['1-a', '1-b', '3-a'])
+
+    def test_replace_embedding_vectors(self):
+        """削除したベクトルの登録が削除され、新しいベクトルが登録されることを確認します。"""
+        replace_embedding_vectors(self.db_session, ['1-a', '1-b'], [{'id': '1-c', 'page_content': '', 'metadata': {'DatastoreId': 1}}])
+        self.assertEqual(get_embedding_ids(self.db_session, [1]), ['1-c'])
+        self.assertEqual(self.db_session.query(EmbeddingVector).count(), 3)
+
+if __name__ == '__main__':
+    unittest.main()
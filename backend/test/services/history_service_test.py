@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+from models import chat, message
+from models.chat import Chat
+from models.message import Message
+from services.history_service import get_chat_history, update_chat_summary
+
+class TestHistoryService(unittest.IsolatedAsyncioTestCase):
+    """history_serviceのテストクラスです。
+
+    SQLiteのインメモリデータベースを使用して、会話履歴の取得と要約の更新をテストします。
+    トークン数は文字数として計算します。
+    """
+
+    async def asyncSetUp(self):
+        """テスト実行前の設定を行います。
+
+        チャットと、5ターン分（10件）のメッセージを登録します。
+        """
+        self.engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(chat.Base.metadata.create_all)
+            await connection.run_sync(message.Base.metadata.create_all)
+        self.session_factory = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        async with self.session_factory() as db:
+            db.add(Chat(Id=1, User='test@example.com'))
+            for turn in range(5):
+                db.add_all([Message(ChatId=1, Type='user', Content=f'q{turn}'), Message(ChatId=1, Type='assistant', Content=f'a{turn}')])
+            await db.commit()
+        self.db_session = self.session_factory()
+        token_count_patcher = patch('services.history_service.get_token_count', side_effect=len)
+        token_count_patcher.start()
+        self.addCleanup(token_count_patcher.stop)
+
+    async def asyncTearDown(self):
+        """テスト実行後の後処理を行います。"""
+        await self.db_session.close()
+        await self.engine.dispose()
+
+    @patch('services.history_service.HISTORY_MAX_TOKENS', 9)
+    async def test_history_fits_token_budget(self):
+        """上限に収まる分だけ、新しいメッセージを古い順にそのまま返すことを確認します。"""
+        history = await get_chat_history(1, self.db_session)
+        self.assertTrue(history['has_history'])
+        self.assertEqual([message['content'] for message in history['messages']], ['q3', 'a3', 'q4', 'a4'])
+
+    @patch('services.history_service.HISTORY_RECENT_TURNS', 2)
+    async def test_update_chat_summary_is_incremental(self):
+        """直近のターンより古いメッセージのみを要約し、次回は要約と新しいメッセージのみを使用することを確認します。"""
+        with patch('services.history_service.call_completion_api', new=AsyncMock(return_value='summary of q0-a2')) as mock_call_completion_api:
+            await update_chat_summary(1, self.session_factory)
+            prompt = mock_call_completion_api.call_args[0][0][0]['content']
+            self.assertIn('assistant: a2', prompt)
+            self.assertNotIn('q3', prompt)
+
+            # 要約する新しいメッセージがない場合は、APIを呼び出さない
+            mock_call_completion_api.reset_mock()
+            await update_chat_summary(1, self.session_factory)
+            mock_call_completion_api.assert_not_called()
+
+        history = await get_chat_history(1, self.db_session)
+        self.assertEqual(history['messages'][0]['role'], 'system')
+        self.assertIn('summary of q0-a2', history['messages'][0]['content'])
+        self.assertEqual([message['content'] for message in history['messages'][1:]], ['q3', 'a3', 'q4', 'a4'])
+
+    async def test_new_chat_has_no_history(self):
+        """メッセージのないチャットは、会話履歴がないと判定されることを確認します。"""
+        self.db_session.add(Chat(Id=2, User='test@example.com'))
+        await self.db_session.commit()
+        self.assertEqual(await get_chat_history(2, self.db_session), {'messages': [], 'has_history': False})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import asyncio
+import json
+from types import SimpleNamespace
+from services.metrics_service import get_metrics
+from utils.embeddings import CachedQueryEmbeddings, QueryEmbeddingCache
+from utils.http_clients import _get_pool_stats
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    """クエリのベクトルのキャッシュ（CachedQueryEmbeddings、QueryEmbeddingCache）のテストクラスです。"""
+
+    def setUp(self):
+        """テスト実行前の設定を行います。元の埋め込みモデルをモック化します。"""
+        self.embeddings = MagicMock()
+        self.embeddings.model = 'test-model'
+        self.embeddings.embed_query.side_effect = lambda text: [float(len(text)), 0.5]
+        self.cache = QueryEmbeddingCache(max_entries=2)
+        self.embedding_model = CachedQueryEmbeddings(self.embeddings, self.cache)
+
+    def test_repeated_query_hits_cache(self):
+        """同じクエリを2回ベクトル化した場合、Embedding APIを1回だけ呼び出すことを確認します。"""
+        self.assertEqual(self.embedding_model.embed_query('abc'), [3.0, 0.5])
+        self.assertEqual(self.embedding_model.embed_query('abc'), [3.0, 0.5])
+        self.embeddings.embed_query.assert_called_once_with('abc')
+        self.assertEqual(self.cache.get_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'entries': 1, 'max_entries': 2})
+
+    def test_cache_is_keyed_by_model_name(self):
+        """埋め込みモデル名が異なる場合、キャッシュを使用しないことを確認します。"""
+        self.embedding_model.embed_query('abc')
+        self.embeddings.model = 'other-model'
+        self.embedding_model.embed_query('abc')
+        self.assertEqual(self.embeddings.embed_query.call_count, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        """上限を超えた場合、最も長く使われていないクエリの領域が再利用されることを確認します。"""
+        for text in ['a', 'bb', 'a', 'ccc']:
+            self.embedding_model.embed_query(text)
+        self.assertEqual(self.cache.vectors.dtype.name, 'float32')
+        self.assertEqual(self.cache.vectors.shape, (2, 2))
+        self.assertIsNone(self.cache.get(('test-model', 'bb')))
+        self.assertEqual(self.cache.get(('test-model', 'a')), [1.0, 0.5])
+
+    def test_concurrent_queries_are_coalesced(self):
+        """同じクエリを同時に非同期でベクトル化した場合、Embedding APIを1回だけ呼び出すことを確認します。"""
+        async def aembed_query(text):
+            await asyncio.sleep(0.01)
+            return [float(len(text)), 0.5]
+
+        async def embed_concurrently():
+            return await asyncio.gather(*[self.embedding_model.aembed_query('abc') for _ in range(3)])
+
+        self.embeddings.aembed_query = AsyncMock(side_effect=aembed_query)
+        self.assertEqual(asyncio.run(embed_concurrently()), [[3.0, 0.5]] * 3)
+        self.embeddings.aembed_query.assert_called_once_with('abc')
+        self.assertEqual(self.embedding_model.single_flight.get_stats(), {'started': 1, 'coalesced': 2, 'in_flight': 0})
+
+class TestGetMetrics(unittest.TestCase):
+    """get_metrics関数のテストクラスです。"""
+
+    def test_get_metrics(self):
+        """クエリのベクトルのキャッシュの統計情報を返すことを確認します。"""
+        response = get_metrics()
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.body)
+        self.assertIn('hit_rate', body['query_embedding_cache'])
+        self.assertIn('max_connections', body['openai_http_pool'])
+        self.assertIn('coalesced', body['query_coalescing']['completion'])
+        self.assertIn('checkout_seconds', body['database_pool'])
+
+    def test_http_pool_stats(self):
+        """接続プールのコネクションから、アクティブ・アイドル・HTTP/2のコネクション数を集計することを確認します。"""
+        connections = [MagicMock(), MagicMock(), MagicMock()]
+        for connection, is_idle, info in zip(connections, [True, False, True], ['HTTP/2, IDLE', 'HTTP/1.1, ACTIVE', 'HTTP/1.1, IDLE']):
+            connection.is_idle.return_value = is_idle
+            connection.info.return_value = info
+        http_client = MagicMock()
+        http_client._transport._pool.connections = connections
+        self.assertEqual(_get_pool_stats(http_client, 5), {
+            'created': True, 'requests': 5, 'connections': 3, 'active_connections': 1, 'idle_connections': 2, 'http2_connections': 1})
+        self.assertEqual(_get_pool_stats(None, 0)['connections'], 0)
+        # httpxの内部の構造が異なる場合は、コネクション数をNoneとする
+        self.assertEqual(_get_pool_stats(SimpleNamespace(), 1), {
+            'created': True, 'requests': 1, 'connections': None, 'active_connections': None, 'idle_connections': None, 'http2_connections': None})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, call, patch
+from types import SimpleNamespace
+import asyncio
+from services.openai_service import call_completion_api, call_completion_api_stream, get_message_list_token_count, select_completion_model
+from utils.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from config.constant import ERR_MSG_OPEN_AI_CIRCUIT_OPEN, COMPLETION_MODEL_NAME
+import httpx
+import openai
+
+def create_chunk(content=None, finish_reason=None, usage=None):
+    """テスト用のストリームのチャンクを作成します。使用量のチャンクは選択肢を含みません。"""
+    choices = [] if usage else [SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+class FakeStream:
+    """チャンクのリストを順に返す、テスト用のストリームです。最初のチャンクの前に指定された秒数待機します。"""
+
+    def __init__(self, chunks, delay_seconds=0):
+        self.chunks = iter(chunks)
+        self.delay_seconds = delay_seconds
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+            self.delay_seconds = 0
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+def create_stream(chunks, delay_seconds=0):
+    """チャンクのリストからテスト用のストリームを作成します。"""
+    return FakeStream(chunks, delay_seconds)
+
+def collect_results(message_list):
+    """ストリームの結果を、その時点の値のコピーのリストとして取得します。"""
+    async def collect():
+        return [dict(result) async for result in call_completion_api_stream(message_list)]
+    return asyncio.run(collect())
+
+class TestOpenaiService(unittest.TestCase):
+    """openai_serviceのテストクラスです。
+
+    トークナイザーは空白区切りの単語を1トークンとして数えるものに置き換えます。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。"""
+        encoder = MagicMock()
+        encoder.encode.side_effect = lambda string, disallowed_special=(): string.split()
+        encoder_patcher = patch('services.openai_service.get_encoder', return_value=encoder)
+        self.get_encoder = encoder_patcher.start()
+        self.addCleanup(encoder_patcher.stop)
+        self.message_list = [{'role': 'system', 'content': 'You are helpful'}, {'role': 'user', 'content': 'What is Backlog?', 'name': 'user'}]
+
+    def test_get_message_list_token_count(self):
+        """メッセージごとの区切りと回答の開始のトークンを含めて数えることを確認します。"""
+        # 回答の開始3 + (区切り3 + system1 + 本文3) + (区切り3 + user1 + 本文3 + name1 + 1)
+        self.assertEqual(get_message_list_token_count(self.message_list), 19)
+
+    @patch('services.openai_service.get_async_openai_client')
+    def test_stream_uses_usage(self, mock_get_async_openai_client):
+        """ストリームで返された使用量をトークン数として使用することを確認します。"""
+        create = mock_get_async_openai_client.return_value.with_options.return_value.chat.completions.create = AsyncMock(return_value=create_stream([
+            create_chunk('Hello'), create_chunk(' world'), create_chunk('', 'stop'),
+            create_chunk(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=2))]))
+        results = collect_results(self.message_list)
+        self.assertEqual([result['response_text'] for result in results[:-1]], ['Hello', ' world', ''])
+        self.assertEqual(create.call_args.kwargs['stream_options'], {'include_usage': True})
+        self.assertEqual((results[-1]['prompt_tokens'], results[-1]['completion_tokens'], results[-1]['total_tokens']), (100, 2, 102))
+        self.assertFalse(results[-1]['has_error'])
+        # 使用量が返される場合は、トークナイザーで数えない
+        self.get_encoder.assert_not_called()
+
+    @patch('services.openai_service.get_async_openai_client')
+    def test_stream_counts_tokens_once_when_usage_is_missing(self, mock_get_async_openai_client):
+        """使用量を要求したが返されなかった場合は、ストリーム終了後に回答全体を一度だけ数えることを確認します。"""
+        mock_get_async_openai_client.return_value.with_options.return_value.chat.completions.create = AsyncMock(return_value=create_stream([
+            create_chunk('Backlog is'), create_chunk(' a tool'), create_chunk(None, 'stop')]))
+        results = collect_results(self.message_list)
+        self.assertEqual((results[-1]['prompt_tokens'], results[-1]['completion_tokens'], results[-1]['total_tokens']), (19, 4, 23))
+        self.assertIn(call('Backlog is a tool', disallowed_special=()), self.get_encoder.return_value.encode.call_args_list)
+        self.assertNotIn(call('Backlog is', disallowed_special=()), self.get_encoder.return_value.encode.call_args_list)
+
+    @patch('services.openai_service.COMPLETION_STREAM_INCLUDE_USAGE', False)
+    @patch('services.openai_service.get_async_openai_client')
+    def test_prompt_token_count_is_cancelled_on_error(self, mock_get_async_openai_client):
+        """ストリームの途中でエラーになった場合は、プロンプトのトークン数を数えるタスクをキャンセルすることを確認します。"""
+        mock_get_async_openai_client.return_value.with_options.return_value.chat.completions.create = AsyncMock(side_effect=Exception('Stream failed'))
+        cancelled = []
+
+        async def count_prompt_tokens(*args):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def collect():
+            results = [dict(result) async for result in call_completion_api_stream(self.message_list)]
+            # asyncio.runの終了時のキャンセルではなく、エラーの処理でキャンセルされたことを確認する
+            await asyncio.sleep(0)
+            return results, list(cancelled)
+        with patch('services.openai_service.run_in_threadpool', side_effect=count_prompt_tokens):
+            results, cancelled_before_exit = asyncio.run(collect())
+        self.assertTrue(results[-1]['has_error'])
+        self.assertEqual(cancelled_before_exit, [True])
+
+    @patch('services.openai_service.COMPLETION_STREAM_INCLUDE_USAGE', False)
+    @patch('services.openai_service.get_async_openai_client')
+    def test_stream_counts_tokens_without_usage(self, mock_get_async_openai_client):
+        """使用量が返されない場合は、プロンプトと受信した差分のトークン数を数えることを確認します。"""
+        create = mock_get_async_openai_client.return_value.with_options.return_value.chat.completions.create = AsyncMock(return_value=create_stream([
+            create_chunk('Backlog is'), create_chunk(' a tool'), create_chunk(None, 'stop')]))
+        results = collect_results(self.message_list)
+        self.assertNotIn('stream_options', create.call_args.kwargs)
+        self.assertEqual((results[-1]['prompt_tokens'], results[-1]['completion_tokens'], results[-1]['total_tokens']), (19, 4, 23))
+
+    @patch('services.openai_service.COMPLETION_STREAM_INCLUDE_USAGE', False)
+    @patch('services.openai_service.get_async_openai_client')
+    def test_stream_counts_tokens_with_routed_model(self, mock_get_async_openai_client):
+        """使用量が返されない場合は、実際に使用したモデルのトークナイザーで数えることを確認します。"""
+        mock_get_async_openai_client.return_value.with_options.return_value.chat.completions.create = AsyncMock(return_value=create_stream([
+            create_chunk('Backlog is'), create_chunk(None, 'stop')]))
+
+        async def collect():
+            return [dict(result) async for result in call_completion_api_stream(self.message_list, 'routed-model')]
+        asyncio.run(collect())
+        self.assertEqual({call.args[0] for call in self.get_encoder.call_args_list}, {'routed-model'})
+
+class TestCompletionResilience(unittest.TestCase):
+    """Completion APIのリトライ、ヘッジ、サーキットブレーカーのテストクラスです。"""
+
+    def setUp(self):
+        """テスト実行前の設定を行います。
+
+        サーキットブレーカーと統計情報をテストごとに初期化し、リトライの待機時間を0、トークン数を1にします。
+        フォールバックのモデルは、フォールバックのテストを除いて無効にします。
+        """
+        self.circuit_breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+        self.stats = {'retries': 0, 'hedged': 0, 'hedge_wins': 0}
+        for target, value in [('_completion_circuit_breakers', {COMPLETION_MODEL_NAME: self.circuit_breaker}), ('_completion_stats', self.stats),
+                              ('COMPLETION_FALLBACK_MODEL_NAME', COMPLETION_MODEL_NAME),
+                              ('_time_to_first_token_tracker', LatencyTracker(10)), ('get_backoff_seconds', MagicMock(return_value=0)),
+                              ('get_token_count', MagicMock(return_value=1))]:
+            patcher = patch(f'services.openai_service.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        client_patcher = patch('services.openai_service.get_async_openai_client')
+        self.create = client_patcher.start().return_value.with_options.return_value.chat.completions.create = AsyncMock()
+        self.addCleanup(client_patcher.stop)
+        self.message_list = [{'role': 'user', 'content': 'What is Backlog?'}]
+        self.connection_error = openai.APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+
+    def create_answer_stream(self, delay_seconds=0):
+        """回答と使用量を返すストリームを作成します。"""
+        return create_stream([create_chunk('Hello', 'stop'), create_chunk(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=1))], delay_seconds)
+
+    def test_retries_before_first_token(self):
+        """最初のトークンを受信する前の接続エラーはリトライし、回答を返すことを確認します。"""
+        self.create.side_effect = [self.connection_error, self.create_answer_stream()]
+        results = collect_results(self.message_list)
+        self.assertEqual(self.create.call_count, 2)
+        self.assertEqual(results[0]['response_text'], 'Hello')
+        self.assertFalse(results[-1]['has_error'])
+        self.assertEqual(self.stats['retries'], 1)
+        self.assertEqual(self.circuit_breaker.state, CircuitBreaker.CLOSED)
+
+    @patch('services.openai_service.COMPLETION_MAX_RETRIES', 1)
+    def test_circuit_breaker_fails_fast(self):
+        """連続した失敗でサーキットブレーカーが開き、以降はAPIを呼び出さずに失敗することを確認します。"""
+        self.create.side_effect = self.connection_error
+        self.assertTrue(collect_results(self.message_list)[-1]['has_error'])
+        self.assertEqual(self.create.call_count, 2)
+        self.assertEqual(self.circuit_breaker.state, CircuitBreaker.OPEN)
+
+        with patch('services.openai_service.set_error_info') as mock_set_error_info:
+            collect_results(self.message_list)
+        self.assertEqual(self.create.call_count, 2)
+        self.assertEqual(mock_set_error_info.call_args[0][1], ERR_MSG_OPEN_AI_CIRCUIT_OPEN)
+
+    @patch('services.openai_service.COMPLETION_MAX_RETRIES', 1)
+    def test_call_completion_api_shares_resilience(self):
+        """要約などのストリーミングしない呼び出しも、レートリミッターで枠を確保し、サーキットブレーカーが開いている場合はAPIを呼び出さずに失敗することを確認します。"""
+        self.create.return_value = self.create_answer_stream()
+        with patch('services.openai_service._completion_rate_limiter.aacquire', new=AsyncMock()) as mock_aacquire:
+            self.assertEqual(asyncio.run(call_completion_api(self.message_list, COMPLETION_MODEL_NAME, 100)), 'Hello')
+        mock_aacquire.assert_awaited_once()
+
+        self.create.reset_mock(return_value=True)
+        self.create.side_effect = self.connection_error
+        with self.assertRaises(openai.APIConnectionError):
+            asyncio.run(call_completion_api(self.message_list, COMPLETION_MODEL_NAME, 100))
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(call_completion_api(self.message_list, COMPLETION_MODEL_NAME, 100))
+        self.assertEqual(self.create.call_count, 2)
+
+    @patch('services.openai_service.COMPLETION_FALLBACK_MODEL_NAME', 'fallback-model')
+    def test_falls_back_on_rate_limit(self):
+        """レート制限のエラーはリトライせずにフォールバックのモデルに切り替え、使用したモデルを返すことを確認します。"""
+        rate_limit_error = openai.RateLimitError('Rate limit', response=httpx.Response(429, request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')), body=None)
+        self.create.side_effect = [rate_limit_error, self.create_answer_stream()]
+        results = collect_results(self.message_list)
+        self.assertEqual([call.kwargs['model'] for call in self.create.call_args_list], [COMPLETION_MODEL_NAME, 'fallback-model'])
+        self.assertEqual(results[-1]['model'], 'fallback-model')
+        self.assertFalse(results[-1]['has_error'])
+        self.assertEqual(self.stats['retries'], 0)
+
+    @patch('services.openai_service.COMPLETION_ROUTING_RULES', [
+        {'model': 'small-model', 'max_prompt_tokens': 100, 'languages': ['English']},
+        {'model': 'hint-model', 'hints': ['simple']}])
+    def test_select_completion_model(self):
+        """条件をすべて満たす最初のルールのモデルを選択し、満たすルールがない場合は既定のモデルを選択することを確認します。"""
+        self.assertEqual(select_completion_model(50, 'English'), 'small-model')
+        self.assertEqual(select_completion_model(500, 'English', 'simple'), 'hint-model')
+        self.assertEqual(select_completion_model(500, 'English'), COMPLETION_MODEL_NAME)
+
+    @patch('services.openai_service.get_hedge_delay', return_value=0.01)
+    def test_hedged_request_wins(self, mock_get_hedge_delay):
+        """最初のトークンが遅い場合は同じリクエストをもう1つ送信し、先に応答した方を使用して、もう一方を閉じることを確認します。"""
+        slow_stream = self.create_answer_stream(delay_seconds=1)
+        self.create.side_effect = [slow_stream, self.create_answer_stream()]
+        results = collect_results(self.message_list)
+        self.assertEqual(self.create.call_count, 2)
+        self.assertEqual(results[0]['response_text'], 'Hello')
+        self.assertEqual(self.stats, {'retries': 0, 'hedged': 1, 'hedge_wins': 1})
+        self.assertTrue(slow_stream.closed)
+
+if __name__ == '__main__':
+    unittest.main()
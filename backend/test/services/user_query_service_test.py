@@ -1,10 +1,26 @@
 import unittest
-from unittest.mock import MagicMock
-from config.constant import ERROR_MESSAGE_EMPTY_QUERY, ERROR_MESSAGE_EMPTY_EMAIL, ERROR_MESSAGE_EMPTY_CHATID
+from unittest.mock import AsyncMock, MagicMock, patch
+from config.constant import ERROR_MESSAGE_EMPTY_QUERY, ERROR_MESSAGE_EMPTY_EMAIL, ERROR_MESSAGE_EMPTY_CHATID, COMPLETION_MODEL_NAME
 from services.user_query_service import get_query_answer
 from models.message import Message
-from sqlalchemy.orm import Session
+from models.message_log import MessageLog
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from models import chat, message, message_log
+from models.chat import Chat
+from utils.db_pool_metrics import instrument_pool, get_db_pool_stats
+import os
+import tempfile
+import asyncio
 import json
+import time
+
+def collect_responses(gen):
+    """非同期ジェネレータが返すJSONレスポンスをすべて取得します。"""
+    async def collect():
+        return [response async for response in gen]
+    return asyncio.run(collect())
 
 class TestGetQueryAnswer(unittest.TestCase):
 
@@ -13,7 +29,7 @@ class TestGetQueryAnswer(unittest.TestCase):
 
         MagicMockを使用してdb_sessionをモック化します。
         """
-        self.db_session = MagicMock(Session)
+        self.db_session = MagicMock(AsyncSession)
 
     def test_query_is_none(self):
         """ユーザーがクエリを入力しなかった場合、Empty query error というエラーメッセージが返されることを確認します。
@@ -26,7 +42,7 @@ class TestGetQueryAnswer(unittest.TestCase):
         """
         db = self.db_session
         gen = get_query_answer(None, 'test@example.com', None, db)
-        response = next(gen)
+        response = collect_responses(gen)[0]
         json_result = json.loads(response.body)
         self.assertEqual(json_result['status'], 'answer')
         self.assertEqual(json_result['error'], ERROR_MESSAGE_EMPTY_QUERY)
@@ -43,7 +59,7 @@ class TestGetQueryAnswer(unittest.TestCase):
         """
         db = self.db_session
         gen = get_query_answer(123, None, 'test query', db)
-        response = next(gen)
+        response = collect_responses(gen)[0]
         json_result = json.loads(response.body)
         self.assertEqual(json_result['status'], 'answer')
         self.assertEqual(json_result['error'], ERROR_MESSAGE_EMPTY_EMAIL)
@@ -61,10 +77,155 @@ class TestGetQueryAnswer(unittest.TestCase):
         """
         db = self.db_session
         gen = get_query_answer(None, 'test@example.com', 'test query', db)
-        response = next(gen)
+        response = collect_responses(gen)[0]
         json_result = json.loads(response.body)
         self.assertEqual(json_result['status'], 'answer')
         self.assertEqual(json_result['error'], ERROR_MESSAGE_EMPTY_CHATID)
 
+    @patch('services.user_query_service.call_completion_api_stream')
+    @patch('services.user_query_service.get_cached_answer', return_value={'answer': 'cached answer', 'model': 'fallback-model'})
+    @patch('services.user_query_service.get_chat_history', return_value={'messages': [], 'has_history': False})
+    @patch('services.user_query_service.get_vector_store')
+    def test_answer_cache_hit(self, mock_get_vector_store, mock_get_chat_history, mock_get_cached_answer, mock_call_completion_api_stream):
+        """回答キャッシュにヒットした場合、検索とCompletion APIを呼び出さずにキャッシュの回答を返し、
+        キャッシュヒットとして、回答を作成したモデルでメッセージログを保存することを確認します。
+        """
+        db = self.db_session
+        mock_get_vector_store.return_value.embedding_function.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        responses = [json.loads(response.body) for response in collect_responses(get_query_answer(1, 'test@example.com', 'What is Backlog?', db))]
+        self.assertEqual(responses[-1], {'status': 'answer', 'message': 'cached answer'})
+        mock_get_vector_store.return_value.similarity_search_with_score_by_vector.assert_not_called()
+        mock_call_completion_api_stream.assert_not_called()
+        message_log = db.add.call_args[0][0]
+        self.assertIsInstance(message_log, MessageLog)
+        self.assertTrue(message_log.IsCacheHit)
+        self.assertEqual(message_log.TotalTokens, 0)
+        self.assertEqual(message_log.Model, 'fallback-model')
+
+    @patch('services.user_query_service.call_completion_api_stream')
+    @patch('services.user_query_service.get_chat_history', return_value={'messages': [{'role': 'user', 'content': 'previous question'}], 'has_history': True})
+    @patch('services.user_query_service.get_vector_store')
+    def test_streams_completion(self, mock_get_vector_store, mock_get_chat_history, mock_call_completion_api_stream):
+        """Completion APIのストリームを非同期に中継し、メッセージログを保存することを確認します。"""
+        db = self.db_session
+        vector_store = mock_get_vector_store.return_value
+        vector_store.embedding_function.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        vector_store.similarity_search_with_score_by_vector.return_value = []
+
+        async def completion_stream(message_list, model):
+            for response_text in ['Hello', ' world', '']:
+                yield {'response_text': response_text, 'prompt_tokens': 10, 'completion_tokens': 2, 'total_tokens': 12, 'response_time': 0.5, 'has_error': False, 'model': model}
+
+        mock_call_completion_api_stream.side_effect = completion_stream
+        responses = [json.loads(response.body) for response in collect_responses(get_query_answer(1, 'test@example.com', 'What is Backlog?', db))]
+        self.assertEqual([response['message'] for response in responses if response['status'] == 'answer'], ['Hello', ' world'])
+        message_list = mock_call_completion_api_stream.call_args[0][0]
+        self.assertEqual(message_list[1], {'role': 'user', 'content': 'previous question'})
+        message_log = db.add.call_args[0][0]
+        self.assertFalse(message_log.IsCacheHit)
+        self.assertEqual(message_log.TotalTokens, 12)
+        self.assertEqual(message_log.Model, COMPLETION_MODEL_NAME)
+
+    @patch('services.user_query_service.call_completion_api_stream')
+    @patch('services.user_query_service.set_cached_answer')
+    @patch('services.user_query_service.get_cached_answer', return_value=None)
+    @patch('services.user_query_service.get_chat_history', return_value={'messages': [], 'has_history': False})
+    @patch('services.user_query_service.get_vector_store')
+    def test_identical_queries_are_coalesced(self, mock_get_vector_store, mock_get_chat_history, mock_get_cached_answer, mock_set_cached_answer, mock_call_completion_api_stream):
+        """同時に受け付けた同じクエリは、Completion APIを1回だけ呼び出してストリームを共有し、
+        それぞれのメッセージとメッセージログを保存することを確認します。
+        """
+        vector_store = mock_get_vector_store.return_value
+        vector_store.embedding_function.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        # 2つのリクエストの検索が重なるよう、検索に時間がかかるようにする
+        vector_store.similarity_search_with_score_by_vector.side_effect = lambda embedding, k: time.sleep(0.05) or []
+
+        async def completion_stream(message_list, model):
+            for response_text in ['Hello', ' world', '']:
+                await asyncio.sleep(0.01)
+                yield {'response_text': response_text, 'prompt_tokens': 10, 'completion_tokens': 2, 'total_tokens': 12, 'response_time': 0.5, 'has_error': False, 'model': model}
+
+        async def collect_concurrently(dbs):
+            async def collect(db):
+                return [json.loads(response.body) async for response in get_query_answer(1, 'test@example.com', 'What is Backlog?', db)]
+            return await asyncio.gather(*[collect(db) for db in dbs])
+
+        mock_call_completion_api_stream.side_effect = completion_stream
+        dbs = [MagicMock(AsyncSession), MagicMock(AsyncSession)]
+        results = asyncio.run(collect_concurrently(dbs))
+        mock_call_completion_api_stream.assert_called_once()
+        vector_store.similarity_search_with_score_by_vector.assert_called_once()
+        for responses in results:
+            self.assertEqual([response['message'] for response in responses if response['status'] == 'answer'], ['Hello', ' world'])
+        message_logs = [db.add.call_args[0][0] for db in dbs]
+        self.assertEqual([message_log.IsCoalesced for message_log in message_logs], [False, True])
+        self.assertEqual([message_log.TotalTokens for message_log in message_logs], [12, 0])
+
+    @patch('services.user_query_service.call_completion_api_stream')
+    @patch('services.openai_service.COMPLETION_ROUTING_RULES', [{'model': 'small-model', 'hints': ['simple'], 'max_top_score': 0.5}])
+    @patch('services.user_query_service.get_chat_history', return_value={'messages': [{'role': 'user', 'content': 'previous question'}], 'has_history': True})
+    @patch('services.user_query_service.get_vector_store')
+    def test_routes_model_and_records_used_model(self, mock_get_vector_store, mock_get_chat_history, mock_call_completion_api_stream):
+        """ルールに従って選択したモデルでCompletion APIを呼び出し、実際に使用したモデルをメッセージログに記録することを確認します。"""
+        vector_store = mock_get_vector_store.return_value
+        vector_store.embedding_function.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        vector_store.similarity_search_with_score_by_vector.return_value = []
+
+        async def completion_stream(message_list, model):
+            yield {'response_text': 'Hi', 'prompt_tokens': 10, 'completion_tokens': 1, 'total_tokens': 11, 'response_time': 0.1, 'has_error': False, 'model': 'fallback-model'}
+
+        mock_call_completion_api_stream.side_effect = completion_stream
+        db = self.db_session
+        collect_responses(get_query_answer(1, 'test@example.com', 'Hello', db, model_hint='simple'))
+        # 検索結果がない場合は、距離の条件を満たさない
+        self.assertEqual(mock_call_completion_api_stream.call_args[0][1], COMPLETION_MODEL_NAME)
+
+        vector_store.similarity_search_with_score_by_vector.return_value = [(MagicMock(page_content='Backlog', metadata={'Source': 'https://example.com', 'Title': 'Backlog'}), 0.2)]
+        with patch('services.context_service.get_token_count', side_effect=len):
+            collect_responses(get_query_answer(1, 'test@example.com', 'Hello again', db, model_hint='simple'))
+        self.assertEqual(mock_call_completion_api_stream.call_args[0][1], 'small-model')
+        self.assertEqual(db.add.call_args[0][0].Model, 'fallback-model')
+
+    @patch('services.user_query_service.call_completion_api_stream')
+    @patch('services.history_service.get_token_count', side_effect=len)
+    @patch('services.user_query_service.get_vector_store')
+    def test_no_connection_held_while_streaming(self, mock_get_vector_store, mock_get_token_count, mock_call_completion_api_stream):
+        """回答のストリーミング中はデータベースの接続を貸し出しておらず、メッセージは短いトランザクションで保存されることを確認します。"""
+        vector_store = mock_get_vector_store.return_value
+        vector_store.embedding_function.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        vector_store.similarity_search_with_score_by_vector.return_value = []
+        checked_out_while_streaming = []
+
+        async def completion_stream(message_list, model):
+            for response_text in ['Hello', ' world']:
+                checked_out_while_streaming.append(get_db_pool_stats()['checked_out'])
+                yield {'response_text': response_text, 'prompt_tokens': 10, 'completion_tokens': 2, 'total_tokens': 12, 'response_time': 0.5, 'has_error': False, 'model': model}
+
+        mock_call_completion_api_stream.side_effect = completion_stream
+
+        async def run_query(database_path):
+            # 本番環境（MySQL）と同じく、接続数を管理するプールを使用する
+            engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=AsyncAdaptedQueuePool)
+            instrument_pool(engine.sync_engine)
+            async with engine.begin() as connection:
+                for base in [chat.Base, message.Base, message_log.Base]:
+                    await connection.run_sync(base.metadata.create_all)
+            async with async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)() as db:
+                db.add(Chat(Id=1, User='test@example.com'))
+                await db.commit()
+                [response async for response in get_query_answer(1, 'test@example.com', 'What is Backlog?', db)]
+                checked_out_after_query = get_db_pool_stats()['checked_out']
+                contents = (await db.execute(select(Message.Content).order_by(Message.Id))).scalars().all()
+                total_tokens = (await db.execute(select(MessageLog.TotalTokens))).scalar_one()
+            await engine.dispose()
+            return checked_out_after_query, contents, total_tokens
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checked_out_after_query, contents, total_tokens = asyncio.run(run_query(os.path.join(temp_dir, 'test.db')))
+        self.assertEqual(checked_out_while_streaming, [0, 0])
+        self.assertEqual(checked_out_after_query, 0)
+        self.assertEqual(contents, ['What is Backlog?', 'Hello world'])
+        self.assertEqual(total_tokens, 12)
+
 if __name__ == '__main__':
     unittest.main()
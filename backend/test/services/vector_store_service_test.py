@@ -0,0 +1,171 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import tempfile
+import os
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from services import vector_store_service
+from services.vector_store_service import get_vector_store, reload_vector_store, refresh_vector_store, get_vector_store_version, load_vector_store
+from exceptions.general_exception import CustomGeneralException
+from utils.utils import save_deleted_embedding_ids, update_deleted_embedding_ids
+from utils.vector_stores import MultiVectorStore, FilteredVectorStore, save_mmap_vector_store
+
+class TestVectorStoreService(unittest.TestCase):
+    """vector_store_serviceのテストクラスです。
+
+    常駐ベクトルストアの読み込みと差し替えが正しく動作するかをテストします。
+    """
+
+    def setUp(self):
+        """テスト実行前の設定を行います。
+
+        常駐しているベクトルストアをリセットします。
+        """
+        vector_store_service._vector_store = None
+        vector_store_service._vector_store_version = 0
+        vector_store_service._vector_store_state.clear()
+
+    @patch('services.vector_store_service.load_vector_store')
+    def test_get_vector_store_loads_once(self, mock_load_vector_store):
+        """get_vector_storeを複数回呼び出しても、ディスクからの読み込みが1回だけであることを確認します。"""
+        vector_store = MagicMock()
+        mock_load_vector_store.return_value = vector_store
+        self.assertEqual(get_vector_store(), vector_store)
+        self.assertEqual(get_vector_store(), vector_store)
+        mock_load_vector_store.assert_called_once()
+        self.assertEqual(get_vector_store_version(), 1)
+
+    @patch('services.vector_store_service.load_vector_store')
+    def test_reload_vector_store_swaps_version(self, mock_load_vector_store):
+        """reload_vector_storeで新しいバージョンに差し替えられ、取得済みの古い参照は影響を受けないことを確認します。"""
+        old_vector_store = MagicMock()
+        new_vector_store = MagicMock()
+        mock_load_vector_store.side_effect = [old_vector_store, new_vector_store]
+        in_flight_vector_store = get_vector_store()
+        reload_vector_store()
+        self.assertEqual(in_flight_vector_store, old_vector_store)
+        self.assertEqual(get_vector_store(), new_vector_store)
+        self.assertEqual(get_vector_store_version(), 2)
+
+    def test_load_vector_store_merges_index_files(self):
+        """エンベディングフォルダ内のインデックスファイルがすべてマージされることを確認します。"""
+        embedding_model = FakeEmbeddings(size=8)
+        with tempfile.TemporaryDirectory() as folder_path:
+            for index_name in ['first', 'second']:
+                FAISS.from_documents([Document(page_content=index_name)], embedding_model).save_local(folder_path=folder_path, index_name=index_name)
+            with patch('services.vector_store_service.get_embeddings_folder_path', return_value=folder_path), \
+                    patch('services.vector_store_service.get_embedding_model', return_value=embedding_model):
+                vector_store = load_vector_store()
+        self.assertEqual(vector_store.index.ntotal, 2)
+
+    def test_load_vector_store_with_mmap_store(self):
+        """メモリマップ形式のベクトルストアとFAISSのインデックスファイルをまとめて検索できることを確認します。"""
+        embedding_model = FakeEmbeddings(size=8)
+        vectors = np.array(embedding_model.embed_documents(['mmap']), dtype=np.float32)
+        with tempfile.TemporaryDirectory() as folder_path:
+            FAISS.from_documents([Document(page_content='faiss')], embedding_model).save_local(folder_path=folder_path, index_name='first')
+            save_mmap_vector_store(os.path.join(folder_path, 'second.mmap'), vectors, [{'id': '1', 'page_content': 'mmap', 'metadata': {'Source': 'source'}}])
+            with patch('services.vector_store_service.get_embeddings_folder_path', return_value=folder_path), \
+                    patch('services.vector_store_service.get_embedding_model', return_value=embedding_model):
+                vector_store = load_vector_store()
+                self.assertIsInstance(vector_store, MultiVectorStore)
+                documents, _ = zip(*vector_store.similarity_search_with_score_by_vector(vectors[0].tolist(), k=2))
+        self.assertEqual(documents[0].page_content, 'mmap')
+        self.assertEqual(documents[0].metadata, {'Source': 'source'})
+        self.assertEqual(documents[1].page_content, 'faiss')
+
+    def test_load_vector_store_excludes_deleted_ids(self):
+        """削除済みのベクトルが、FAISSのインデックスとメモリマップ形式のベクトルストアのどちらの検索結果にも含まれないことを確認します。"""
+        embedding_model = FakeEmbeddings(size=8)
+        vectors = np.array(embedding_model.embed_documents(['mmap-old', 'mmap-new']), dtype=np.float32)
+        records = [{'id': text, 'page_content': text, 'metadata': {'EmbeddingId': text}} for text in ['mmap-old', 'mmap-new']]
+        with tempfile.TemporaryDirectory() as folder_path:
+            documents = [Document(page_content=text, metadata={'EmbeddingId': text}) for text in ['faiss-old', 'faiss-new']]
+            FAISS.from_documents(documents, embedding_model, ids=['faiss-old', 'faiss-new']).save_local(folder_path=folder_path, index_name='first')
+            save_mmap_vector_store(os.path.join(folder_path, 'second.mmap'), vectors, records)
+            save_deleted_embedding_ids(folder_path, ['faiss-old', 'mmap-old'])
+            with patch('services.vector_store_service.get_embeddings_folder_path', return_value=folder_path), \
+                    patch('services.vector_store_service.get_embedding_model', return_value=embedding_model):
+                vector_store = load_vector_store()
+                self.assertIsInstance(vector_store, FilteredVectorStore)
+                self.assertEqual(vector_store.deleted_ids, {'mmap-old'})
+                documents = vector_store.similarity_search('query', k=4)
+        self.assertEqual(sorted(document.page_content for document in documents), ['faiss-new', 'mmap-new'])
+
+    @patch('services.vector_store_service.EMBEDDING_SEARCH_MODE', 'sharded')
+    def test_load_vector_store_sharded_search(self):
+        """shardedの場合、インデックスファイルをマージせずに並行して検索し、全体の上位k件を返すことを確認します。"""
+        embedding_model = FakeEmbeddings(size=8)
+        texts = ['a', 'b', 'c', 'd', 'e', 'f']
+        vectors = embedding_model.embed_documents(texts)
+        with tempfile.TemporaryDirectory() as folder_path:
+            for index_name, start in [('first', 0), ('second', 2), ('third', 4)]:
+                text_embeddings = list(zip(texts[start:start + 2], vectors[start:start + 2]))
+                FAISS.from_embeddings(text_embeddings, embedding_model).save_local(folder_path=folder_path, index_name=index_name)
+            with patch('services.vector_store_service.get_embeddings_folder_path', return_value=folder_path), \
+                    patch('services.vector_store_service.get_embedding_model', return_value=embedding_model):
+                vector_store = load_vector_store()
+            merged_vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embedding_model)
+        self.assertIsInstance(vector_store, MultiVectorStore)
+        self.assertEqual(len(vector_store.vector_stores), 3)
+        query = vectors[3]
+        results = vector_store.similarity_search_with_score_by_vector(query, k=4)
+        expected_results = merged_vector_store.similarity_search_with_score_by_vector(query, k=4)
+        self.assertEqual([document.page_content for document, _ in results], [document.page_content for document, _ in expected_results])
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores))
+
+    def test_refresh_vector_store_loads_only_changes(self):
+        """refresh_vector_storeは追加されたインデックスだけを読み込み、読み込み済みのインデックスの削除済みのベクトルを検索結果から除外することを確認します。"""
+        embedding_model = FakeEmbeddings(size=8)
+
+        def save_index(folder_path, index_name, texts):
+            documents = [Document(page_content=text, metadata={'EmbeddingId': text}) for text in texts]
+            FAISS.from_documents(documents, embedding_model, ids=texts).save_local(folder_path=folder_path, index_name=index_name)
+
+        with tempfile.TemporaryDirectory() as folder_path, \
+                patch('services.vector_store_service.get_embeddings_folder_path', return_value=folder_path), \
+                patch('services.vector_store_service.get_embedding_model', return_value=embedding_model):
+            save_index(folder_path, 'first', ['a-old', 'a-new'])
+            reload_vector_store()
+            first_vector_store = vector_store_service._vector_store_state['vector_stores'][0]
+
+            save_index(folder_path, 'second', ['b-old', 'b-new'])
+            update_deleted_embedding_ids(folder_path, added_ids=['a-old', 'b-old'])
+            with patch('services.vector_store_service.FAISS.load_local', wraps=FAISS.load_local) as mock_load_local:
+                refresh_vector_store()
+            self.assertEqual([call.kwargs['index_name'] for call in mock_load_local.call_args_list], ['second'])
+
+            vector_store = get_vector_store()
+            self.assertIsInstance(vector_store, FilteredVectorStore)
+            self.assertEqual(vector_store.deleted_ids, {'a-old'})
+            self.assertIs(vector_store.vector_store.vector_stores[0], first_vector_store)
+            self.assertEqual(vector_store.vector_store.vector_stores[1].index.ntotal, 1)
+            documents = vector_store.similarity_search('query', k=4)
+            self.assertEqual(sorted(document.page_content for document in documents), ['a-new', 'b-new'])
+            self.assertEqual(get_vector_store_version(), 2)
+
+    def test_refresh_vector_store_reloads_after_compaction(self):
+        """読み込み済みのインデックスファイルが削除された場合は、すべて読み直すことを確認します。"""
+        with patch('services.vector_store_service.load_vector_store') as mock_load_vector_store, \
+                patch('services.vector_store_service.get_embeddings_folder_path', return_value='folder'), \
+                patch('services.vector_store_service.get_embedding_version'), \
+                patch('services.vector_store_service.get_embedding_index_names', return_value=['compacted']), \
+                patch('services.vector_store_service.get_mmap_store_names', return_value=[]):
+            vector_store_service._vector_store = MagicMock()
+            vector_store_service._vector_store_state.update(store_names={'first', 'second'})
+            refresh_vector_store()
+        mock_load_vector_store.assert_called_once()
+        self.assertEqual(get_vector_store_version(), 1)
+
+    def test_load_vector_store_empty_folder(self):
+        """エンベディングファイルが存在しない場合、CustomGeneralExceptionが発生することを確認します。"""
+        with tempfile.TemporaryDirectory() as folder_path:
+            with patch('services.vector_store_service.get_embeddings_folder_path', return_value=folder_path):
+                with self.assertRaises(CustomGeneralException):
+                    load_vector_store()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from zipfile import BadZipFile
+import pyarrow
+import pyarrow.parquet
+import codecs
+import csv
+import io
+import json
+
+FILE_FORMAT_EXCEL = 'xlsx'
+FILE_FORMAT_CSV = 'csv'
+FILE_FORMAT_JSONL = 'jsonl'
+FILE_FORMAT_PARQUET = 'parquet'
+
+# ファイル形式を判定するために読み込む、ファイルの先頭のバイト数
+FILE_FORMAT_DETECT_BYTES = 64
+
+# 拡張子からのみ判定するテキスト形式
+CSV_FILE_EXTENSIONS = ('.csv',)
+
+class DataStoreFileParseError(Exception):
+    """
+    アップロードされたファイルを読み込めなかったことを表す例外です。
+    """
+
+def detect_file_format(file, filename: str):
+    """
+    ファイルの先頭のバイト列から、アップロードされたファイルの形式を判定します。
+
+    xlsx（ZIP）とParquetはマジックナンバー、JSON Linesは最初の文字が「{」であることで判定し、
+    いずれでもない場合は拡張子がCSVの場合のみCSVとします。判定後、ファイルの読み込み位置は先頭に戻します。
+
+    Arguments:
+        file {BinaryIO} -- アップロードされたファイル
+        filename {str} -- ファイル名
+
+    Returns:
+        str -- ファイル形式（FILE_FORMAT_*、判定できない場合はNone）
+    """
+    head = file.read(FILE_FORMAT_DETECT_BYTES)
+    file.seek(0)
+    if not isinstance(head, bytes):
+        return None
+    if head.startswith(b'PK\x03\x04'):
+        return FILE_FORMAT_EXCEL
+    if head.startswith(b'PAR1'):
+        return FILE_FORMAT_PARQUET
+    if head.removeprefix(codecs.BOM_UTF8).lstrip().startswith(b'{'):
+        return FILE_FORMAT_JSONL
+    if (filename or '').lower().endswith(CSV_FILE_EXTENSIONS):
+        return FILE_FORMAT_CSV
+    return None
+
+def iter_file_chunks(file, file_format: str, chunk_rows: int):
+    """
+    ファイル形式に応じてファイルを少しずつ読み込み、chunk_rows行ごとに列単位の辞書として返します。
+
+    Arguments:
+        file {BinaryIO} -- アップロードされたファイル
+        file_format {str} -- ファイル形式（FILE_FORMAT_*）
+        chunk_rows {int} -- 1つのチャンクの行数
+
+    Yields:
+        Tuple[list, dict] -- チャンクの各行の行番号のリストと、列名をキーとする値のリストの辞書
+
+    Raises:
+        DataStoreFileParseError: ファイルを読み込めなかった場合に発生
+    """
+    try:
+        yield from _CHUNK_READERS[file_format](file, chunk_rows)
+    except (InvalidFileException, BadZipFile, csv.Error, UnicodeDecodeError, json.JSONDecodeError, pyarrow.ArrowException) as e:
+        raise DataStoreFileParseError(str(e)) from e
+
+def iter_excel_chunks(file, chunk_rows: int):
+    """
+    Excelファイルの最初のシートを1行ずつ読み込み、chunk_rows行ごとに列単位の辞書として返します。
+
+    ワークブック全体をメモリに読み込まないよう、読み取り専用モードで開きます。
+    1行目はヘッダーとして扱い、すべてのセルが空の行は読み飛ばします。
+
+    Arguments:
+        file {BinaryIO} -- Excelファイル
+        chunk_rows {int} -- 1つのチャンクの行数
+
+    Yields:
+        Tuple[list, dict] -- チャンクの各行の行番号（ヘッダーを1行目とする）のリストと、列名をキーとする値のリストの辞書
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from _iter_row_chunks(workbook.worksheets[0].iter_rows(values_only=True), chunk_rows)
+    finally:
+        workbook.close()
+
+def iter_csv_chunks(file, chunk_rows: int):
+    """
+    UTF-8のCSVファイルを1行ずつ読み込み、chunk_rows行ごとに列単位の辞書として返します。
+
+    1行目はヘッダーとして扱い、空のセルはNone、すべてのセルが空の行は読み飛ばします。
+
+    Arguments:
+        file {BinaryIO} -- CSVファイル
+        chunk_rows {int} -- 1つのチャンクの行数
+
+    Yields:
+        Tuple[list, dict] -- チャンクの各行の行番号（ヘッダーを1行目とする）のリストと、列名をキーとする値のリストの辞書
+    """
+    text_file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        rows = ([value if value != '' else None for value in row] for row in csv.reader(text_file))
+        yield from _iter_row_chunks(rows, chunk_rows)
+    finally:
+        # アップロードされたファイル自体は閉じないよう、ラッパーを切り離す
+        text_file.detach()
+
+def iter_jsonl_chunks(file, chunk_rows: int):
+    """
+    JSON Linesファイルを1行ずつ読み込み、chunk_rows行ごとに列単位の辞書として返します。
+
+    各行は列名をキーとするJSONオブジェクトとし、空の行は読み飛ばします。
+
+    Arguments:
+        file {BinaryIO} -- JSON Linesファイル
+        chunk_rows {int} -- 1つのチャンクの行数
+
+    Yields:
+        Tuple[list, dict] -- チャンクの各行の行番号のリストと、列名をキーとする値のリストの辞書
+
+    Raises:
+        DataStoreFileParseError: JSONオブジェクトではない行がある場合に発生
+    """
+    row_numbers = []
+    records = []
+    for row_number, line in enumerate(file, start=1):
+        line = line.decode('utf-8-sig' if row_number == 1 else 'utf-8').strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise DataStoreFileParseError(f"Line {row_number} is not a JSON object.")
+        row_numbers.append(row_number)
+        records.append(record)
+        if len(records) >= chunk_rows:
+            yield row_numbers, _records_to_columns(records)
+            row_numbers = []
+            records = []
+    if records:
+        yield row_numbers, _records_to_columns(records)
+
+def iter_parquet_chunks(file, chunk_rows: int):
+    """
+    Parquetファイルをchunk_rows行ずつのレコードバッチで読み込み、列単位の辞書として返します。
+
+    Arguments:
+        file {BinaryIO} -- Parquetファイル
+        chunk_rows {int} -- 1つのチャンクの行数
+
+    Yields:
+        Tuple[list, dict] -- チャンクの各行の行番号（1から開始）のリストと、列名をキーとする値のリストの辞書
+    """
+    parquet_file = pyarrow.parquet.ParquetFile(file)
+    try:
+        first_row_number = 1
+        for record_batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            row_numbers = list(range(first_row_number, first_row_number + record_batch.num_rows))
+            first_row_number += record_batch.num_rows
+            if row_numbers:
+                yield row_numbers, record_batch.to_pydict()
+    finally:
+        parquet_file.close()
+
+def _iter_row_chunks(rows, chunk_rows: int):
+    """
+    最初の行をヘッダーとして、行のイテレーターをchunk_rows行ごとの列単位の辞書に変換します。
+
+    Arguments:
+        rows {Iterator[Sequence]} -- 行のイテレーター
+        chunk_rows {int} -- 1つのチャンクの行数
+
+    Yields:
+        Tuple[list, dict] -- チャンクの各行の行番号（ヘッダーを1行目とする）のリストと、列名をキーとする値のリストの辞書
+    """
+    header = next(rows, None)
+    if header is None:
+        return
+    column_names = [str(column_name).strip() if column_name is not None else '' for column_name in header]
+
+    row_numbers = []
+    chunk = []
+    for row_number, row in enumerate(rows, start=2):
+        if all(value is None for value in row):
+            continue
+        row_numbers.append(row_number)
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield row_numbers, _to_columns(column_names, chunk)
+            row_numbers = []
+            chunk = []
+    if chunk:
+        yield row_numbers, _to_columns(column_names, chunk)
+
+def _to_columns(column_names: list, rows: list) -> dict:
+    """
+    行のリストを、列名をキーとする値のリストの辞書に変換します。足りないセルはNoneとします。
+
+    Arguments:
+        column_names {list} -- 列名のリスト
+        rows {list} -- 行のリスト
+
+    Returns:
+        dict -- 列名をキーとする値のリストの辞書
+    """
+    return {column_name: [row[index] if index < len(row) else None for row in rows] for index, column_name in enumerate(column_names)}
+
+def _records_to_columns(records: list) -> dict:
+    """
+    JSONオブジェクトのリストを、列名をキーとする値のリストの辞書に変換します。キーがないオブジェクトの値はNoneとします。
+
+    Arguments:
+        records {list} -- JSONオブジェクトのリスト
+
+    Returns:
+        dict -- 列名をキーとする値のリストの辞書
+    """
+    column_names = dict.fromkeys(key for record in records for key in record)
+    return {column_name: [record.get(column_name) for record in records] for column_name in column_names}
+
+_CHUNK_READERS = {
+    FILE_FORMAT_EXCEL: iter_excel_chunks,
+    FILE_FORMAT_CSV: iter_csv_chunks,
+    FILE_FORMAT_JSONL: iter_jsonl_chunks,
+    FILE_FORMAT_PARQUET: iter_parquet_chunks,
+}
@@ -0,0 +1,87 @@
+from config.constant import (
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE_SECONDS,
+    DB_POOL_TIMEOUT_SECONDS,
+    DATABASE_ASYNC_DRIVER_NAMES,
+    DATABASE_SYNC_DRIVER_NAMES)
+from sqlalchemy import insert
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    データベースのURLを、非同期のドライバー（aiosqlite / aiomysql / asyncpg）を使用するURLに変換します。
+
+    すでに非同期のドライバーを指定している場合や、対応するドライバーがない場合は、そのまま返します。
+
+    Arguments:
+        database_url {str} -- データベースのURL
+
+    Returns:
+        str -- 非同期のドライバーを使用するURL
+    """
+    url = make_url(database_url)
+    drivername = DATABASE_ASYNC_DRIVER_NAMES.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+def get_sync_database_url(database_url: str) -> str:
+    """
+    データベースのURLを、同期のドライバーを使用するURLに変換します。
+
+    すでに同期のドライバーを指定している場合や、対応するドライバーがない場合は、そのまま返します。
+
+    Arguments:
+        database_url {str} -- データベースのURL
+
+    Returns:
+        str -- 同期のドライバーを使用するURL
+    """
+    url = make_url(database_url)
+    drivername = DATABASE_SYNC_DRIVER_NAMES.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+def get_engine_options(database_url: str) -> dict:
+    """
+    エンジンの作成に使用する、接続プールのオプションを取得します。
+
+    プールのサイズ、オーバーフロー、接続の再作成までの秒数、接続を待つ秒数は環境変数で設定します。
+    SQLiteはサイズを指定できないプールを使用するため、接続の確認のみを設定します。
+
+    Arguments:
+        database_url {str} -- データベースのURL
+
+    Returns:
+        dict -- create_engine / create_async_engineのオプション
+    """
+    options = {'pool_pre_ping': True}
+    if make_url(database_url).get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS)
+    return options
+
+def get_insert_ignore_statement(dialect_name: str, table):
+    """
+    一意制約に違反する行を挿入せずに無視する、データベースごとのINSERT文を取得します。
+
+    MySQLはON DUPLICATE KEY UPDATE（既存の行は変更しない）、SQLiteとPostgreSQLはON CONFLICT DO NOTHINGを使用します。
+    それ以外のデータベースでは、通常のINSERT文を返します。
+
+    Arguments:
+        dialect_name {str} -- データベースの方言名（engine.dialect.name）
+        table {Table} -- 挿入するテーブル
+
+    Returns:
+        Insert -- INSERT文
+    """
+    if dialect_name == 'mysql':
+        primary_key = next(iter(table.primary_key.columns))
+        return mysql.insert(table).on_duplicate_key_update({primary_key.name: primary_key})
+    if dialect_name == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect_name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return insert(table)
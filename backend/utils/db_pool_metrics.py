@@ -0,0 +1,85 @@
+from config.constant import (
+    DB_POOL_CHECKOUT_SAMPLES,
+    DB_POOL_CHECKOUT_WARNING_SECONDS,
+    LOG_MESSAGE_DB_CONNECTION_HELD)
+from config import logger
+from sqlalchemy import event
+from utils.resilience import LatencyTracker
+import threading
+import time
+
+backlog_gen_ai_chat_logger = logger.get_logger()
+
+# 計測対象の接続プール（同期と非同期のエンジン）と、接続を貸し出してから返却されるまでの時間
+_pools = []
+_checkout_tracker = LatencyTracker(DB_POOL_CHECKOUT_SAMPLES)
+_checkout_stats = {'checkouts': 0, 'long_checkouts': 0, 'max_checkout_seconds': 0.0}
+# 貸し出し中の接続ごとの貸し出した時刻
+_checked_out_at = {}
+_checkout_stats_lock = threading.Lock()
+
+def instrument_pool(engine):
+    """
+    エンジンの接続プールに、接続の貸し出しと返却を計測するイベントリスナーを登録します。
+    非同期のエンジンの場合は、sync_engineを指定します。
+
+    接続がDB_POOL_CHECKOUT_WARNING_SECONDS秒以上貸し出されていた場合は、ログに出力します。
+
+    Arguments:
+        engine {sqlalchemy.engine.Engine} -- 計測するエンジン
+    """
+    _pools.append(engine.pool)
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _checkout_stats_lock:
+            _checked_out_at[id(connection_record)] = time.monotonic()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        with _checkout_stats_lock:
+            checked_out_at = _checked_out_at.pop(id(connection_record), None)
+            if checked_out_at is None:
+                return
+            seconds = time.monotonic() - checked_out_at
+            _checkout_stats['checkouts'] += 1
+            _checkout_stats['max_checkout_seconds'] = max(_checkout_stats['max_checkout_seconds'], seconds)
+            if seconds >= DB_POOL_CHECKOUT_WARNING_SECONDS:
+                _checkout_stats['long_checkouts'] += 1
+        _checkout_tracker.add(seconds)
+        if seconds >= DB_POOL_CHECKOUT_WARNING_SECONDS:
+            backlog_gen_ai_chat_logger.info(LOG_MESSAGE_DB_CONNECTION_HELD.format(seconds=round(seconds, 3)))
+
+def get_db_pool_stats() -> dict:
+    """
+    接続プールの状態と、接続を貸し出してから返却されるまでの時間の統計情報を取得します。
+
+    プールのサイズ、貸し出し中の接続数、オーバーフロー数は、計測しているすべてのプールの合計です。
+
+    Returns:
+        dict -- プールのサイズ、貸し出し中の接続数、オーバーフロー数、返却された接続の数、
+                貸し出し時間のパーセンタイルと最大、貸し出し中の接続のうち最も長い貸し出し時間
+    """
+    now = time.monotonic()
+    with _checkout_stats_lock:
+        stats = dict(_checkout_stats)
+        oldest_checked_out_at = min(_checked_out_at.values(), default=None)
+    return {
+        'pool_size': _get_pool_value('size'),
+        'checked_out': _get_pool_value('checkedout'),
+        'overflow': _get_pool_value('overflow'),
+        **stats,
+        'checkout_seconds': {
+            'p50': _checkout_tracker.get_percentile(50),
+            'p95': _checkout_tracker.get_percentile(95),
+            'p99': _checkout_tracker.get_percentile(99),
+        },
+        'oldest_checkout_seconds': now - oldest_checked_out_at if oldest_checked_out_at is not None else None,
+    }
+
+def _get_pool_value(name):
+    """
+    計測しているすべての接続プールの値の合計を取得します。プールの種類によって提供されない値は除き、どのプールも提供しない場合はNoneとします。
+    """
+    values = [getattr(pool, name)() for pool in list(_pools) if hasattr(pool, name)]
+    return sum(values) if values else None
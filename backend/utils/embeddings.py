@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import threading
+from utils.single_flight import SingleFlight
+
+class QueryEmbeddingCache:
+    """
+    クエリのテキストをキー、ベクトルを値とする、上限付きのLRUキャッシュです。
+
+    ベクトルはPythonのリストではなく、あらかじめ確保したfloat32の配列に格納し、
+    上限を超えた場合は最も長く使われていないベクトルの領域を再利用します。
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.vectors = None
+        self.slots = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        キャッシュからベクトルを取得します。
+
+        Arguments:
+            key {tuple} -- 埋め込みモデル名とクエリのテキストのタプル
+
+        Returns:
+            List[float] -- ベクトル（キャッシュにない場合はNone）
+        """
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self.slots.move_to_end(key)
+            self.hits += 1
+            return self.vectors[slot].tolist()
+
+    def set(self, key, vector):
+        """
+        ベクトルをキャッシュに登録します。
+
+        Arguments:
+            key {tuple} -- 埋め込みモデル名とクエリのテキストのタプル
+            vector {List[float]} -- ベクトル
+        """
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != len(vector):
+                self.vectors = np.empty((self.max_entries, len(vector)), dtype=np.float32)
+                self.slots.clear()
+            slot = self.slots.get(key)
+            if slot is None:
+                if len(self.slots) < self.max_entries:
+                    slot = len(self.slots)
+                else:
+                    _, slot = self.slots.popitem(last=False)
+                self.slots[key] = slot
+            self.slots.move_to_end(key)
+            self.vectors[slot] = vector
+
+    def get_stats(self) -> dict:
+        """
+        キャッシュのヒット数、ミス数、ヒット率、登録数を取得します。
+
+        Returns:
+            dict -- キャッシュの統計情報
+        """
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else 0,
+                "entries": len(self.slots),
+                "max_entries": self.max_entries,
+            }
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    クエリのベクトル化の結果をQueryEmbeddingCacheにキャッシュする埋め込みモデルです。
+
+    ドキュメントのベクトル化はキャッシュせず、そのまま元の埋め込みモデルを呼び出します。
+    同じクエリの非同期のベクトル化が実行中の場合は、Embedding APIを呼び出さずにその結果を共有します。
+    """
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.single_flight = SingleFlight()
+
+    @property
+    def model(self) -> str:
+        """
+        元の埋め込みモデルのモデル名を取得します。
+
+        Returns:
+            str -- 埋め込みモデル名
+        """
+        return self.embeddings.model
+
+    def embed_documents(self, texts):
+        """
+        ドキュメントをベクトル化します。
+
+        Arguments:
+            texts {List[str]} -- ドキュメントのテキストのリスト
+
+        Returns:
+            List[List[float]] -- テキストと同じ順序のベクトルのリスト
+        """
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        """
+        クエリをベクトル化します。キャッシュにある場合は、Embedding APIを呼び出しません。
+
+        Arguments:
+            text {str} -- クエリ
+
+        Returns:
+            List[float] -- ベクトル
+        """
+        key = (self.model, text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        """
+        クエリを非同期にベクトル化します。キャッシュにある場合や、同じクエリのベクトル化が実行中の場合は、Embedding APIを呼び出しません。
+
+        Arguments:
+            text {str} -- クエリ
+
+        Returns:
+            List[float] -- ベクトル
+        """
+        key = (self.model, text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.single_flight.call(key, lambda: self._aembed_query_and_cache(key, text))
+        return vector
+
+    async def _aembed_query_and_cache(self, key, text):
+        """
+        Embedding APIでクエリをベクトル化し、キャッシュに追加します。
+        """
+        vector = await self.embeddings.aembed_query(text)
+        self.cache.set(key, vector)
+        return vector
@@ -0,0 +1,162 @@
+from config.constant import (
+    OPENAI_KEY,
+    OPENAI_HTTP_MAX_CONNECTIONS,
+    OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS,
+    OPENAI_HTTP_TIMEOUT_SECONDS,
+    OPENAI_HTTP2)
+from openai import OpenAI, AsyncOpenAI
+import httpx
+import threading
+
+try:
+    import h2  # noqa: F401
+    IS_HTTP2_AVAILABLE = True
+except ImportError:
+    IS_HTTP2_AVAILABLE = False
+
+# プロセス全体で共有する、OpenAI API用のHTTPクライアントとOpenAIクライアント
+_http_client = None
+_async_http_client = None
+_openai_client = None
+_async_openai_client = None
+_http_client_lock = threading.Lock()
+
+# HTTPクライアントごとの送信リクエスト数
+_request_counts = {'sync': 0, 'async': 0}
+
+def get_http_client_options() -> dict:
+    """
+    HTTPクライアントの接続プール、キープアライブ、タイムアウト、HTTP/2の設定を取得します。
+
+    HTTP/2はOPENAI_HTTP2がtrueで、h2パッケージがインストールされている場合のみ有効にします。
+
+    Returns:
+        dict -- httpx.Client / httpx.AsyncClientのオプション
+    """
+    return {
+        'limits': httpx.Limits(
+            max_connections=OPENAI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS),
+        'timeout': httpx.Timeout(OPENAI_HTTP_TIMEOUT_SECONDS, connect=OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS),
+        'http2': OPENAI_HTTP2 and IS_HTTP2_AVAILABLE,
+    }
+
+def get_http_client() -> httpx.Client:
+    """
+    同期処理で使用する、接続プール付きのHTTPクライアントを取得します。初回のみ作成します。
+
+    Returns:
+        httpx.Client -- HTTPクライアント
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                def count_request(request):
+                    _request_counts['sync'] += 1
+                _http_client = httpx.Client(event_hooks={'request': [count_request]}, **get_http_client_options())
+    return _http_client
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    非同期処理で使用する、接続プール付きのHTTPクライアントを取得します。初回のみ作成します。
+
+    Returns:
+        httpx.AsyncClient -- 非同期のHTTPクライアント
+    """
+    global _async_http_client
+    if _async_http_client is None:
+        with _http_client_lock:
+            if _async_http_client is None:
+                async def count_request(request):
+                    _request_counts['async'] += 1
+                _async_http_client = httpx.AsyncClient(event_hooks={'request': [count_request]}, **get_http_client_options())
+    return _async_http_client
+
+def get_openai_client() -> OpenAI:
+    """
+    共有のHTTPクライアントを使用するOpenAIクライアントを取得します。初回のみ作成します。
+
+    Returns:
+        OpenAI -- OpenAIクライアント
+    """
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=OPENAI_KEY, http_client=get_http_client())
+    return _openai_client
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    共有の非同期HTTPクライアントを使用する非同期のOpenAIクライアントを取得します。初回のみ作成します。
+
+    Returns:
+        AsyncOpenAI -- 非同期のOpenAIクライアント
+    """
+    global _async_openai_client
+    if _async_openai_client is None:
+        _async_openai_client = AsyncOpenAI(api_key=OPENAI_KEY, http_client=get_async_http_client())
+    return _async_openai_client
+
+async def close_http_clients():
+    """
+    共有のHTTPクライアントを閉じ、接続プールのコネクションを解放します。アプリケーションの終了時に呼び出します。
+    """
+    global _http_client, _async_http_client, _openai_client, _async_openai_client
+    with _http_client_lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client = _async_http_client = _openai_client = _async_openai_client = None
+    if http_client is not None:
+        http_client.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
+
+def get_http_pool_stats() -> dict:
+    """
+    共有のHTTPクライアントの接続プールの統計情報（コネクション数、アイドル数、HTTP/2の使用数、送信リクエスト数）を取得します。
+
+    Returns:
+        dict -- HTTPクライアントごとの統計情報
+    """
+    return {
+        'sync': _get_pool_stats(_http_client, _request_counts['sync']),
+        'async': _get_pool_stats(_async_http_client, _request_counts['async']),
+        'max_connections': OPENAI_HTTP_MAX_CONNECTIONS,
+        'max_keepalive_connections': OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        'http2_enabled': OPENAI_HTTP2 and IS_HTTP2_AVAILABLE,
+    }
+
+def _get_pool_stats(http_client, request_count) -> dict:
+    """
+    HTTPクライアントの接続プールの統計情報を取得します。
+
+    httpxは接続プールの状態を公開していないため、内部のhttpcoreの接続プールから取得します。
+    内部の構造がhttpxのバージョンで異なり取得できない場合は、コネクション数をNoneとします。
+
+    Arguments:
+        http_client {httpx.Client | httpx.AsyncClient} -- HTTPクライアント（未作成の場合はNone）
+        request_count {int} -- 送信リクエスト数
+
+    Returns:
+        dict -- 統計情報
+    """
+    stats = {'created': http_client is not None, 'requests': request_count}
+    connections = []
+    if http_client is not None:
+        try:
+            connections = list(http_client._transport._pool.connections)
+            idle_connections = sum(1 for connection in connections if connection.is_idle())
+            http2_connections = sum(1 for connection in connections if connection.info().startswith('HTTP/2'))
+        except (AttributeError, TypeError):
+            return {**stats, 'connections': None, 'active_connections': None, 'idle_connections': None, 'http2_connections': None}
+    else:
+        idle_connections = http2_connections = 0
+    return {
+        **stats,
+        'connections': len(connections),
+        'active_connections': len(connections) - idle_connections,
+        'idle_connections': idle_connections,
+        'http2_connections': http2_connections,
+    }
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+class RateLimiter:
+    """
+    1分あたりのリクエスト数とトークン数の上限を守るための、スレッドセーフなトークンバケット方式のレートリミッター。
+
+    リクエスト数とトークン数のバケットはそれぞれ1分間で上限まで補充されます。
+    複数のスレッドから共有して使用し、上限を超える場合は補充されるまで待機します。
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = float(requests_per_minute)
+        self.available_tokens = float(tokens_per_minute)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """
+        1リクエスト分と指定されたトークン数の枠を確保します。枠が足りない場合は補充されるまで待機します。
+
+        Arguments:
+            tokens {int} -- リクエストで使用するトークン数（1分あたりの上限を超える場合は上限として扱います）
+
+        Returns:
+            float -- 待機した秒数
+        """
+        waited_seconds = 0.0
+        while True:
+            wait_seconds = self.try_acquire(tokens)
+            if wait_seconds == 0:
+                return waited_seconds
+            self.sleep(wait_seconds)
+            waited_seconds += wait_seconds
+
+    async def aacquire(self, tokens=0):
+        """
+        acquireの非同期版です。枠が足りない場合は、イベントループをブロックせずに補充されるまで待機します。
+
+        Arguments:
+            tokens {int} -- リクエストで使用するトークン数（1分あたりの上限を超える場合は上限として扱います）
+
+        Returns:
+            float -- 待機した秒数
+        """
+        waited_seconds = 0.0
+        while True:
+            wait_seconds = self.try_acquire(tokens)
+            if wait_seconds == 0:
+                return waited_seconds
+            await asyncio.sleep(wait_seconds)
+            waited_seconds += wait_seconds
+
+    def try_acquire(self, tokens=0):
+        """
+        待機せずに、1リクエスト分と指定されたトークン数の枠の確保を試みます。
+
+        Arguments:
+            tokens {int} -- リクエストで使用するトークン数（1分あたりの上限を超える場合は上限として扱います）
+
+        Returns:
+            float -- 確保できた場合は0、確保できなかった場合は不足している枠が補充されるまでの秒数
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        with self.lock:
+            self._refill()
+            if self.available_requests >= 1 and self.available_tokens >= tokens:
+                self.available_requests -= 1
+                self.available_tokens -= tokens
+                return 0
+            return max(
+                (1 - self.available_requests) * 60 / self.requests_per_minute,
+                (tokens - self.available_tokens) * 60 / self.tokens_per_minute)
+
+    def _refill(self):
+        """
+        前回の更新からの経過時間に応じて、リクエスト数とトークン数のバケットを補充します。呼び出し元でロックを取得していること。
+        """
+        now = self.clock()
+        elapsed_minutes = (now - self.updated_at) / 60
+        self.updated_at = now
+        self.available_requests = min(self.requests_per_minute, self.available_requests + elapsed_minutes * self.requests_per_minute)
+        self.available_tokens = min(self.tokens_per_minute, self.available_tokens + elapsed_minutes * self.tokens_per_minute)
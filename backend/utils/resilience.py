@@ -0,0 +1,127 @@
+from collections import deque
+import random
+import threading
+import time
+
+class CircuitOpenError(Exception):
+    """
+    サーキットブレーカーが開いているため、上流のAPIを呼び出さずに失敗させたことを表す例外です。
+    """
+
+class CircuitBreaker:
+    """
+    上流のAPIが不安定な間、呼び出しをすぐに失敗させるためのサーキットブレーカーです。
+
+    連続してfailure_threshold回失敗すると開き、reset_seconds秒間はすべての呼び出しを拒否します。
+    その後は1件のみ試行を許可し（半開）、成功すれば閉じ、失敗すれば再び開きます。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def check(self):
+        """
+        呼び出しを許可するかどうかを確認します。
+
+        Raises:
+            CircuitOpenError: サーキットブレーカーが開いている場合、または半開で試行中の場合に発生
+        """
+        with self.lock:
+            # 試行した呼び出しの結果が記録されないまま時間が経過した場合も、再度試行を許可する
+            if self.state != self.CLOSED and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self.opened_at = self.clock()
+                return
+            if self.state != self.CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError()
+
+    def record_success(self):
+        """
+        呼び出しの成功を記録し、サーキットブレーカーを閉じます。
+        """
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """
+        呼び出しの失敗を記録し、連続した失敗が上限に達した場合や半開で失敗した場合は、サーキットブレーカーを開きます。
+        """
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def get_stats(self) -> dict:
+        """
+        サーキットブレーカーの状態を取得します。
+
+        Returns:
+            dict -- 状態、連続した失敗の回数、拒否した呼び出しの回数
+        """
+        with self.lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+class LatencyTracker:
+    """
+    直近のレイテンシを保持し、パーセンタイルを計算するためのクラスです。
+    """
+
+    def __init__(self, max_samples):
+        self.samples = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        """
+        レイテンシを追加します。上限を超えた場合は、最も古いものから削除します。
+
+        Arguments:
+            seconds {float} -- レイテンシ（秒）
+        """
+        with self.lock:
+            self.samples.append(seconds)
+
+    def get_percentile(self, percentile, min_samples=1):
+        """
+        直近のレイテンシのパーセンタイルを取得します。
+
+        Arguments:
+            percentile {float} -- パーセンタイル（0〜100）
+            min_samples {int} -- 計算に必要な最小のサンプル数
+
+        Returns:
+            float -- パーセンタイルの値（サンプル数が足りない場合はNone）
+        """
+        with self.lock:
+            if len(self.samples) < max(min_samples, 1):
+                return None
+            samples = sorted(self.samples)
+        index = min(int(len(samples) * percentile / 100), len(samples) - 1)
+        return samples[index]
+
+def get_backoff_seconds(attempt, base_seconds, max_seconds):
+    """
+    リトライまでの待機時間を、ジッター付きの指数バックオフ（フルジッター）で計算します。
+
+    Arguments:
+        attempt {int} -- 何回目のリトライか（0から開始）
+        base_seconds {float} -- 最初のリトライの待機時間の上限
+        max_seconds {float} -- 待機時間の上限
+
+    Returns:
+        float -- 待機時間（秒）
+    """
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
@@ -0,0 +1,140 @@
+import asyncio
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中の場合、新しく実行せずに実行中の処理の結果を共有するためのクラスです（asyncio用）。
+
+    call()はコルーチンの結果を共有し、subscribe()は非同期ジェネレーターが生成する値を、
+    途中から参加した呼び出し元にも最初から順に配信します。
+    処理が終了するとキーは削除され、次の呼び出しでは新しく実行します。
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.streams = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def call(self, key, func):
+        """
+        同じキーの処理が実行中の場合はその結果を待ち、実行中でない場合はfuncを実行して結果を返します。
+
+        呼び出し元の1つがキャンセルされても、他の呼び出し元が待っている処理はキャンセルしません。
+
+        Arguments:
+            key {Hashable} -- 処理を識別するキー
+            func {Callable[[], Awaitable]} -- 実行するコルーチンを返す関数
+
+        Returns:
+            Any -- 処理の結果
+        """
+        future = self.calls.get(key)
+        if future is None:
+            self.started += 1
+            future = asyncio.ensure_future(func())
+            self.calls[key] = future
+            future.add_done_callback(lambda _: self._remove(self.calls, key, future))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def subscribe(self, key, generator_factory):
+        """
+        同じキーのストリームが実行中の場合はそのストリームを購読し、実行中でない場合は新しくストリームを開始して購読します。
+
+        上流のストリームは購読者とは別のタスクで読み取るため、一部の購読者が途中で離脱しても他の購読者への配信は続きます。
+        すべての購読者が離脱した場合は、上流のストリームをキャンセルします。
+
+        Arguments:
+            key {Hashable} -- ストリームを識別するキー
+            generator_factory {Callable[[], AsyncIterator]} -- 上流の非同期ジェネレーターを返す関数
+
+        Returns:
+            Tuple[AsyncIterator, bool] -- 購読したストリームと、実行中のストリームを共有したかどうか
+        """
+        flight = self.streams.get(key)
+        is_shared = flight is not None
+        if is_shared:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            flight = _StreamFlight()
+            self.streams[key] = flight
+            flight.task = asyncio.ensure_future(self._run_stream(key, flight, generator_factory))
+        flight.subscribers += 1
+        return self._read_stream(flight), is_shared
+
+    def get_stats(self) -> dict:
+        """
+        処理の統計情報を取得します。
+
+        Returns:
+            dict -- 実行した処理数、共有した呼び出し数、実行中の処理数
+        """
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.calls) + len(self.streams),
+        }
+
+    async def _run_stream(self, key, flight, generator_factory):
+        """
+        上流のストリームを最後まで読み取り、値を購読者に配信します。
+        """
+        try:
+            async for item in generator_factory():
+                flight.items.append(item)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            self._remove(self.streams, key, flight)
+
+    async def _read_stream(self, flight):
+        """
+        ストリームの値を最初から順に読み取ります。上流でエラーが発生した場合は、同じ例外を発生させます。
+        """
+        index = 0
+        try:
+            while True:
+                while index < len(flight.items):
+                    yield flight.items[index]
+                    index += 1
+                if flight.done:
+                    break
+                await flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+
+    def _remove(self, flights, key, flight):
+        """
+        キーに対応する処理が指定された処理の場合のみ、キーを削除します。
+        """
+        if flights.get(key) is flight:
+            del flights[key]
+
+class _StreamFlight:
+    """
+    実行中のストリームの、配信済みの値と購読者の状態です。
+    """
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        """
+        待機中の購読者に、値が追加されたか終了したことを通知します。
+        """
+        self.changed.set()
+        self.changed = asyncio.Event()
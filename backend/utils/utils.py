@@ -3,16 +3,35 @@ from config.constant import (
     LOG_MESSAGE_EMBEDDING_FOLDER_EXIST,
     LOG_MESSAGE_EMBEDDING_FOLDER_CREATED,
     EMBEDDING_FOLDER_NAME,
+    EMBEDDING_INDEX_FILE_EXTENSIONS,
+    EMBEDDING_VERSION_FILE_NAME,
+    EMBEDDING_DELETED_IDS_FILE_NAME,
+    EMBEDDING_DELETED_IDS_LOCK_FILE_NAME,
+    MMAP_STORE_EXTENSION,
+    MMAP_META_FILE_NAME,
     EMBEDDING_MODEL_NAME,
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
     OPENAI_KEY,
     INPUT_UNIT_COST,
-    OUTPUT_UNIT_COST)
+    OUTPUT_UNIT_COST,
+    MODEL_UNIT_COSTS)
+import fcntl
+import json
 import os
+import shutil
+import threading
 import uuid
 from langchain_openai import OpenAIEmbeddings
+from utils.embeddings import CachedQueryEmbeddings, QueryEmbeddingCache
+from utils.http_clients import get_http_client, get_async_http_client
 
 backlog_gen_ai_chat_logger = logger.get_logger()
 
+# プロセス全体で共有する埋め込みモデルと、クエリのベクトルのキャッシュ
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+_query_embedding_cache = QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_MAX_ENTRIES)
+
 def get_embeddings_folder_path() -> str:
     """
     エンベディングフォルダのパスを取得します。
@@ -39,6 +58,164 @@ def get_embeddings_folder_path() -> str:
 
     return embedding_folder_path
 
+def get_embedding_index_names(embeddings_folder_path: str) -> list:
+    """
+    エンベディングフォルダ内のインデックス名の一覧を取得します。
+
+    .faissファイルと.pklファイルが両方揃っているインデックスのみを対象とするため、
+    書き込み途中のインデックスは読み込まれません。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+
+    Returns:
+        list -- インデックス名（拡張子なし）の一覧
+    """
+    file_names = set(next(os.walk(embeddings_folder_path))[2])
+    index_names = {os.path.splitext(file_name)[0] for file_name in file_names}
+    return sorted(
+        index_name for index_name in index_names
+        if all(index_name + extension in file_names for extension in EMBEDDING_INDEX_FILE_EXTENSIONS)
+    )
+
+def get_mmap_store_names(embeddings_folder_path: str) -> list:
+    """
+    エンベディングフォルダ内のメモリマップ形式のベクトルストア名（.mmapフォルダ名）の一覧を取得します。
+
+    メタ情報ファイルが存在する、書き込み完了済みのフォルダのみを対象とします。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+
+    Returns:
+        list -- ベクトルストア名（.mmapを含むフォルダ名）の一覧
+    """
+    folder_names = next(os.walk(embeddings_folder_path))[1]
+    return sorted(
+        folder_name for folder_name in folder_names
+        if folder_name.endswith(MMAP_STORE_EXTENSION)
+        and os.path.isfile(os.path.join(embeddings_folder_path, folder_name, MMAP_META_FILE_NAME))
+    )
+
+def get_embedding_index_size(embeddings_folder_path: str, index_name: str) -> int:
+    """
+    インデックスのファイルサイズ（.faissと.pklの合計、またはメモリマップ形式のフォルダ内の合計バイト数）を取得します。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        index_name {str} -- インデックス名（.faiss形式は拡張子なし、メモリマップ形式は.mmapを含むフォルダ名）
+
+    Returns:
+        int -- ファイルサイズの合計バイト数
+    """
+    if index_name.endswith(MMAP_STORE_EXTENSION):
+        mmap_store_path = os.path.join(embeddings_folder_path, index_name)
+        return sum(os.path.getsize(os.path.join(mmap_store_path, file_name)) for file_name in os.listdir(mmap_store_path))
+    return sum(
+        os.path.getsize(os.path.join(embeddings_folder_path, index_name + extension))
+        for extension in EMBEDDING_INDEX_FILE_EXTENSIONS
+    )
+
+def remove_embedding_index_files(embeddings_folder_path: str, index_name: str):
+    """
+    インデックス名に対応するインデックスファイル（.faissと.pkl、またはメモリマップ形式のフォルダ）を、存在する場合のみ削除します。
+
+    インデックス名に「_連番」を付けた、ウェーブごとに書き込んだインデックスファイルも削除します。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        index_name {str} -- インデックス名（拡張子なし）
+    """
+    for file_name in os.listdir(embeddings_folder_path):
+        base_name, extension = os.path.splitext(file_name)
+        if base_name != index_name and not base_name.startswith(index_name + '_'):
+            continue
+        if extension == MMAP_STORE_EXTENSION:
+            shutil.rmtree(os.path.join(embeddings_folder_path, file_name), ignore_errors=True)
+        elif extension in EMBEDDING_INDEX_FILE_EXTENSIONS:
+            try:
+                os.remove(os.path.join(embeddings_folder_path, file_name))
+            except FileNotFoundError:
+                pass
+
+def publish_embedding_version(embeddings_folder_path: str):
+    """
+    エンベディングフォルダのバージョンを更新し、インデックスファイルが変更されたことを他のワーカープロセスに知らせます。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+    """
+    version_file_path = os.path.join(embeddings_folder_path, EMBEDDING_VERSION_FILE_NAME)
+    temp_version_file_path = version_file_path + '.' + get_random_uuid_name()
+    with open(temp_version_file_path, 'w', encoding='utf-8') as version_file:
+        version_file.write(get_random_uuid_name())
+    os.replace(temp_version_file_path, version_file_path)
+
+def get_embedding_version(embeddings_folder_path: str):
+    """
+    エンベディングフォルダのバージョンを取得します。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+
+    Returns:
+        str -- バージョン（まだ一度も更新されていない場合はNone）
+    """
+    try:
+        with open(os.path.join(embeddings_folder_path, EMBEDDING_VERSION_FILE_NAME), encoding='utf-8') as version_file:
+            return version_file.read()
+    except FileNotFoundError:
+        return None
+
+def get_deleted_embedding_ids(embeddings_folder_path: str) -> set:
+    """
+    削除済みとして検索結果から除外するベクトルのID（ドキュメントのID）を取得します。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+
+    Returns:
+        set -- 削除済みのベクトルのIDの集合（ファイルが存在しない場合は空の集合）
+    """
+    try:
+        with open(os.path.join(embeddings_folder_path, EMBEDDING_DELETED_IDS_FILE_NAME), encoding='utf-8') as deleted_ids_file:
+            return set(json.load(deleted_ids_file))
+    except FileNotFoundError:
+        return set()
+
+def save_deleted_embedding_ids(embeddings_folder_path: str, deleted_ids):
+    """
+    削除済みのベクトルのIDを、一時ファイルに書き込んだ後にリネームしてアトミックに保存します。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        deleted_ids {Iterable[str]} -- 削除済みのベクトルのID
+    """
+    deleted_ids_file_path = os.path.join(embeddings_folder_path, EMBEDDING_DELETED_IDS_FILE_NAME)
+    temp_deleted_ids_file_path = deleted_ids_file_path + '.' + get_random_uuid_name()
+    with open(temp_deleted_ids_file_path, 'w', encoding='utf-8') as deleted_ids_file:
+        json.dump(sorted(deleted_ids), deleted_ids_file)
+    os.replace(temp_deleted_ids_file_path, deleted_ids_file_path)
+
+def update_deleted_embedding_ids(embeddings_folder_path: str, added_ids=(), removed_ids=()):
+    """
+    削除済みのベクトルのIDを追加・削除して保存します。
+
+    複数のワーカープロセス（埋め込みの作成ジョブとコンパクション）が同時に更新しても互いの変更を失わないよう、
+    ファイルロックを取得した状態で読み込みから保存までを行います。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        added_ids {Iterable[str]} -- 追加する削除済みのベクトルのID
+        removed_ids {Iterable[str]} -- 一覧から削除するID（インデックスから取り除いたベクトルのID）
+    """
+    with open(os.path.join(embeddings_folder_path, EMBEDDING_DELETED_IDS_LOCK_FILE_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            save_deleted_embedding_ids(embeddings_folder_path, (get_deleted_embedding_ids(embeddings_folder_path) | set(added_ids)) - set(removed_ids))
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def get_random_uuid_name():
     """
     ランダムなUUIDを生成して、ハイフンを削除した文字列を返します。
@@ -48,30 +225,54 @@ def get_random_uuid_name():
     """
     return str(uuid.uuid4()).replace('-', '')
 
-def get_embedding_model() -> OpenAIEmbeddings:
+def get_embedding_model() -> CachedQueryEmbeddings:
     """
-    OpenAI Embedding modelを生成して返します。
+    OpenAI Embedding modelを返します。
+
+    初回のみ生成し、以降はプロセス全体で同じクライアントを再利用します。
+    Completion APIと同じ、接続プール付きのHTTPクライアントを使用します。
+    クエリのベクトル化の結果はLRUキャッシュに保存されます。
 
     Returns:
-        OpenAIEmbeddings -- OpenAI Embedding model
+        CachedQueryEmbeddings -- クエリのベクトルをキャッシュするOpenAI Embedding model
     """
-    return OpenAIEmbeddings(
-        model=EMBEDDING_MODEL_NAME,  # OpenAIのモデル名
-        openai_api_key=OPENAI_KEY,  # OpenAIのAPIキー
-    )
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                _embedding_model = CachedQueryEmbeddings(
+                    OpenAIEmbeddings(
+                        model=EMBEDDING_MODEL_NAME,  # OpenAIのモデル名
+                        openai_api_key=OPENAI_KEY,  # OpenAIのAPIキー
+                        http_client=get_http_client(),  # 共有の接続プール付きHTTPクライアント
+                        http_async_client=get_async_http_client(),
+                    ),
+                    _query_embedding_cache)
+    return _embedding_model
+
+def get_query_embedding_cache_stats() -> dict:
+    """
+    クエリのベクトルのキャッシュのヒット数、ミス数、ヒット率、登録数を取得します。
+
+    Returns:
+        dict -- キャッシュの統計情報
+    """
+    return _query_embedding_cache.get_stats()
 
-def get_total_costs(prompt_tokens: int, completion_tokens: int) -> float:
+def get_total_costs(prompt_tokens: int, completion_tokens: int, model: str = None) -> float:
     """
     完了タスクの合計コストを計算します。
 
     パラメータ:
         prompt_tokens (int): 入力トークン数
         completion_tokens (int): 出力トークン数
+        model (str): 使用したモデル名（MODEL_UNIT_COSTSに記載のない場合は、INPUT_UNIT_COST / OUTPUT_UNIT_COSTを使用します）
 
     戻り値:
         float: 完了タスクの合計コスト
     """
     if(prompt_tokens != None and completion_tokens != None):
-        return INPUT_UNIT_COST * prompt_tokens + OUTPUT_UNIT_COST * completion_tokens
+        input_unit_cost, output_unit_cost = MODEL_UNIT_COSTS.get(model, (INPUT_UNIT_COST, OUTPUT_UNIT_COST))
+        return input_unit_cost * prompt_tokens + output_unit_cost * completion_tokens
     else:
         return 0
@@ -0,0 +1,410 @@
+from config.constant import (
+    MMAP_VECTORS_FILE_NAME,
+    MMAP_DOCUMENTS_FILE_NAME,
+    MMAP_OFFSETS_FILE_NAME,
+    MMAP_META_FILE_NAME,
+    MMAP_INDEX_FILE_NAME,
+    MMAP_STORE_EXTENSION,
+    EMBEDDING_INDEX_TYPE,
+    EMBEDDING_INDEX_TYPE_IVF,
+    EMBEDDING_INDEX_TYPE_HNSW,
+    EMBEDDING_ANN_MIN_VECTORS,
+    EMBEDDING_IVF_NLIST,
+    EMBEDDING_IVF_MIN_POINTS_PER_CENTROID,
+    EMBEDDING_IVF_NPROBE,
+    EMBEDDING_HNSW_M,
+    EMBEDDING_HNSW_EF_CONSTRUCTION,
+    EMBEDDING_HNSW_EF_SEARCH,
+    EMBEDDING_SEARCH_THREADS)
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+import faiss
+import heapq
+import itertools
+import json
+import math
+import numpy as np
+import os
+import threading
+
+# 複数のベクトルストアを並行して検索するための、プロセス全体で共有するスレッドプール
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """
+    ベクトルストアの並行検索に使用するスレッドプールを取得します。初回のみ作成します。
+
+    スレッド数はEMBEDDING_SEARCH_THREADS（0の場合はCPUコア数）です。FAISSは検索中にGILを解放するため、
+    スレッド数までのベクトルストアを同時に検索できます。
+
+    Returns:
+        ThreadPoolExecutor -- スレッドプール
+    """
+    global _search_executor
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(max_workers=EMBEDDING_SEARCH_THREADS or os.cpu_count(), thread_name_prefix='vector-search')
+    return _search_executor
+
+class BaseVectorStore(ABC):
+    """
+    similarity_search_with_score_by_vectorを実装したベクトルストアに、langchainのFAISSと同じ検索メソッドを提供する抽象基底クラスです。
+
+    スコアはFAISSのIndexFlatL2と同じくL2距離の2乗で、小さいほど類似度が高くなります。
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    @abstractmethod
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        """
+        ベクトルに類似するドキュメントをスコア付きで取得します。
+
+        Arguments:
+            embedding {List[float]} -- クエリのベクトル
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Tuple[Document, float]] -- 類似度の高い順のドキュメントとスコアのリスト
+        """
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        """
+        ベクトルに類似するドキュメントを検索します。
+
+        Arguments:
+            embedding {List[float]} -- クエリのベクトル
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Document] -- 類似度の高い順のドキュメントのリスト
+        """
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4):
+        """
+        クエリに類似するドキュメントをスコア付きで検索します。
+
+        Arguments:
+            query {str} -- クエリ
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Tuple[Document, float]] -- 類似度の高い順のドキュメントとスコアのリスト
+        """
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query, k=4):
+        """
+        クエリに類似するドキュメントを検索します。
+
+        Arguments:
+            query {str} -- クエリ
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Document] -- 類似度の高い順のドキュメントのリスト
+        """
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+class MmapVectorStore(BaseVectorStore):
+    """
+    読み取り専用のメモリマップで開くベクトルストアです。
+
+    ベクトル、ドキュメント、オフセットをファイルから直接メモリマップするため、同じファイルを開いた
+    複数のワーカープロセスで物理ページが共有されます。ドキュメントは検索でヒットしたものだけを
+    デコードするため、起動時にコーパス全体をデシリアライズする必要がありません。
+    近似最近傍（IVF / HNSW）のインデックスファイルがある場合は、それを読み込んで検索に使用します。
+    FAISSはIVFの転置リストやHNSWのグラフをメモリマップできないため、このインデックスはワーカープロセスごとにメモリに読み込まれ、共有されません。
+    """
+
+    def __init__(self, folder_path, embedding_function):
+        super().__init__(embedding_function)
+        self.folder_path = folder_path
+        self.vectors = np.load(os.path.join(folder_path, MMAP_VECTORS_FILE_NAME), mmap_mode='r')
+        self.offsets = np.load(os.path.join(folder_path, MMAP_OFFSETS_FILE_NAME), mmap_mode='r')
+        self.documents = np.memmap(os.path.join(folder_path, MMAP_DOCUMENTS_FILE_NAME), dtype=np.uint8, mode='r')
+        self.index = None
+        index_file_path = os.path.join(folder_path, MMAP_INDEX_FILE_NAME)
+        if os.path.isfile(index_file_path):
+            self.index = faiss.read_index(index_file_path)
+            set_faiss_search_parameters(self.index)
+
+    @property
+    def ntotal(self) -> int:
+        """
+        ベクトル数を取得します。
+
+        Returns:
+            int -- ベクトル数
+        """
+        return self.vectors.shape[0]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        """
+        ベクトルに類似するドキュメントをスコア付きで取得します。
+        近似最近傍のインデックスがない場合は、メモリマップしたベクトルを全件検索します。
+
+        Arguments:
+            embedding {List[float]} -- クエリのベクトル
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Tuple[Document, float]] -- 類似度の高い順のドキュメントとスコアのリスト
+        """
+        k = min(k, self.ntotal)
+        if k == 0:
+            return []
+        query = np.array([embedding], dtype=np.float32)
+        if self.index is not None:
+            distances, positions = self.index.search(query, k)
+        else:
+            distances, positions = faiss.knn(query, self.vectors, k)
+        return [(self.get_document(int(position)), float(distance)) for distance, position in zip(distances[0], positions[0]) if position != -1]
+
+    def get_record(self, position: int) -> dict:
+        """
+        指定された位置のドキュメントのレコード（id, page_content, metadata）を取得します。
+
+        Arguments:
+            position {int} -- ベクトルの位置
+
+        Returns:
+            dict -- ドキュメントのレコード
+        """
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return json.loads(self.documents[start:end].tobytes().decode('utf-8'))
+
+    def get_document(self, position: int) -> Document:
+        """
+        指定された位置のドキュメントを取得します。
+
+        Arguments:
+            position {int} -- ベクトルの位置
+
+        Returns:
+            Document -- ドキュメント
+        """
+        record = self.get_record(position)
+        return Document(page_content=record['page_content'], metadata=record['metadata'])
+
+class MultiVectorStore(BaseVectorStore):
+    """
+    複数のベクトルストア（シャード）をまとめて検索するベクトルストアです。
+
+    クエリのベクトル化は1回だけ行い、各ベクトルストアをスレッドプールで並行して検索します。
+    スコア順に並んだ各ベクトルストアの上位k件をヒープでk-wayマージし、全体の上位k件を返します。
+    """
+
+    def __init__(self, vector_stores, embedding_function):
+        super().__init__(embedding_function)
+        self.vector_stores = vector_stores
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        """
+        各ベクトルストアを並行して検索し、全体でスコアの小さい順に上位k件を取得します。
+
+        Arguments:
+            embedding {List[float]} -- クエリのベクトル
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Tuple[Document, float]] -- 類似度の高い順のドキュメントとスコアのリスト
+        """
+        if len(self.vector_stores) == 1:
+            return self.vector_stores[0].similarity_search_with_score_by_vector(embedding, k)
+        futures = [
+            get_search_executor().submit(vector_store.similarity_search_with_score_by_vector, embedding, k)
+            for vector_store in self.vector_stores
+        ]
+        results = [future.result() for future in futures]
+        return list(itertools.islice(heapq.merge(*results, key=lambda result: result[1]), k))
+
+class FilteredVectorStore(BaseVectorStore):
+    """
+    削除済みのベクトルを検索結果から除外するベクトルストアです。
+
+    削除済みのベクトルの数だけ多く検索してから除外するため、除外後もk件を返します。
+    削除済みのベクトルはコンパクション時にインデックスから取り除かれます。
+    """
+
+    def __init__(self, vector_store, deleted_ids, embedding_function):
+        super().__init__(embedding_function)
+        self.vector_store = vector_store
+        self.deleted_ids = deleted_ids
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        """
+        ベクトルストアを検索し、削除済みのベクトルを除いた上位k件を取得します。
+
+        Arguments:
+            embedding {List[float]} -- クエリのベクトル
+            k {int} -- 取得するドキュメント数
+
+        Returns:
+            List[Tuple[Document, float]] -- 類似度の高い順のドキュメントとスコアのリスト
+        """
+        results = self.vector_store.similarity_search_with_score_by_vector(embedding, k + len(self.deleted_ids))
+        return [result for result in results if result[0].metadata.get('EmbeddingId') not in self.deleted_ids][:k]
+
+def remove_faiss_deleted_ids(vector_store, deleted_ids) -> set:
+    """
+    langchainのFAISSベクトルストアから、削除済みのベクトルをremove_idsで取り除きます。
+
+    Arguments:
+        vector_store {FAISS} -- FAISSベクトルストア（全件検索のインデックス）
+        deleted_ids {set} -- 削除済みのベクトルのID
+
+    Returns:
+        set -- 取り除いたベクトルのID
+    """
+    removed_ids = {docstore_id for docstore_id in vector_store.index_to_docstore_id.values() if docstore_id in deleted_ids}
+    if removed_ids:
+        vector_store.delete(list(removed_ids))
+    return removed_ids
+
+def save_mmap_vector_store(folder_path, vectors, records, index=None):
+    """
+    メモリマップで開ける形式でベクトルストアを保存します。
+
+    メタ情報ファイルを最後に書き込むため、メタ情報ファイルが存在するフォルダのみが書き込み完了済みです。
+
+    Arguments:
+        folder_path {str} -- 保存先のフォルダのパス
+        vectors {numpy.ndarray} -- ベクトルの配列 (ベクトル数, 次元数)
+        records {List[dict]} -- ベクトルと同じ順序のドキュメントのレコード（id, page_content, metadata）
+        index {faiss.Index} -- 近似最近傍のインデックス（全件検索のIndexFlatの場合は保存しない）
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    np.save(os.path.join(folder_path, MMAP_VECTORS_FILE_NAME), vectors)
+
+    offsets = [0]
+    with open(os.path.join(folder_path, MMAP_DOCUMENTS_FILE_NAME), 'wb') as documents_file:
+        for record in records:
+            encoded_record = json.dumps(record, ensure_ascii=False).encode('utf-8')
+            documents_file.write(encoded_record)
+            offsets.append(offsets[-1] + len(encoded_record))
+    np.save(os.path.join(folder_path, MMAP_OFFSETS_FILE_NAME), np.array(offsets, dtype=np.int64))
+
+    if index is not None and not isinstance(index, faiss.IndexFlat):
+        faiss.write_index(index, os.path.join(folder_path, MMAP_INDEX_FILE_NAME))
+
+    with open(os.path.join(folder_path, MMAP_META_FILE_NAME), 'w', encoding='utf-8') as meta_file:
+        json.dump({'count': vectors.shape[0], 'dimension': vectors.shape[1]}, meta_file)
+
+def get_faiss_vectors_and_records(vector_store):
+    """
+    langchainのFAISSベクトルストアから、ベクトルとドキュメントのレコードを取り出します。
+
+    Arguments:
+        vector_store {FAISS} -- FAISSベクトルストア
+
+    Returns:
+        Tuple[numpy.ndarray, List[dict]] -- ベクトルの配列とドキュメントのレコードのリスト
+    """
+    if isinstance(vector_store.index, faiss.IndexIVF):
+        vector_store.index.make_direct_map()
+    vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+    records = []
+    for position in range(vector_store.index.ntotal):
+        docstore_id = vector_store.index_to_docstore_id[position]
+        document = vector_store.docstore.search(docstore_id)
+        records.append({'id': docstore_id, 'page_content': document.page_content, 'metadata': document.metadata})
+    return vectors, records
+
+def get_mmap_vectors_and_records(vector_store):
+    """
+    MmapVectorStoreから、ベクトルとドキュメントのレコードを取り出します。
+
+    Arguments:
+        vector_store {MmapVectorStore} -- メモリマップのベクトルストア
+
+    Returns:
+        Tuple[numpy.ndarray, List[dict]] -- ベクトルの配列とドキュメントのレコードのリスト
+    """
+    return np.asarray(vector_store.vectors), [vector_store.get_record(position) for position in range(vector_store.ntotal)]
+
+def load_vectors_and_records(embeddings_folder_path, index_name, embedding_model):
+    """
+    エンベディングフォルダ内のインデックス（FAISSまたはメモリマップ形式）から、ベクトルとドキュメントのレコードを取り出します。
+
+    Arguments:
+        embeddings_folder_path {str} -- エンベディングフォルダのパス
+        index_name {str} -- インデックス名（.faiss形式は拡張子なし、メモリマップ形式は.mmapを含むフォルダ名）
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+
+    Returns:
+        Tuple[numpy.ndarray, List[dict]] -- ベクトルの配列とドキュメントのレコードのリスト
+    """
+    if index_name.endswith(MMAP_STORE_EXTENSION):
+        return get_mmap_vectors_and_records(MmapVectorStore(os.path.join(embeddings_folder_path, index_name), embedding_model))
+    return get_faiss_vectors_and_records(FAISS.load_local(folder_path=embeddings_folder_path, index_name=index_name, embeddings=embedding_model, allow_dangerous_deserialization=True))
+
+def save_faiss_vector_store(folder_path, index_name, index, records, embedding_model):
+    """
+    FAISSのインデックスとドキュメントのレコードを、langchainのFAISS形式（.faissと.pkl）で保存します。
+
+    Arguments:
+        folder_path {str} -- 保存先のフォルダのパス
+        index_name {str} -- インデックス名
+        index {faiss.Index} -- レコードと同じ順序でベクトルを追加したインデックス
+        records {List[dict]} -- ドキュメントのレコード（id, page_content, metadata）
+        embedding_model {OpenAIEmbeddings} -- 埋め込みモデル
+    """
+    docstore = InMemoryDocstore({record['id']: Document(page_content=record['page_content'], metadata=record['metadata']) for record in records})
+    index_to_docstore_id = {position: record['id'] for position, record in enumerate(records)}
+    FAISS(embedding_model, index, docstore, index_to_docstore_id).save_local(folder_path=folder_path, index_name=index_name)
+
+def build_faiss_index(vectors, index_type=None, min_vectors=None):
+    """
+    指定された種類のFAISSインデックスを作成し、ベクトルを追加します。
+
+    IVFはベクトル全体でクラスタを学習し、HNSWはグラフを構築します。ベクトル数がmin_vectors未満の場合は、
+    近似最近傍の効果がないため全件検索のIndexFlatL2を作成します。
+
+    Arguments:
+        vectors {numpy.ndarray} -- ベクトルの配列 (ベクトル数, 次元数)
+        index_type {str} -- インデックスの種類（flat, ivf, hnsw）。省略時はEMBEDDING_INDEX_TYPE
+        min_vectors {int} -- 近似最近傍のインデックスを作成する最小ベクトル数。省略時はEMBEDDING_ANN_MIN_VECTORS
+
+    Returns:
+        faiss.Index -- ベクトルを追加したインデックス
+    """
+    index_type = index_type or EMBEDDING_INDEX_TYPE
+    min_vectors = EMBEDDING_ANN_MIN_VECTORS if min_vectors is None else min_vectors
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+    if index_type == EMBEDDING_INDEX_TYPE_IVF and count >= min_vectors:
+        nlist = EMBEDDING_IVF_NLIST or int(4 * math.sqrt(count))
+        nlist = max(1, min(nlist, count // EMBEDDING_IVF_MIN_POINTS_PER_CENTROID))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+        index.train(vectors)
+    elif index_type == EMBEDDING_INDEX_TYPE_HNSW and count >= min_vectors:
+        index = faiss.IndexHNSWFlat(dimension, EMBEDDING_HNSW_M)
+        index.hnsw.efConstruction = EMBEDDING_HNSW_EF_CONSTRUCTION
+    else:
+        index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    set_faiss_search_parameters(index)
+    return index
+
+def set_faiss_search_parameters(index, nprobe=None, ef_search=None):
+    """
+    近似最近傍のインデックスに検索パラメータ（IVFのnprobe、HNSWのefSearch）を設定します。
+
+    Arguments:
+        index {faiss.Index} -- インデックス
+        nprobe {int} -- IVFで検索するクラスタ数。省略時はEMBEDDING_IVF_NPROBE
+        ef_search {int} -- HNSWの検索時の候補数。省略時はEMBEDDING_HNSW_EF_SEARCH
+    """
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe or EMBEDDING_IVF_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or EMBEDDING_HNSW_EF_SEARCH